@@ -0,0 +1,230 @@
+"""JWT authentication that resolves the user from a cache instead of the database.
+
+simplejwt's `JWTAuthentication` loads the `User` row on every authenticated
+request. `CachedJWTAuthentication` looks it up in two tiers first:
+
+- a per-process LRU (AUTH_USER_LOCAL_SIZE users) that keeps an entry for
+  AUTH_USER_LOCAL_SECONDS, so a busy client costs no round trip at all;
+- the Django cache (`auth:user:<id>`, AUTH_USER_CACHE_SECONDS), shared by
+  every worker when USE_REDIS is set. One `get_many` also reads the user's
+  revocation marker (below).
+
+Entries hold the user's concrete fields except the password hash. The user
+is rebuilt with `password` deferred, so saving it never writes a stale hash.
+accounts/signals.py drops the shared entry whenever a user is saved or
+deleted; other workers' local copies may lag by up to
+AUTH_USER_LOCAL_SECONDS. Queryset `update()`s bypass the signals and should
+call `invalidate_users()`.
+
+A password change, a deactivation or a change of `is_staff`/`is_superuser`
+also writes a revocation marker (`auth:revoked:<id>`, kept for the refresh
+token lifetime): tokens issued before it are refused, including access
+tokens refreshed from an older refresh token. With AUTH_TOKEN_USER_CLAIMS
+tokens also carry `is_staff` and `is_active`, and a user who is not cached
+is built from those claims without a query (other fields load on first
+access); the marker is what keeps the claims honest. If the marker is lost
+(evicted by an LRU policy, or the cache is flushed) a deactivated or demoted
+user keeps the access the claims grant until the refresh token expires, so
+claims mode needs a shared cache that does not evict these keys (Redis with
+`noeviction` or `volatile-*` policy and enough memory). It refuses to run on a
+per-process cache.
+
+The cache is only used with AUTH_USER_CACHE_ENABLED (default: USE_REDIS);
+with per-worker LocMemCache an invalidation would not reach other workers.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from nexus.metrics import record_cache
+from nexus.throttling import shares_counters
+
+# claims added to tokens with AUTH_TOKEN_USER_CLAIMS
+CLAIMS = ('is_staff', 'is_active')
+MISS = object()
+
+
+def enabled():
+    return getattr(settings, 'AUTH_USER_CACHE_ENABLED', False)
+
+
+def claims_enabled():
+    """Whether uncached users are built from token claims (AUTH_TOKEN_USER_CLAIMS)."""
+    if not getattr(settings, 'AUTH_TOKEN_USER_CLAIMS', False):
+        return False
+    if not shares_counters():
+        # a revocation written by one worker would never reach the others
+        raise ImproperlyConfigured(
+            'AUTH_TOKEN_USER_CLAIMS needs a shared cache (Redis or memcached) for its revocation markers; '
+            f"{settings.CACHES['default']['BACKEND']} is not one.")
+    return True
+
+
+def user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def revoked_key(user_id):
+    return f'auth:revoked:{user_id}'
+
+
+class LocalCache:
+    """A thread-safe LRU of at most `size` entries, each kept for `ttl` seconds."""
+
+    def __init__(self, size=4096, ttl=5.0):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.pid = os.getpid()
+
+    def get(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.pid != os.getpid():
+                # a forked worker starts without its parent's entries
+                self.entries, self.pid = OrderedDict(), os.getpid()
+            item = self.entries.get(key)
+            if item is None:
+                return MISS
+            if item[0] <= now:
+                del self.entries[key]
+                return MISS
+            self.entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.entries[key] = (now + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def get_local():
+    """This process's user LRU (built on first use)."""
+    global _local
+    if _local is None:
+        with _local_lock:
+            if _local is None:
+                _local = LocalCache(size=getattr(settings, 'AUTH_USER_LOCAL_SIZE', 4096),
+                                    ttl=getattr(settings, 'AUTH_USER_LOCAL_SECONDS', 5.0))
+    return _local
+
+
+def reset_local():
+    global _local
+    with _local_lock:
+        _local = None
+
+
+def cached_fields(user):
+    """The loaded concrete fields of `user`, without the password hash."""
+    return {f.attname: user.__dict__[f.attname] for f in user._meta.concrete_fields
+            if f.attname != 'password' and f.attname in user.__dict__}
+
+
+def build_user(fields):
+    """A `User` as if loaded from the database with only `fields` (the rest deferred)."""
+    model = get_user_model()
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in fields]
+    return model.from_db(router.db_for_read(model), names, [fields[name] for name in names])
+
+
+def lookup(user_id):
+    """`(fields or None, revoked_at or None)` for `user_id` from the local then the shared cache."""
+    local = get_local()
+    entry = local.get(user_id)
+    if entry is not MISS:
+        record_cache('auth:user', True)
+        return entry
+    keys = user_key(user_id), revoked_key(user_id)
+    found = cache.get_many(keys)
+    entry = found.get(keys[0]), found.get(keys[1])
+    record_cache('auth:user', entry[0] is not None)
+    local.set(user_id, entry)
+    return entry
+
+
+def load(user_id, revoked_at=None):
+    """Read `user_id` from the database and cache its fields in both tiers."""
+    model = get_user_model()
+    try:
+        user = model.objects.defer('password').get(**{api_settings.USER_ID_FIELD: user_id})
+    except model.DoesNotExist:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+    fields = cached_fields(user)
+    cache.set(user_key(user_id), fields, getattr(settings, 'AUTH_USER_CACHE_SECONDS', 300))
+    get_local().set(user_id, (fields, revoked_at))
+    return fields
+
+
+def invalidate_users(user_ids, revoke=False):
+    """Drop the cached entries of `user_ids`; `revoke` also refuses their tokens issued until now."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    cache.delete_many([user_key(user_id) for user_id in user_ids])
+    if revoke:
+        # refresh tokens outlive access tokens and mint new ones with their own iat
+        ttl = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+        cache.set_many({revoked_key(user_id): time.time() for user_id in user_ids}, ttl)
+    local = get_local()
+    for user_id in user_ids:
+        local.discard(user_id)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """`JWTAuthentication` that reads the user from the user cache."""
+
+    def get_user(self, validated_token):
+        if not enabled():
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        fields, revoked_at = lookup(user_id)
+        # iat has whole seconds: a token issued in the second of the change still passes
+        if revoked_at is not None and validated_token.get('iat', 0) < int(revoked_at):
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+        if fields is None and claims_enabled() and all(claim in validated_token for claim in CLAIMS):
+            fields = {api_settings.USER_ID_FIELD: user_id, **{claim: validated_token[claim] for claim in CLAIMS}}
+        elif fields is None:
+            fields = load(user_id, revoked_at)
+        user = build_user(fields)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    # drf-spectacular matches authentication extensions by exact class
+    target_class = CachedJWTAuthentication
@@ -0,0 +1,65 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts import outbox
+
+logger = logging.getLogger(__name__)
+
+# longest pause after repeated errors in --loop mode
+MAX_ERROR_BACKOFF_SECONDS = 60
+# backends that mark emails sent without delivering them
+UNDELIVERED_BACKENDS = (
+    'django.core.mail.backends.console.EmailBackend',
+    'django.core.mail.backends.dummy.EmailBackend',
+    'django.core.mail.backends.filebased.EmailBackend',
+    'django.core.mail.backends.locmem.EmailBackend',
+)
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox emails in batches over one connection each (see accounts/outbox.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Emails per batch (defaults to OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new emails instead of exiting')
+        parser.add_argument('--interval', type=float,
+                            help='Seconds between polls of an empty outbox (defaults to OUTBOX_POLL_SECONDS)')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is None:
+            interval = getattr(settings, 'OUTBOX_POLL_SECONDS', 2.0)
+        if options['loop'] and not settings.DEBUG and settings.EMAIL_BACKEND in UNDELIVERED_BACKENDS:
+            logger.warning('EMAIL_BACKEND is %s: queued emails will be marked sent without being delivered.',
+                           settings.EMAIL_BACKEND)
+        total_sent = total_failed = errors = 0
+        while True:
+            try:
+                sent, failed = outbox.deliver(options['batch_size'])
+                if not (sent or failed):
+                    outbox.purge()
+            except Exception:
+                if not options['loop']:
+                    raise
+                # a dropped connection or a locked SQLite database must not end the worker
+                errors += 1
+                # at least a second, so --interval 0 does not spin on a failing database
+                pause = min(max(interval, 1) * 2 ** errors, MAX_ERROR_BACKOFF_SECONDS)
+                logger.exception('Outbox delivery failed; retrying in %.0fs', pause)
+                close_old_connections()
+                time.sleep(pause)
+                continue
+            errors = 0
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(interval)
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails ({total_failed} failed attempts).'))
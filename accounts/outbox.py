@@ -0,0 +1,140 @@
+"""Outgoing email, queued by requests and sent by a worker.
+
+Views call `enqueue()`, which only inserts an `OutboxEmail` row, so a slow
+or unreachable mail server never holds up a request. The `send_outbox`
+command (`--loop` to keep polling) sends them:
+
+- due rows are claimed OUTBOX_BATCH_SIZE at a time by pushing their
+  `next_attempt_at` OUTBOX_CLAIM_SECONDS ahead, so a worker that dies
+  mid-batch leaves them to be picked up again. On PostgreSQL the claim skips
+  rows locked by another worker (SKIP LOCKED); elsewhere run one worker.
+- a batch goes out over one connection from EMAIL_BACKEND instead of one
+  per message.
+- a failed message is retried after OUTBOX_RETRY_SECONDS, doubling with
+  each attempt up to OUTBOX_MAX_RETRY_SECONDS, and marked `failed` after
+  OUTBOX_MAX_ATTEMPTS. A failure also reopens the connection for the rest of
+  the batch; if that fails too, the rest of the batch is retried later.
+
+The bodies carry live password-reset and verification links, so they are
+cleared as soon as a row is sent or marked `failed`; only the subject and
+recipients stay until sent rows are deleted after OUTBOX_KEEP_SENT_DAYS.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(subject, body, to, html_body='', from_email=None):
+    """Queue an email for the `send_outbox` worker."""
+    return OutboxEmail.objects.create(subject=subject, body=body, html_body=html_body or '',
+                                      from_email=from_email or '', to=list(to))
+
+
+def message(row):
+    """The `EmailMultiAlternatives` for an outbox row."""
+    msg = EmailMultiAlternatives(subject=row.subject, body=row.body,
+                                 from_email=row.from_email or None, to=row.to)
+    if row.html_body:
+        msg.attach_alternative(row.html_body, 'text/html')
+    return msg
+
+
+def retry_delay(attempts):
+    """Seconds to wait before attempt number `attempts + 1`."""
+    base = _setting('OUTBOX_RETRY_SECONDS', 30)
+    return min(base * 2 ** max(attempts - 1, 0), _setting('OUTBOX_MAX_RETRY_SECONDS', 3600))
+
+
+def claim(batch_size, now):
+    """Claim up to `batch_size` due rows for this worker."""
+    with transaction.atomic():
+        due = OutboxEmail.objects.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at', 'pk')
+        if connections[due.db].features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        rows = list(due[:batch_size])
+        if rows:
+            OutboxEmail.objects.filter(pk__in=[row.pk for row in rows]).update(
+                next_attempt_at=now + timedelta(seconds=_setting('OUTBOX_CLAIM_SECONDS', 300)))
+    return rows
+
+
+def send_batch(rows, connection):
+    """Send `rows` over the open `connection`; returns `(sent rows, [(row, error), ...])`."""
+    sent, failed = [], []
+    for i, row in enumerate(rows):
+        try:
+            connection.send_messages([message(row)])
+        except Exception as exc:
+            failed.append((row, exc))
+            # the connection may be unusable after an error
+            try:
+                connection.close()
+                connection.open()
+            except Exception as exc:
+                failed.extend((later, exc) for later in rows[i + 1:])
+                break
+        else:
+            sent.append(row)
+    return sent, failed
+
+
+def record(sent, failed, now):
+    """Store the outcome of a batch: one update for the sent rows, one per failure.
+
+    Rows that are done (sent, or failed for good) lose their bodies.
+    """
+    if sent:
+        OutboxEmail.objects.filter(pk__in=[row.pk for row in sent]).update(
+            status='sent', sent_at=now, attempts=F('attempts') + 1, last_error='', body='', html_body='')
+    max_attempts = _setting('OUTBOX_MAX_ATTEMPTS', 5)
+    for row, exc in failed:
+        attempts = row.attempts + 1
+        logger.warning('Sending outbox email %s failed (attempt %s): %s', row.pk, attempts, exc)
+        done = attempts >= max_attempts
+        OutboxEmail.objects.filter(pk=row.pk).update(
+            attempts=attempts, last_error=repr(exc)[:2000],
+            status='failed' if done else 'pending',
+            next_attempt_at=now + timedelta(seconds=retry_delay(attempts)),
+            **({'body': '', 'html_body': ''} if done else {}))
+
+
+def deliver(batch_size=None, now=None):
+    """Send one batch of due emails; returns `(sent, failed)` counts."""
+    now = now or timezone.now()
+    rows = claim(batch_size or _setting('OUTBOX_BATCH_SIZE', 50), now)
+    if not rows:
+        return 0, 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        sent, failed = [], [(row, exc) for row in rows]
+    else:
+        try:
+            sent, failed = send_batch(rows, connection)
+        finally:
+            try:
+                connection.close()
+            except Exception:
+                pass
+    record(sent, failed, now)
+    return len(sent), len(failed)
+
+
+def purge(now=None):
+    """Delete sent rows older than OUTBOX_KEEP_SENT_DAYS."""
+    cutoff = (now or timezone.now()) - timedelta(days=_setting('OUTBOX_KEEP_SENT_DAYS', 7))
+    return OutboxEmail.objects.filter(status='sent', sent_at__lt=cutoff).delete()[0]
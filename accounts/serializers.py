@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from .authentication import CLAIMS
 
 User = get_user_model()
 
@@ -30,3 +34,15 @@ class SetNewPasswordSerializer(serializers.Serializer):
     def validate_new_password(self, value):
         # add password validation hooks here if needed
         return value
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds `is_staff`/`is_active` claims with AUTH_TOKEN_USER_CLAIMS (see accounts/authentication.py)."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        if getattr(settings, 'AUTH_TOKEN_USER_CLAIMS', False):
+            for claim in CLAIMS:
+                token[claim] = getattr(user, claim)
+        return token
@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+
+from . import authentication
+
+User = get_user_model()
+
+# fields whose change refuses the user's existing tokens (accounts/authentication.py)
+REVOKING_FIELDS = ('password', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _revoking_state(instance):
+    # read from __dict__ to avoid loading a deferred field
+    return {name: instance.__dict__[name] for name in REVOKING_FIELDS if name in instance.__dict__}
+
+
+def revokes_tokens(before, after):
+    """Whether going from state `before` to `after` should refuse tokens issued so far."""
+    for name, value in after.items():
+        if name in before and before[name] == value:
+            continue
+        if name == 'is_active' and value:
+            # activation grants nothing existing tokens did not have
+            continue
+        return True
+    return False
+
+
+def _invalidate(user_id, revoke=False):
+    # Best-effort: do not raise in signal handlers.
+    try:
+        authentication.invalidate_users([user_id], revoke=revoke)
+    except Exception:
+        pass
+
+
+@receiver(post_init, sender=User)
+def remember_loaded_credentials(sender, instance, **kwargs):
+    instance._revoking_state = _revoking_state(instance)
+
+
+@receiver(post_save, sender=User)
+def clear_user_cache_on_save(sender, instance, created=False, raw=False, **kwargs):
+    """Drop the cached user; a password change, deactivation or role change also revokes tokens."""
+    if raw or not authentication.enabled():
+        return
+    state = _revoking_state(instance)
+    revoke = not created and revokes_tokens(getattr(instance, '_revoking_state', {}), state)
+    instance._revoking_state = state
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    _invalidate(user_id, revoke)
+    # and again once committed, in case a request cached the old row meanwhile
+    transaction.on_commit(lambda: _invalidate(user_id), using=kwargs.get('using'))
+
+
+@receiver(post_delete, sender=User)
+def clear_user_cache_on_delete(sender, instance, **kwargs):
+    if authentication.enabled():
+        _invalidate(getattr(instance, api_settings.USER_ID_FIELD))
@@ -4,14 +4,13 @@ from drf_spectacular.utils import extend_schema
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.core.mail import send_mail, EmailMultiAlternatives
 from django.conf import settings
 from django.template.loader import render_to_string
-from .serializers import UserSerializer, PasswordResetRequestSerializer, SetNewPasswordSerializer
+from . import outbox
+from .serializers import UserSerializer, PasswordResetRequestSerializer, SetNewPasswordSerializer, ClaimsTokenObtainPairSerializer
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 User = get_user_model()
 
@@ -33,12 +32,8 @@ class RegisterView(generics.CreateAPIView):
         from_email = settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else None
         text_body = render_to_string('accounts/verify_email.txt', context)
         html_body = render_to_string('accounts/verify_email.html', context)
-        msg = EmailMultiAlternatives(subject=subject, body=text_body, from_email=from_email, to=[user.email])
-        msg.attach_alternative(html_body, 'text/html')
-        try:
-            msg.send(fail_silently=False)
-        except Exception:
-            pass
+        # sent by the send_outbox worker, not in the request
+        outbox.enqueue(subject, text_body, [user.email], html_body=html_body, from_email=from_email)
 
 
 class VerifyEmailView(generics.GenericAPIView):
@@ -88,14 +83,8 @@ class PasswordResetRequestView(generics.GenericAPIView):
         text_body = render_to_string('accounts/password_reset_email.txt', context)
         html_body = render_to_string('accounts/password_reset_email.html', context)
 
-        # Send multi-part email
-        msg = EmailMultiAlternatives(subject=subject, body=text_body, from_email=from_email, to=[email])
-        msg.attach_alternative(html_body, 'text/html')
-        try:
-            msg.send(fail_silently=False)
-        except Exception:
-            # fallback: don't raise; keep response generic
-            pass
+        # Queue the multi-part email for the send_outbox worker
+        outbox.enqueue(subject, text_body, [email], html_body=html_body, from_email=from_email)
         return Response({'detail': 'If an account with that email exists, you will receive reset instructions.'}, status=status.HTTP_200_OK)
 
 
@@ -123,7 +112,7 @@ class PasswordResetConfirmView(generics.GenericAPIView):
 
 class LockoutTokenObtainPairView(TokenObtainPairView):
     """Wrap TokenObtainPairView to track failed attempts and lockout via cache."""
-    serializer_class = TokenObtainPairSerializer
+    serializer_class = ClaimsTokenObtainPairSerializer
 
     def post(self, request, *args, **kwargs):
         identifier = request.data.get('username') or request.data.get('email') or request.data.get('username')
@@ -1,6 +1,14 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from .models import Category, Product, ProductImage, ProductVariant
+from .renditions import thumbnail_url
+
+
+def _thumbnail(field_file, renditions):
+    # the smallest rendition when there is one, else the original upload
+    url = thumbnail_url(renditions, field_file.name, field_file.storage) or field_file.url
+    return format_html('<img src="{}" style="max-height:60px; max-width:100px; object-fit:cover;" />', url)
+
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -14,17 +22,23 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ('category',)
     search_fields = ('name', 'description')
     readonly_fields = ('image_tag',)
+    list_select_related = ('category',)
+
+    def get_queryset(self, request):
+        # image_tag reads the first image of every row in the changelist
+        return super().get_queryset(request).prefetch_related('images')
 
     def image_tag(self, obj):
-        # Prefer the first ProductImage (if present) so list view shows images
+        # Prefer the first ProductImage (if present) so list view shows images;
+        # images are ordered, so first() slices the prefetched list
         try:
             first = obj.images.all().first()
         except Exception:
             first = None
         if first and getattr(first, 'image', None):
-            return format_html('<img src="{}" style="max-height:60px; max-width:100px; object-fit:cover;" />', first.image.url)
+            return _thumbnail(first.image, first.renditions)
         if getattr(obj, 'image', None):
-            return format_html('<img src="{}" style="max-height:60px; max-width:100px; object-fit:cover;" />', obj.image.url)
+            return _thumbnail(obj.image, obj.image_renditions)
         return ''
 
     image_tag.short_description = 'Image'
@@ -40,7 +54,7 @@ class ProductImageInline(admin.TabularInline):
 
     def image_tag(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height:60px; max-width:100px; object-fit:cover;" />', obj.image.url)
+            return _thumbnail(obj.image, obj.renditions)
         return ''
 
     image_tag.short_description = 'Image'
@@ -54,11 +68,12 @@ ProductAdmin.inlines = (ProductImageInline,)
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
     list_display = ('id', 'product', 'image_tag', 'alt', 'order')
+    list_select_related = ('product',)
     readonly_fields = ('image_tag',)
 
     def image_tag(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height:60px; max-width:100px; object-fit:cover;" />', obj.image.url)
+            return _thumbnail(obj.image, obj.renditions)
         return ''
 
     image_tag.short_description = 'Image'
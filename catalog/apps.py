@@ -5,5 +5,9 @@ class CatalogConfig(AppConfig):
     name = 'catalog'
 
     def ready(self):
-        # Import signal handlers to register them at app ready time
-        from . import signals  # noqa: F401
+        # Connect signal handlers at app ready time. Order matters where they
+        # share a signal: documents are rebuilt before the columnar snapshot
+        # reads their timestamps.
+        from . import attributes, bm25, columnar, counts, documents, renditions, signals
+        for module in (signals, counts, documents, bm25, columnar, renditions, attributes):
+            module.connect_signals()
@@ -0,0 +1,228 @@
+"""Product list filters and facets on variant attributes (`?attr_size=M&attr_color=red,blue`).
+
+A product matches when one of its variants has every requested attribute
+with one of the listed values: `attr_size=M&attr_color=red` finds products
+sold in M *and* red, not ones with an M variant in blue and an L in red.
+
+On PostgreSQL `ProductVariant.attributes` is `jsonb`; each value becomes a
+containment test (`attributes @> '{"size": "M"}'`) served by the GIN
+`jsonb_path_ops` index from migration 0015. Other databases cannot index
+JSON, so there every attribute of a variant is also stored as a
+`VariantAttribute` row (synced by the receivers below) indexed on
+(name, value). The columnar snapshot (catalog/columnar.py) keeps its own
+copy for facet counts.
+
+Values compare as text: strings as they are, numbers and booleans in their
+JSON spelling (`32`, `true`). Nested objects and lists are not filterable.
+"""
+import json
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Exists, OuterRef, Q
+from django.db.models.signals import post_save
+
+from .models import ProductVariant, VariantAttribute
+from .signals import products_bulk_changed
+
+PARAM_PREFIX = 'attr_'
+_NAME = re.compile(r'^[\w-]{1,64}$')
+MAX_VALUE_LENGTH = 255
+# values listed per attribute in the facet block
+MAX_FACET_VALUES = 50
+
+
+def uses_jsonb(using):
+    return connections[using].vendor == 'postgresql'
+
+
+def text_value(value):
+    """The text an attribute value is filtered and counted by, or None if it is not filterable."""
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    text = value if isinstance(value, str) else json.dumps(value)
+    return text if len(text) <= MAX_VALUE_LENGTH else None
+
+
+def attribute_params(params):
+    """The `attr_<name>` keys present in `params`."""
+    return [key for key in params if key.startswith(PARAM_PREFIX)]
+
+
+def parse_attribute_params(params):
+    """`{name: [values]}` from `attr_<name>=v1,v2` query params; malformed names are ignored."""
+    selected = {}
+    for key in attribute_params(params):
+        name = key[len(PARAM_PREFIX):]
+        if not _NAME.match(name):
+            continue
+        raw = params.getlist(key) if hasattr(params, 'getlist') else [params[key]]
+        values = {value.strip() for item in raw for value in str(item).split(',') if value.strip()}
+        if values:
+            selected[name] = sorted(values)
+    return selected
+
+
+def _json_candidates(text):
+    # `attr_waist=32` matches both {"waist": "32"} and {"waist": 32}
+    candidates = [text]
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return candidates
+    if isinstance(parsed, (int, float, bool)):
+        candidates.append(parsed)
+    return candidates
+
+
+def matching_variants(variants, selected):
+    """Variants in `variants` matching every `{name: [values]}` condition."""
+    if uses_jsonb(variants.db):
+        for name, values in selected.items():
+            alternatives = Q()
+            for value in values:
+                for candidate in _json_candidates(value):
+                    alternatives |= Q(attributes__contains={name: candidate})
+            variants = variants.filter(alternatives)
+    else:
+        for name, values in selected.items():
+            variants = variants.filter(Exists(
+                VariantAttribute.objects.filter(variant=OuterRef('pk'), name=name, value__in=values)))
+    return variants
+
+
+def filter_by_attributes(queryset, selected):
+    """Products in `queryset` with a variant matching every `{name: [values]}` condition."""
+    if not selected:
+        return queryset
+    variants = ProductVariant.objects.using(queryset.db).filter(product=OuterRef('pk'))
+    return queryset.filter(Exists(matching_variants(variants, selected)))
+
+
+def attribute_rows(variant):
+    """`VariantAttribute` rows (unsaved) for `variant.attributes`."""
+    attributes = variant.attributes if isinstance(variant.attributes, dict) else {}
+    rows = []
+    for name, value in attributes.items():
+        text = text_value(value)
+        if text is not None and len(name) <= 64:
+            rows.append(VariantAttribute(variant_id=variant.pk, product_id=variant.product_id, name=name, value=text))
+    return rows
+
+
+def sync_variant_attributes(variants, using='default'):
+    """Replace the `VariantAttribute` rows of `variants` (no-op on PostgreSQL)."""
+    if uses_jsonb(using):
+        return
+    variants = list(variants)
+    if not variants:
+        return
+    VariantAttribute.objects.using(using).filter(variant_id__in=[v.pk for v in variants]).delete()
+    VariantAttribute.objects.using(using).bulk_create([row for v in variants for row in attribute_rows(v)])
+
+
+def sync_product_attributes(product_ids, using='default'):
+    """Resync the attribute rows of every variant of `product_ids` (bulk write paths)."""
+    if uses_jsonb(using) or not product_ids:
+        return
+    variants = ProductVariant.objects.using(using).filter(product_id__in=list(product_ids)).only(
+        'pk', 'product_id', 'attributes')
+    VariantAttribute.objects.using(using).filter(product_id__in=list(product_ids)).delete()
+    VariantAttribute.objects.using(using).bulk_create(
+        [row for v in variants.iterator() for row in attribute_rows(v)], batch_size=1000)
+
+
+def _value_counts(products, selected, only=None, exclude=()):
+    """`{(name, value): products}` over the variants of `products` that match `selected`."""
+    variants = matching_variants(
+        ProductVariant.objects.using(products.db).filter(product__in=products.order_by().values('pk')), selected)
+    if uses_jsonb(products.db):
+        return _jsonb_value_counts(variants, only, exclude)
+    rows = VariantAttribute.objects.using(products.db).filter(variant__in=variants.order_by().values('pk'))
+    if only is not None:
+        rows = rows.filter(name__in=only)
+    if exclude:
+        rows = rows.exclude(name__in=exclude)
+    rows = rows.order_by().values_list('name', 'value').annotate(count=Count('product_id', distinct=True))
+    return {(name, value): count for name, value, count in rows}
+
+
+def _jsonb_value_counts(variants, only, exclude):
+    sql, params = variants.order_by().values('pk').query.sql_with_params()
+    conditions, extra = [], []
+    if only is not None:
+        conditions.append('kv.key = ANY(%s)')
+        extra.append(list(only))
+    if exclude:
+        conditions.append('NOT (kv.key = ANY(%s))')
+        extra.append(list(exclude))
+    query = (
+        f"SELECT kv.key, kv.value #>> '{{}}', COUNT(DISTINCT v.product_id) "
+        f"FROM {ProductVariant._meta.db_table} v "
+        # jsonb_each() raises on non-object values
+        "CROSS JOIN LATERAL jsonb_each(CASE WHEN jsonb_typeof(v.attributes) = 'object' "
+        "THEN v.attributes ELSE '{}'::jsonb END) kv "
+        "WHERE jsonb_typeof(kv.value) IN ('string', 'number', 'boolean') "
+        f"AND v.id IN ({sql}) "
+        + ''.join(f'AND {condition} ' for condition in conditions)
+        + "GROUP BY 1, 2"
+    )
+    with connections[variants.db].cursor() as cursor:
+        cursor.execute(query, [*params, *extra])
+        return {(name, value): count for name, value, count in cursor.fetchall()}
+
+
+def attribute_facets(products, selected):
+    """The `attributes` facet block: `{name: [{'value': ..., 'count': products}, ...]}`.
+
+    `products` is the list queryset with every filter except the attribute
+    filters `selected`. Values are counted on the variants matching the
+    other attribute filters, so with `attr_color=red` the sizes listed are
+    the sizes red comes in. Like the other facets these are disjunctive: the
+    counts of a filtered attribute ignore its own filter. One query, plus one
+    per filtered attribute. CATALOG_ATTRIBUTE_FACETS limits the attributes
+    listed (empty: all of them).
+    """
+    wanted = wanted_facets()
+    counts = _value_counts(products, selected, wanted, exclude=list(selected))
+    for name in selected:
+        if wanted is not None and name not in wanted:
+            continue
+        others = {other: values for other, values in selected.items() if other != name}
+        counts.update(_value_counts(products, others, [name]))
+    return format_attribute_facets(counts)
+
+
+def wanted_facets():
+    return list(getattr(settings, 'CATALOG_ATTRIBUTE_FACETS', []) or []) or None
+
+
+def format_attribute_facets(counts):
+    """`{(name, value): products}` -> the `attributes` facet block."""
+    wanted = wanted_facets()
+    facets = {}
+    for (name, value), count in counts.items():
+        if count and (wanted is None or name in wanted):
+            facets.setdefault(name, []).append({'value': value, 'count': count})
+    return {name: sorted(values, key=lambda v: (-v['count'], v['value']))[:MAX_FACET_VALUES]
+            for name, values in sorted(facets.items())}
+
+
+# --- receivers ----------------------------------------------------------------
+# Deleting a variant cascades to its rows. Like the count updates these run in
+# the writer's transaction.
+
+def sync_attributes_on_variant_save(sender, instance, using='default', **kwargs):
+    # raw (fixture) saves too: only the variant's own fields are read
+    sync_variant_attributes([instance], using)
+
+
+def sync_attributes_on_bulk_change(sender, product_ids=(), **kwargs):
+    sync_product_attributes(product_ids)
+
+
+def connect_signals():
+    """Connect the attribute row receivers (from `CatalogConfig.ready()`)."""
+    post_save.connect(sync_attributes_on_variant_save, sender=ProductVariant)
+    products_bulk_changed.connect(sync_attributes_on_bulk_change)
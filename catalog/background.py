@@ -0,0 +1,47 @@
+"""Catch-up syncs of the per-worker catalog indexes, off the request path.
+
+The BM25 index (catalog/bm25.py) and the columnar snapshot
+(catalog/columnar.py) pick up writes made by other workers with a periodic
+`sync()`. A request that finds its worker's copy older than the sync interval
+starts that sync on a daemon thread and carries on with the copy it has, so
+readers never wait for a sync and at most one runs per index at a time.
+"""
+import logging
+import threading
+import time
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def sync_if_stale(owner, interval, name):
+    """Start `owner.background_sync()` on a thread when its `last_sync` is `interval` seconds old.
+
+    `owner` provides `background_sync()`, a `last_sync` monotonic timestamp
+    and a `sync_running` lock. Returns the started thread, or None.
+    """
+    if time.monotonic() - owner.last_sync < interval:
+        return None
+    if not owner.sync_running.acquire(blocking=False):
+        return None
+    if time.monotonic() - owner.last_sync < interval:
+        # another thread finished a sync in between
+        owner.sync_running.release()
+        return None
+
+    def run():
+        try:
+            owner.background_sync()
+        except Exception:
+            logger.exception('Background %s sync failed', name)
+            # retry after the interval rather than on every request
+            owner.last_sync = time.monotonic()
+        finally:
+            # this thread's connections would otherwise stay open until the worker exits
+            connections.close_all()
+            owner.sync_running.release()
+
+    thread = threading.Thread(target=run, name=f'{name}-sync', daemon=True)
+    thread.start()
+    return thread
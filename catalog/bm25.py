@@ -0,0 +1,409 @@
+"""In-process BM25 search index for deployments without PostgreSQL.
+
+The index is an inverted index over `Product.name` and `Product.description`
+held in each worker's memory:
+
+* every product occupies a *slot*; per-slot data (product id, weighted length,
+  `updated_at` timestamp) lives in flat `array` columns;
+* each term maps to a postings pair `(slots, term_frequencies)`, again two
+  typed arrays rather than lists of Python objects;
+* updates are incremental: re-indexing a product tombstones its old slot and
+  appends a new one, and tombstones are compacted away once they outnumber
+  live documents.
+
+Writes made in this process are applied from the catalog signals. Writes made
+by other workers are picked up by `sync()`, which re-reads products whose
+`updated_at` moved past the last sync (with an overlap window for late
+commits). Deleted rows leave nothing to find that way, so every
+`CATALOG_SEARCH_INDEX_RECONCILE_SECONDS` a sync also scans the product ids.
+Syncs run on a background thread (catalog/background.py); searches keep using
+the index meanwhile.
+
+A snapshot on disk (`CATALOG_SEARCH_INDEX_PATH`, written by
+`build_search_index` or by the first worker that has to build the index) lets
+workers start without re-tokenizing the whole catalog; they only sync what
+changed since it was written. It is a zip of a JSON header and the raw typed
+arrays, so loading it never runs code from the file.
+"""
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from array import array
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .background import sync_if_stale
+
+SNAPSHOT_VERSION = 2
+# typecodes of the snapshot arrays; their item sizes are recorded with it
+SNAPSHOT_ARRAYS = {'doc_ids': 'q', 'doc_lengths': 'f', 'doc_stamps': 'd', 'slots': 'I', 'tfs': 'f'}
+# BM25 parameters (the usual Okapi defaults)
+K1 = 1.2
+B = 0.75
+# A term in the product name counts this many times a description term.
+NAME_WEIGHT = 3.0
+# Re-read products updated within this window before the last sync so rows
+# committed late (updated_at is set before the transaction commits) are seen.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+class BM25Index:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.doc_ids = array('q')       # slot -> product id, 0 for a tombstone
+        self.doc_lengths = array('f')   # slot -> weighted token count
+        self.doc_stamps = array('d')    # slot -> updated_at timestamp
+        self.slots = {}                 # product id -> live slot
+        self.postings = {}              # term -> (array('I') slots, array('f') tfs)
+        self.total_length = 0.0
+        self.dead = 0
+        self.watermark = None           # latest updated_at seen by sync()
+        self.last_sync = 0.0
+        self.last_reconcile = 0.0       # last scan of the product ids for deletions
+        self.sync_running = threading.Lock()
+
+    def __len__(self):
+        return len(self.slots)
+
+    # -- writes --------------------------------------------------------------
+
+    def add(self, product_id, name, description, updated_at=None):
+        """Index (or re-index) one product."""
+        frequencies = {}
+        for term in tokenize(name):
+            frequencies[term] = frequencies.get(term, 0.0) + NAME_WEIGHT
+        for term in tokenize(description):
+            frequencies[term] = frequencies.get(term, 0.0) + 1.0
+        with self._lock:
+            self._remove(product_id)
+            slot = len(self.doc_ids)
+            length = sum(frequencies.values())
+            self.doc_ids.append(product_id)
+            self.doc_lengths.append(length)
+            self.doc_stamps.append(updated_at.timestamp() if updated_at else 0.0)
+            self.slots[product_id] = slot
+            self.total_length += length
+            for term, tf in frequencies.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = (array('I'), array('f'))
+                postings[0].append(slot)
+                postings[1].append(tf)
+            self._maybe_compact()
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+            self._maybe_compact()
+
+    def _remove(self, product_id):
+        slot = self.slots.pop(product_id, None)
+        if slot is None:
+            return
+        self.doc_ids[slot] = 0
+        self.total_length -= self.doc_lengths[slot]
+        self.dead += 1
+
+    def _maybe_compact(self):
+        if self.dead > 1024 and self.dead > len(self.slots):
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned slots from the per-slot columns and postings."""
+        with self._lock:
+            remap = {}
+            doc_ids, lengths, stamps = array('q'), array('f'), array('d')
+            for old, product_id in enumerate(self.doc_ids):
+                if product_id:
+                    remap[old] = len(doc_ids)
+                    doc_ids.append(product_id)
+                    lengths.append(self.doc_lengths[old])
+                    stamps.append(self.doc_stamps[old])
+            postings = {}
+            for term, (slots, tfs) in self.postings.items():
+                new_slots, new_tfs = array('I'), array('f')
+                for slot, tf in zip(slots, tfs):
+                    new = remap.get(slot)
+                    if new is not None:
+                        new_slots.append(new)
+                        new_tfs.append(tf)
+                if new_slots:
+                    postings[term] = (new_slots, new_tfs)
+            self.doc_ids, self.doc_lengths, self.doc_stamps = doc_ids, lengths, stamps
+            self.postings = postings
+            self.slots = {product_id: slot for slot, product_id in enumerate(doc_ids)}
+            self.dead = 0
+
+    # -- reads ---------------------------------------------------------------
+
+    def search(self, text, limit=None):
+        """Return `[(product_id, score), ...]`, best first.
+
+        Any query term may match (BM25 is a ranking, not a boolean filter);
+        documents matching more and rarer terms score higher.
+        """
+        terms = set(tokenize(text))
+        with self._lock:
+            total = len(self.slots)
+            if not terms or not total:
+                return []
+            average = self.total_length / total or 1.0
+            doc_ids, lengths = self.doc_ids, self.doc_lengths
+            scores = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                live = [(slot, tf) for slot, tf in zip(*postings) if doc_ids[slot]]
+                if not live:
+                    continue
+                df = len(live)
+                idf = math.log(1.0 + (total - df + 0.5) / (df + 0.5))
+                for slot, tf in live:
+                    norm = K1 * (1.0 - B + B * lengths[slot] / average)
+                    scores[slot] = scores.get(slot, 0.0) + idf * tf * (K1 + 1.0) / (tf + norm)
+            if limit is None:
+                ranked = sorted(scores.items(), key=itemgetter(1), reverse=True)
+            else:
+                ranked = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+            return [(doc_ids[slot], score) for slot, score in ranked]
+
+    # -- synchronisation with the database ------------------------------------
+
+    def sync(self, queryset=None, reconcile=True):
+        """Catch up with writes this process did not see through signals.
+
+        With `reconcile`, also drop products that no longer exist (a scan of
+        every product id). The background syncs only reconcile every
+        `CATALOG_SEARCH_INDEX_RECONCILE_SECONDS`.
+        """
+        from .models import Product
+
+        queryset = Product.objects.all() if queryset is None else queryset
+        started = time.monotonic()
+        building = self.watermark is None
+        changed = queryset
+        if self.watermark is not None:
+            changed = changed.filter(updated_at__gte=self.watermark - SYNC_OVERLAP)
+        watermark = self.watermark
+        rows = changed.order_by().values_list('id', 'name', 'description', 'updated_at')
+        for product_id, name, description, updated_at in rows.iterator(chunk_size=2000):
+            slot = self.slots.get(product_id)
+            if slot is None or self.doc_stamps[slot] != updated_at.timestamp():
+                self.add(product_id, name, description, updated_at)
+            if watermark is None or updated_at > watermark:
+                watermark = updated_at
+        # deletions leave no updated_at behind; a first build has nothing to drop
+        if reconcile and not building:
+            existing = set(queryset.order_by().values_list('id', flat=True).iterator(chunk_size=10000))
+            for product_id in [pid for pid in self.slots if pid not in existing]:
+                self.remove(product_id)
+        if reconcile or building:
+            self.last_reconcile = started
+        self.watermark = watermark
+        self.last_sync = started
+
+    def background_sync(self):
+        """The periodic sync: reconciles deletions only when that is due."""
+        interval = getattr(settings, 'CATALOG_SEARCH_INDEX_RECONCILE_SECONDS', 300)
+        self.sync(reconcile=time.monotonic() - self.last_reconcile >= interval)
+
+    def refresh(self, product_ids):
+        """Re-index `product_ids` from the database, dropping any that are gone."""
+        from .models import Product
+
+        product_ids = set(product_ids)
+        rows = Product.objects.filter(pk__in=product_ids).values_list('id', 'name', 'description', 'updated_at')
+        for product_id, name, description, updated_at in rows:
+            self.add(product_id, name, description, updated_at)
+            product_ids.discard(product_id)
+        for product_id in product_ids:
+            self.remove(product_id)
+
+    # -- snapshots -----------------------------------------------------------
+
+    def save(self, path):
+        """Write a compacted snapshot to `path` atomically."""
+        with self._lock:
+            if self.dead:
+                self.compact()
+            terms = list(self.postings)
+            slots, tfs = array('I'), array('f')
+            for term in terms:
+                slots.extend(self.postings[term][0])
+                tfs.extend(self.postings[term][1])
+            arrays = {'doc_ids': self.doc_ids, 'doc_lengths': self.doc_lengths, 'doc_stamps': self.doc_stamps,
+                      'slots': slots, 'tfs': tfs}
+            header = {
+                'version': SNAPSHOT_VERSION,
+                'byteorder': sys.byteorder,
+                'itemsizes': {name: values.itemsize for name, values in arrays.items()},
+                'watermark': self.watermark.isoformat() if self.watermark else None,
+                'terms': terms,
+                'postings': [len(self.postings[term][0]) for term in terms],
+            }
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.search-index-')
+            try:
+                with os.fdopen(fd, 'wb') as fh, zipfile.ZipFile(fh, 'w') as zf:
+                    zf.writestr('header.json', json.dumps(header))
+                    for name, values in arrays.items():
+                        zf.writestr(name, values.tobytes())
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+    @classmethod
+    def load(cls, path):
+        """Load a snapshot written by `save()`; returns None if unusable."""
+        try:
+            with zipfile.ZipFile(path) as zf:
+                header = json.loads(zf.read('header.json'))
+                if (not isinstance(header, dict) or header.get('version') != SNAPSHOT_VERSION
+                        or header.get('byteorder') != sys.byteorder):
+                    return None
+                arrays = {}
+                for name, typecode in SNAPSHOT_ARRAYS.items():
+                    values = array(typecode)
+                    if header['itemsizes'][name] != values.itemsize:
+                        return None
+                    values.frombytes(zf.read(name))
+                    arrays[name] = values
+            terms, counts = header['terms'], header['postings']
+            watermark = datetime.fromisoformat(header['watermark']) if header['watermark'] else None
+        except (OSError, zipfile.BadZipFile, KeyError, TypeError, ValueError):
+            return None
+        doc_ids = arrays['doc_ids']
+        if (len(terms) != len(counts) or not sum(counts) == len(arrays['slots']) == len(arrays['tfs'])
+                or not len(doc_ids) == len(arrays['doc_lengths']) == len(arrays['doc_stamps'])
+                or (arrays['slots'] and max(arrays['slots']) >= len(doc_ids))):
+            return None
+        index = cls()
+        index.doc_ids, index.doc_lengths, index.doc_stamps = doc_ids, arrays['doc_lengths'], arrays['doc_stamps']
+        start = 0
+        for term, count in zip(terms, counts):
+            index.postings[term] = (arrays['slots'][start:start + count], arrays['tfs'][start:start + count])
+            start += count
+        index.watermark = watermark
+        index.slots = {product_id: slot for slot, product_id in enumerate(index.doc_ids) if product_id}
+        index.total_length = float(sum(index.doc_lengths))
+        return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def snapshot_path():
+    return getattr(settings, 'CATALOG_SEARCH_INDEX_PATH', None)
+
+
+def loaded_index():
+    """The index of this process, or None when search has not used it yet."""
+    return _index
+
+
+def build_index(path=None):
+    """Build a fresh index from the database and write its snapshot."""
+    index = BM25Index()
+    index.sync()
+    path = path or snapshot_path()
+    if path:
+        index.save(path)
+    return index
+
+
+def get_index():
+    """Return this process's index, loading or building it on first use.
+
+    Once it is older than `CATALOG_SEARCH_INDEX_SYNC_SECONDS`, a call starts a
+    background re-sync with the database and returns the index as it is.
+    """
+    global _index
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                path = snapshot_path()
+                loaded = BM25Index.load(path) if path and os.path.exists(path) else None
+                if loaded is None:
+                    _index = build_index(path)
+                else:
+                    loaded.sync()
+                    _index = loaded
+            index = _index
+    sync_if_stale(index, getattr(settings, 'CATALOG_SEARCH_INDEX_SYNC_SECONDS', 5), 'search-index')
+    return index
+
+
+def reset_index():
+    """Forget this process's index (tests, or after replacing the snapshot)."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+# --- receivers ----------------------------------------------------------------
+# Only applied when this process has loaded the index, and only once the write
+# commits; other workers pick the change up on their next sync.
+
+def _refresh_search_index(product_ids):
+    index = loaded_index()
+    if index is None:
+        return
+    product_ids = list(product_ids)
+
+    def refresh():
+        try:
+            index.refresh(product_ids)
+        except Exception:
+            pass
+    transaction.on_commit(refresh)
+
+
+def index_product_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index = loaded_index()
+    if index is not None:
+        values = (instance.pk, instance.name, instance.description, instance.updated_at)
+        transaction.on_commit(lambda: index.add(*values))
+
+
+def unindex_product_on_delete(sender, instance, **kwargs):
+    index = loaded_index()
+    if index is not None:
+        pk = instance.pk
+        transaction.on_commit(lambda: index.remove(pk))
+
+
+def refresh_search_index_on_bulk_change(sender, product_ids=(), category_ids=(), **kwargs):
+    _refresh_search_index(product_ids)
+
+
+def connect_signals():
+    """Connect the index receivers (from `CatalogConfig.ready()`)."""
+    from .models import Product
+    from .signals import products_bulk_changed
+    post_save.connect(index_product_on_save, sender=Product)
+    post_delete.connect(unindex_product_on_delete, sender=Product)
+    products_bulk_changed.connect(refresh_search_index_on_bulk_change)
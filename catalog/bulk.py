@@ -0,0 +1,239 @@
+"""Bulk price/inventory patches for products and variants.
+
+Input is a stream of records keyed by product `slug` or variant `sku`, each
+carrying `price` and/or `inventory`:
+
+    {"slug": "red-kettle", "price": "24.99"}
+    {"sku": "KETTLE-RED-1L", "inventory": 40}
+
+as NDJSON (one object per line) or CSV (header `slug,sku,price,inventory`;
+empty cells are ignored). Records are read lazily and applied in chunks: each
+chunk loads the current values in one query per model, drops no-op rows and
+writes the rest with a single `UPDATE ... SET col = CASE pk WHEN ...` per
+model, then invalidates caches/documents once through `products_bulk_changed`.
+Invalid rows are reported with their line number and do not stop the upload.
+"""
+import codecs
+import csv
+import io
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import Product, ProductVariant
+from .signals import products_bulk_changed
+
+DEFAULT_CHUNK_SIZE = 500
+# Cap the error list in reports so a bad upload cannot produce a huge response.
+DEFAULT_MAX_ERRORS = 1000
+PATCH_FIELDS = ('price', 'inventory')
+
+
+class RowError(Exception):
+    pass
+
+
+def iter_ndjson(stream):
+    """Yield `(line_number, record)` from a binary NDJSON stream.
+
+    A line that does not decode or parse yields a `RowError` in place of the record.
+    """
+    for number, line in enumerate(stream, start=1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError as exc:
+                yield number, RowError(f'invalid UTF-8: {exc.reason} at byte {exc.start}')
+                continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield number, RowError(f'invalid JSON: {exc}')
+            continue
+        if not isinstance(record, dict):
+            yield number, RowError('expected a JSON object')
+            continue
+        yield number, record
+
+
+def _invalid_utf8(record):
+    # undecodable bytes survive 'surrogateescape' as lone surrogates, which do not encode
+    try:
+        for key, value in record.items():
+            for text in (key, value):
+                if isinstance(text, str):
+                    text.encode('utf-8')
+    except UnicodeEncodeError:
+        return True
+    return False
+
+
+def iter_csv(stream):
+    """Yield `(line_number, record)` from a binary CSV stream with a header row.
+
+    A row with bytes that are not UTF-8 yields a `RowError` in place of the record.
+    """
+    if not isinstance(stream, io.TextIOBase):
+        stream = codecs.getreader('utf-8')(stream, errors='surrogateescape')
+    reader = csv.DictReader(stream)
+    for record in reader:
+        if _invalid_utf8(record):
+            yield reader.line_num, RowError('invalid UTF-8')
+            continue
+        yield reader.line_num, {key: value for key, value in record.items() if key and value not in (None, '')}
+
+
+def iter_records(stream, fmt):
+    if fmt == 'csv':
+        return iter_csv(stream)
+    if fmt == 'ndjson':
+        return iter_ndjson(stream)
+    raise ValueError(f'unsupported format: {fmt}')
+
+
+def _clean(model, record):
+    """Return `(key, changes)` for a record or raise RowError."""
+    slug, sku = record.get('slug'), record.get('sku')
+    if bool(slug) == bool(sku):
+        raise RowError('exactly one of "slug" or "sku" is required')
+    unknown = set(record) - {'slug', 'sku', *PATCH_FIELDS}
+    if unknown:
+        raise RowError(f'unknown fields: {", ".join(sorted(unknown))}')
+    changes = {}
+    for name in PATCH_FIELDS:
+        if name not in record:
+            continue
+        field = model._meta.get_field(name)
+        value = record[name]
+        if isinstance(value, float):
+            # JSON numbers: keep the written digits (19.99, not 19.989999...)
+            value = str(value)
+        try:
+            changes[name] = field.clean(value, None)
+        except ValidationError as exc:
+            raise RowError(f'{name}: {" ".join(exc.messages)}')
+        # the columns allow it, but a feed sending negative numbers is broken
+        if changes[name] is not None and changes[name] < 0:
+            raise RowError(f'{name}: must not be negative')
+    if not changes:
+        raise RowError('nothing to update: give "price" and/or "inventory"')
+    return slug or sku, changes
+
+
+def _case_update(model, updates, **extra):
+    """Apply `{pk: {field: value}}` with one UPDATE using CASE per field."""
+    if not updates:
+        return 0
+    assignments = {}
+    for name in {name for changes in updates.values() for name in changes}:
+        field = model._meta.get_field(name)
+        whens = [When(pk=pk, then=Value(changes[name], output_field=field))
+                 for pk, changes in updates.items() if name in changes]
+        assignments[name] = Case(*whens, default=F(name), output_field=field)
+    return model.objects.filter(pk__in=list(updates)).update(**assignments, **extra)
+
+
+class BulkPatchReport:
+    def __init__(self, max_errors=DEFAULT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, key, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'key': key, 'error': message})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def _apply_chunk(chunk, report):
+    # later rows for the same key win, field by field
+    pending = {Product: {}, ProductVariant: {}}
+    first_error = len(report.errors)
+    for line, record in chunk:
+        model = ProductVariant if isinstance(record, dict) and record.get('sku') else Product
+        key = (record.get('slug') or record.get('sku')) if isinstance(record, dict) else None
+        try:
+            if isinstance(record, RowError):
+                raise record
+            key, changes = _clean(model, record)
+        except RowError as exc:
+            report.error(line, key, str(exc))
+            continue
+        entry = pending[model].setdefault(key, {'lines': [], 'changes': {}})
+        entry['lines'].append(line)
+        entry['changes'].update(changes)
+
+    product_ids = set()
+    with transaction.atomic():
+        if pending[Product]:
+            current = Product.objects.filter(slug__in=list(pending[Product])).values_list(
+                'slug', 'pk', 'price', 'inventory')
+            found = {slug: rest for slug, *rest in current}
+            updates = _diff(pending[Product], found, report, 'product slug')
+            product_ids.update(updates)
+            _case_update(Product, updates, updated_at=timezone.now())
+        if pending[ProductVariant]:
+            current = ProductVariant.objects.filter(sku__in=list(pending[ProductVariant])).values_list(
+                'sku', 'pk', 'price', 'inventory', 'product_id')
+            found = {sku: rest for sku, *rest in current}
+            updates = _diff(pending[ProductVariant], found, report, 'variant sku')
+            product_ids.update(product_id for pk, price, inventory, product_id in found.values() if pk in updates)
+            _case_update(ProductVariant, updates)
+
+    report.errors[first_error:] = sorted(report.errors[first_error:], key=lambda e: e['line'])
+    if product_ids:
+        # one invalidation (caches, read documents, search/list snapshots) per chunk
+        products_bulk_changed.send(sender=Product, product_ids=sorted(product_ids))
+
+
+def _diff(pending, found, report, label):
+    """Return `{pk: changed fields}` for rows that change something."""
+    updates = {}
+    for key, entry in pending.items():
+        line = entry['lines'][-1]
+        if key not in found:
+            report.error(line, key, f'unknown {label}')
+            continue
+        pk, price, inventory = found[key][:3]
+        before = {'price': price, 'inventory': inventory}
+        changes = {name: value for name, value in entry['changes'].items() if before[name] != value}
+        if changes:
+            updates[pk] = changes
+            report.updated += len(entry['lines'])
+        else:
+            report.unchanged += len(entry['lines'])
+    return updates
+
+
+def apply_patches(records, chunk_size=DEFAULT_CHUNK_SIZE, max_errors=DEFAULT_MAX_ERRORS):
+    """Apply `(line, record)` pairs (see `iter_records`) and return a BulkPatchReport."""
+    report = BulkPatchReport(max_errors=max_errors)
+    chunk = []
+    for item in records:
+        report.rows += 1
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            _apply_chunk(chunk, report)
+            chunk = []
+    if chunk:
+        _apply_chunk(chunk, report)
+    return report
@@ -0,0 +1,88 @@
+"""Tag-versioned caching for catalog reads.
+
+Cached values are stored together with the versions of the tags they depend
+on (the whole catalog, a category, a product). A write bumps the version of
+each affected tag with a single atomic `incr`; entries recorded against an
+older version are treated as misses on the next read. This replaces scanning
+the keyspace (`delete_pattern`) and only drops what a write actually touched.
+
+Tags:
+  - `catalog`                   any product change (unfiltered list pages)
+  - `category:<id>`             products in, or the data of, one category
+  - `category-slug:<slug>`      same, for list pages filtered by slug
+  - `product:<id>`              one product and the rows embedded in it
+  - `categories`                the category list (names, slugs, product counts)
+"""
+import time
+
+from django.core.cache import cache
+
+from nexus.metrics import record_cache
+
+CATALOG_TAG = 'catalog'
+CATEGORIES_TAG = 'categories'
+
+# sentinel distinguishing "not cached" from a cached None (negative caching)
+MISS = object()
+
+
+def category_tags(category_id, slug=None):
+    tags = [f'category:{category_id}']
+    if slug:
+        tags.append(f'category-slug:{slug}')
+    return tags
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def _version_key(tag):
+    return f'catalog:tagver:{tag}'
+
+
+def tag_versions(tags):
+    """Return `{tag: version}` for `tags`, initializing unknown tags.
+
+    New tags are seeded from the clock rather than 0 so that a version lost to
+    eviction never comes back as a value an old entry was stored against.
+    """
+    keys = {_version_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    versions = {}
+    for key, tag in keys.items():
+        version = found.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), None)
+            version = cache.get(key)
+        versions[tag] = version
+    return versions
+
+
+def bump(*tags):
+    """Invalidate every entry depending on any of `tags` (O(1) per tag)."""
+    for tag in set(tags):
+        key = _version_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # unknown tag: nothing can be cached against it yet
+            cache.add(key, time.time_ns(), None)
+
+
+def lookup(key):
+    """Return the cached value for `key`, or `MISS` if absent or stale."""
+    entry = cache.get(key)
+    hit = entry is not None and tag_versions(entry['tags']) == entry['tags']
+    # counted per kind of entry ('product:list', 'product:detail') on the metrics endpoint
+    record_cache(':'.join(key.split(':', 2)[:2]), hit)
+    return entry['value'] if hit else MISS
+
+
+def store(key, value, versions, timeout=None):
+    """Store `value` under `key` against a `tag_versions()` snapshot.
+
+    Take the snapshot *before* reading the data being cached so that a write
+    racing with the read leaves the entry already stale.
+    """
+    cache.set(key, {'tags': dict(versions), 'value': value}, timeout)
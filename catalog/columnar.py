@@ -0,0 +1,534 @@
+"""Columnar in-memory snapshot of the catalog for list filtering and facets.
+
+Each worker keeps one NumPy array per column (id, category_id, price in cents,
+inventory, created_at/updated_at/document updated_at in epoch microseconds),
+plus the variant attribute values of each product, and answers the product list's filter + sort + paginate and the facet counts
+with vectorized operations instead of a query per request.
+
+Like the BM25 index (catalog/bm25.py) the snapshot is built on first use,
+updated from the catalog signals after commit, and synced periodically with
+the database on a background thread to pick up writes made by other workers.
+Deleted rows are only found by a scan of the product ids, every
+`CATALOG_COLUMNAR_RECONCILE_SECONDS`.
+
+The column arrays handed to a request by `view()` are never written again:
+the next write copies them first (copy-on-write), so a request sees one
+consistent set of prices, inventory and categories however long it runs.
+
+NumPy is optional: without it `get_snapshot()` returns None and callers use
+the database.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import ROUND_CEILING, ROUND_FLOOR, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+
+from .attributes import format_attribute_facets, text_value
+from .background import sync_if_stale
+from .facets import format_facets, parse_price_bounds, price_edges
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_CENT = Decimal('0.01')
+# Null timestamps (products without a read document)
+NULL_TIME = -1
+# See catalog/bm25.py: re-read recent rows so late commits are not missed.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+INT_COLUMNS = ('id', 'category_id', 'price', 'inventory', 'created_at', 'updated_at', 'document_updated_at')
+# Columns CursorPagination may order and position by.
+SORTABLE = ('price', 'created_at')
+
+
+def _micros(value):
+    return NULL_TIME if value is None else (value - _EPOCH) // _MICROSECOND
+
+
+def _datetime(micros):
+    return None if micros == NULL_TIME else _EPOCH + timedelta(microseconds=int(micros))
+
+
+def cents(value):
+    return int((Decimal(value) * 100).to_integral_value())
+
+
+def _price(value):
+    return (Decimal(int(value)) / 100).quantize(_CENT)
+
+
+def _to_python(name, value):
+    if name == 'price':
+        return _price(value)
+    if name == 'created_at':
+        return _datetime(value)
+    return int(value)
+
+
+def _key(name, value):
+    # cursor values arrive as the Python types the database returns
+    return cents(value) if name == 'price' else _micros(value)
+
+
+class ColumnarSnapshot:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.columns = {name: np.zeros(0, dtype=np.int64) for name in INT_COLUMNS}
+        self.alive = np.zeros(0, dtype=bool)
+        self.size = 0                   # rows in use (live + tombstoned)
+        self.rows = {}                  # product id -> row
+        self.dead = 0
+        self.categories = {}            # category id -> (name, slug)
+        self.category_slugs = {}        # slug -> category id
+        self.attribute_values = []      # code -> (name, value)
+        self.attribute_codes = {}       # (name, value) -> code
+        self.product_attributes = {}    # product id -> codes of its variants' attribute values
+        self._attribute_index = None    # (product ids, codes, values), rebuilt after changes
+        self._shared = False            # whether view() handed out the current arrays
+        self.watermark = None
+        self.last_sync = 0.0
+        self.last_reconcile = 0.0       # last scan of the product ids for deletions
+        self.sync_running = threading.Lock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    # -- writes --------------------------------------------------------------
+
+    def _writable(self):
+        # copy-on-write: views already handed out keep the arrays they were given
+        if self._shared:
+            self.columns = {name: column.copy() for name, column in self.columns.items()}
+            self.alive = self.alive.copy()
+            self._shared = False
+
+    def _grow(self, needed):
+        capacity = len(self.alive)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=np.int64)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.alive = alive
+
+    def upsert(self, records):
+        """Insert or update rows from `(id, category_id, price, inventory, created_at,
+        updated_at, document_updated_at)` tuples."""
+        with self._lock:
+            self._writable()
+            for pid, category_id, price, inventory, created_at, updated_at, doc_updated_at in records:
+                row = self.rows.get(pid)
+                if row is None:
+                    self._grow(self.size + 1)
+                    row = self.rows[pid] = self.size
+                    self.size += 1
+                    self.alive[row] = True
+                values = (pid, category_id, cents(price), inventory,
+                          _micros(created_at), _micros(updated_at), _micros(doc_updated_at))
+                for name, value in zip(INT_COLUMNS, values):
+                    self.columns[name][row] = value
+
+    def remove(self, product_ids):
+        with self._lock:
+            self._writable()
+            for pid in product_ids:
+                row = self.rows.pop(pid, None)
+                if row is not None:
+                    self.alive[row] = False
+                    self.dead += 1
+                if self.product_attributes.pop(pid, None) is not None:
+                    self._attribute_index = None
+            if self.dead > 1024 and self.dead > len(self.rows):
+                self.compact()
+
+    def compact(self):
+        """Drop tombstoned rows. Existing `view()`s keep the old arrays."""
+        with self._lock:
+            keep = np.flatnonzero(self.alive[:self.size])
+            self.columns = {name: column[keep] for name, column in self.columns.items()}
+            self.alive = np.ones(len(keep), dtype=bool)
+            self.size = len(keep)
+            self.rows = {int(pid): row for row, pid in enumerate(self.columns['id'])}
+            self.dead = 0
+
+    def set_categories(self, rows):
+        with self._lock:
+            self.categories = {cid: (name, slug) for cid, name, slug in rows}
+            self.category_slugs = {slug: cid for cid, (name, slug) in self.categories.items()}
+
+    def set_attributes(self, product_ids, records):
+        """Replace the attribute values of `product_ids` (None: every product) from
+        `(product_id, attributes)` variant rows."""
+        with self._lock:
+            found = defaultdict(set)
+            for pid, attributes in records:
+                if not isinstance(attributes, dict):
+                    continue
+                for name, value in attributes.items():
+                    text = text_value(value)
+                    if text is None:
+                        continue
+                    code = self.attribute_codes.get((name, text))
+                    if code is None:
+                        code = self.attribute_codes[(name, text)] = len(self.attribute_values)
+                        self.attribute_values.append((name, text))
+                    found[pid].add(code)
+            if product_ids is None:
+                self.product_attributes = {}
+                product_ids = found
+            for pid in product_ids:
+                codes = found.get(pid)
+                if codes:
+                    self.product_attributes[pid] = tuple(codes)
+                else:
+                    self.product_attributes.pop(pid, None)
+            self._attribute_index = None
+
+    # -- synchronisation with the database ------------------------------------
+
+    @staticmethod
+    def _records(queryset):
+        return queryset.order_by().values_list(
+            'id', 'category_id', 'price', 'inventory', 'created_at', 'updated_at', 'document__updated_at')
+
+    @staticmethod
+    def _attributes(product_ids=None):
+        from .models import ProductVariant
+
+        variants = ProductVariant.objects.order_by()
+        if product_ids is not None:
+            variants = variants.filter(product_id__in=list(product_ids))
+        return variants.values_list('product_id', 'attributes')
+
+    def refresh(self, product_ids):
+        """Reload `product_ids` from the database, dropping any that are gone."""
+        from .models import Product
+
+        product_ids = set(product_ids)
+        records = list(self._records(Product.objects.filter(pk__in=product_ids)))
+        self.upsert(records)
+        self.set_attributes(product_ids, self._attributes(product_ids))
+        self.remove(product_ids - {record[0] for record in records})
+
+    def refresh_categories(self):
+        from .models import Category
+        self.set_categories(Category.objects.order_by().values_list('id', 'name', 'slug'))
+
+    def sync(self, reconcile=True):
+        """Catch up with writes this process did not see through signals.
+
+        With `reconcile`, also drop products that no longer exist (a scan of
+        every product id).
+        """
+        from .models import Product
+
+        started = time.monotonic()
+        building = self.watermark is None
+        changed = Product.objects.all()
+        if self.watermark is not None:
+            since = self.watermark - SYNC_OVERLAP
+            changed = changed.filter(Q(updated_at__gte=since) | Q(document__updated_at__gte=since))
+        watermark = self.watermark
+        batch = []
+        for record in self._records(changed).iterator(chunk_size=5000):
+            batch.append(record)
+            stamp = max(s for s in record[5:] if s is not None)
+            if watermark is None or stamp > watermark:
+                watermark = stamp
+            if len(batch) >= 5000:
+                self._sync_batch(batch, attributes=self.watermark is not None)
+                batch = []
+        self._sync_batch(batch, attributes=self.watermark is not None)
+        if self.watermark is None:
+            # first build: every variant in one pass
+            self.set_attributes(None, self._attributes().iterator(chunk_size=5000))
+        # deletions leave no updated_at behind; a first build has nothing to drop
+        if reconcile and not building:
+            existing = set(Product.objects.order_by().values_list('id', flat=True).iterator(chunk_size=10000))
+            self.remove([pid for pid in list(self.rows) if pid not in existing])
+        if reconcile or building:
+            self.last_reconcile = started
+        self.refresh_categories()
+        self.watermark = watermark
+        self.last_sync = started
+
+    def background_sync(self):
+        """The periodic sync: reconciles deletions only when that is due."""
+        interval = getattr(settings, 'CATALOG_COLUMNAR_RECONCILE_SECONDS', 300)
+        self.sync(reconcile=time.monotonic() - self.last_reconcile >= interval)
+
+    def _sync_batch(self, records, attributes):
+        self.upsert(records)
+        if attributes and records:
+            # variant edits rebuild the product document, so they show up here
+            product_ids = [record[0] for record in records]
+            self.set_attributes(product_ids, self._attributes(product_ids))
+
+    # -- reads ---------------------------------------------------------------
+
+    def view(self):
+        """Column views for one request.
+
+        The columns are slices (no copy) of arrays that later writes copy
+        before changing, so the request sees the snapshot as of this call.
+        """
+        with self._lock:
+            cols = {name: column[:self.size] for name, column in self.columns.items()}
+            cols['alive'] = self.alive[:self.size]
+            self._shared = True
+            return cols
+
+    def category_ids(self, params):
+        """Category ids selected by `category__id` / `category__slug`, or None for all."""
+        selected = None
+        if params.get('category__id'):
+            selected = {int(params['category__id'])}
+        if params.get('category__slug'):
+            cid = self.category_slugs.get(params['category__slug'])
+            by_slug = {cid} if cid is not None else set()
+            selected = by_slug if selected is None else selected & by_slug
+        return selected
+
+    @staticmethod
+    def mask(cols, category_ids=None, min_price=None, max_price=None):
+        mask = cols['alive'].copy()
+        if category_ids is not None:
+            mask &= np.isin(cols['category_id'], list(category_ids))
+        if min_price is not None:
+            mask &= cols['price'] >= int((min_price * 100).to_integral_value(rounding=ROUND_CEILING))
+        if max_price is not None:
+            mask &= cols['price'] <= int((max_price * 100).to_integral_value(rounding=ROUND_FLOOR))
+        return mask
+
+    def attribute_index(self):
+        """`(product ids, codes, values)`: one entry per product and attribute value."""
+        with self._lock:
+            if self._attribute_index is None:
+                pids, codes = [], []
+                for pid, product_codes in self.product_attributes.items():
+                    pids.extend([pid] * len(product_codes))
+                    codes.extend(product_codes)
+                self._attribute_index = (np.array(pids, dtype=np.int64), np.array(codes, dtype=np.int64),
+                                         list(self.attribute_values))
+            return self._attribute_index
+
+    def attribute_counts(self, cols, mask):
+        """`{(name, value): products}` over the selected rows."""
+        pids, codes, values = self.attribute_index()
+        # product ids rather than rows: compaction renumbers rows
+        selected = codes[np.isin(pids, cols['id'][mask])]
+        counts = np.bincount(selected, minlength=len(values))
+        return {values[code]: int(count) for code, count in enumerate(counts.tolist()) if count}
+
+    @staticmethod
+    def validators(cols, mask):
+        """Same `(seed, last_modified)` as conditional.aggregate_validators would give
+        for `updated_at` and `document__updated_at` over the selected rows."""
+        stamps = []
+        for name in ('updated_at', 'document_updated_at'):
+            values = cols[name][mask]
+            values = values[values != NULL_TIME]
+            stamps.append(_datetime(values.max()) if len(values) else None)
+        seed = ':'.join([str(int(mask.sum()))] + [s.isoformat() if s else '-' for s in stamps])
+        return seed, max((s for s in stamps if s is not None), default=None)
+
+    def facets(self, cols, category_ids, min_price, max_price, edges):
+        """Return `(category_counts, price_counts, in_stock, out_of_stock)`."""
+        by_category = self.mask(cols, category_ids)
+        by_price = self.mask(cols, None, min_price, max_price)
+        filtered = by_category & by_price
+
+        ids, counts = np.unique(cols['category_id'][by_price], return_counts=True)
+        category_counts = dict(zip(ids.tolist(), counts.tolist()))
+
+        edge_cents = np.array([cents(edge) for edge in edges], dtype=np.int64)
+        # bucket i holds edges[i] <= price < edges[i + 1]; index 0 is below the first edge
+        buckets = np.searchsorted(edge_cents, cols['price'][by_category], side='right')
+        price_counts = np.bincount(buckets, minlength=len(edges) + 1)[1:].tolist()
+
+        in_stock = int((cols['inventory'][filtered] > 0).sum())
+        return category_counts, price_counts, in_stock, int(filtered.sum()) - in_stock
+
+
+class ColumnarSelection:
+    """The rows of one product list request (ProductFilter params) in a snapshot."""
+
+    def __init__(self, snapshot, params):
+        self.snapshot = snapshot
+        self.cols = snapshot.view()
+        self.category_ids = snapshot.category_ids(params)
+        self.min_price, self.max_price = parse_price_bounds(params)
+        self.mask = snapshot.mask(self.cols, self.category_ids, self.min_price, self.max_price)
+
+    def query(self):
+        return ColumnarQuery(self.cols, np.flatnonzero(self.mask))
+
+    def validators(self, everything=False):
+        return self.snapshot.validators(self.cols, self.cols['alive'] if everything else self.mask)
+
+    def facets(self):
+        counts = self.snapshot.facets(self.cols, self.category_ids, self.min_price, self.max_price, price_edges())
+        facets = format_facets(counts[0], self.snapshot.categories, *counts[1:])
+        facets['attributes'] = format_attribute_facets(self.snapshot.attribute_counts(self.cols, self.mask))
+        return facets
+
+
+class ColumnarQuery:
+    """The slice of the QuerySet API that CursorPagination uses, over snapshot rows.
+
+    Rows are ordered by `(column, id)` and yielded as `{'id': ..., <column>: ...}`
+    dicts with the same Python types the database returns, so cursors are
+    interchangeable with the database path.
+    """
+
+    def __init__(self, cols, rows, ordering=()):
+        self.cols = cols
+        self.rows = rows
+        self.ordering = ordering
+
+    def order_by(self, *ordering):
+        name = ordering[0].lstrip('-')
+        order = np.lexsort((self.cols['id'][self.rows], self.cols[name][self.rows]))
+        if ordering[0].startswith('-'):
+            order = order[::-1]
+        return ColumnarQuery(self.cols, self.rows[order], ordering)
+
+    def seek(self, key, value, pk, descending):
+        """Rows after `(value, pk)` in the given direction (see ProductCursorPagination)."""
+        column, ids = self.cols[key][self.rows], self.cols['id'][self.rows]
+        value = _key(key, value)
+        if descending:
+            keep = (column < value) | ((column == value) & (ids < pk))
+        else:
+            keep = (column > value) | ((column == value) & (ids > pk))
+        return ColumnarQuery(self.cols, self.rows[keep], self.ordering)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        name = self.ordering[0].lstrip('-') if self.ordering else 'id'
+        rows = self.rows[key]
+        return [{'id': int(pid), name: _to_python(name, value)}
+                for pid, value in zip(self.cols['id'][rows], self.cols[name][rows])]
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def available():
+    return np is not None and getattr(settings, 'CATALOG_COLUMNAR_ENABLED', False)
+
+
+def loaded_snapshot():
+    """The snapshot of this process, or None when it has not been used yet."""
+    return _snapshot
+
+
+def get_snapshot():
+    """Return this process's snapshot (building it on first use), or None if disabled.
+
+    Once it is older than `CATALOG_COLUMNAR_SYNC_SECONDS`, a call starts a
+    background re-sync with the database and returns the snapshot as it is.
+    """
+    global _snapshot
+    if not available():
+        return None
+    snapshot = _snapshot
+    if snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                snapshot = ColumnarSnapshot()
+                snapshot.sync()
+                _snapshot = snapshot
+            snapshot = _snapshot
+    sync_if_stale(snapshot, getattr(settings, 'CATALOG_COLUMNAR_SYNC_SECONDS', 5), 'columnar')
+    return snapshot
+
+
+def reset_snapshot():
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+
+# --- receivers ----------------------------------------------------------------
+# Same rules as the search index: only when this process has built the
+# snapshot, and only after the write commits.
+
+def _refresh_snapshot(product_ids=(), categories=False):
+    snapshot = loaded_snapshot()
+    if snapshot is None:
+        return
+    product_ids = list(product_ids)
+
+    def refresh():
+        try:
+            if product_ids:
+                snapshot.refresh(product_ids)
+            if categories:
+                snapshot.refresh_categories()
+        except Exception:
+            pass
+    transaction.on_commit(refresh)
+
+
+def refresh_snapshot_on_product_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _refresh_snapshot([instance.pk])
+
+
+def refresh_snapshot_on_child_change(sender, instance, raw=False, origin=None, **kwargs):
+    from .models import Category, Product
+    from .signals import deleted_with_parent
+    # the product's document (and so its validators) changed
+    if raw or deleted_with_parent(origin, Product) or deleted_with_parent(origin, Category):
+        return
+    _refresh_snapshot([instance.product_id])
+
+
+def refresh_snapshot_on_category_save(sender, instance, raw=False, **kwargs):
+    from .models import Product
+    if raw:
+        return
+    # the document rebuild (catalog/documents.py) moved the document
+    # timestamps of the category's products
+    _refresh_snapshot(Product.objects.filter(category_id=instance.pk).values_list('pk', flat=True), categories=True)
+
+
+def refresh_snapshot_on_category_delete(sender, instance, **kwargs):
+    _refresh_snapshot(categories=True)
+
+
+def refresh_snapshot_on_bulk_change(sender, product_ids=(), category_ids=(), **kwargs):
+    _refresh_snapshot(product_ids, categories=bool(category_ids))
+
+
+def connect_signals():
+    """Connect the snapshot receivers (from `CatalogConfig.ready()`)."""
+    from .models import Category, Product, ProductImage, ProductVariant
+    from .signals import products_bulk_changed
+    post_save.connect(refresh_snapshot_on_product_change, sender=Product)
+    post_delete.connect(refresh_snapshot_on_product_change, sender=Product)
+    for model in (ProductImage, ProductVariant):
+        post_save.connect(refresh_snapshot_on_child_change, sender=model)
+        post_delete.connect(refresh_snapshot_on_child_change, sender=model)
+    post_save.connect(refresh_snapshot_on_category_save, sender=Category)
+    post_delete.connect(refresh_snapshot_on_category_delete, sender=Category)
+    products_bulk_changed.connect(refresh_snapshot_on_bulk_change)
@@ -0,0 +1,63 @@
+"""Conditional GET support (ETag / Last-Modified / 304) for catalog endpoints.
+
+Validators are derived from cheap aggregates (latest `updated_at` and row count
+of the filtered queryset) rather than from the rendered body, so a matching
+`If-None-Match` / `If-Modified-Since` is answered with 304 before anything is
+serialized.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def latest(*values):
+    """Most recent of the given datetimes, ignoring None."""
+    return max((v for v in values if v is not None), default=None)
+
+
+def aggregate_validators(queryset, *timestamp_fields):
+    """Return `(seed, last_modified)` for `queryset` in a single query.
+
+    The seed combines the row count with the latest value of each field, so
+    inserts, updates and deletes all change it.
+    """
+    aggregates = {f'max_{i}': Max(field) for i, field in enumerate(timestamp_fields)}
+    result = queryset.order_by().aggregate(count=Count('pk'), **aggregates)
+    stamps = [result[f'max_{i}'] for i in range(len(timestamp_fields))]
+    seed = ':'.join([str(result['count'])] + [s.isoformat() if s else '-' for s in stamps])
+    return seed, latest(*stamps)
+
+
+class ConditionalGetMixin:
+    """ViewSet helpers for answering conditional GETs from precomputed validators.
+
+    Call `not_modified()` with the validators before building the body; the
+    validators are attached to the eventual 200 response in `finalize_response`.
+    """
+
+    def not_modified(self, request, seed, last_modified=None):
+        """Return a 304 response if the request's validators match, else None."""
+        # The body also varies with the URL (filters/page), host (absolute image
+        # URLs) and the negotiated renderer (JSON vs browsable API).
+        raw = '|'.join([request.build_absolute_uri(), request.accepted_renderer.format, seed])
+        etag = 'W/"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        self._validators = (etag, timestamp)
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is not None:
+            self._add_validator_headers(response)
+        return response
+
+    def _add_validator_headers(self, response):
+        etag, timestamp = self._validators
+        response.headers.setdefault('ETag', etag)
+        if timestamp is not None:
+            response.headers.setdefault('Last-Modified', http_date(timestamp))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, '_validators', None) and response.status_code == 200:
+            self._add_validator_headers(response)
+        return response
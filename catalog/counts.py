@@ -0,0 +1,220 @@
+"""Denormalized product counts on categories (`product_count`, `in_stock_count`).
+
+Product writes go through the receivers at the end of this module: a create, a
+delete, a move to another category or inventory crossing zero becomes one
+relative `UPDATE` of the affected category rows, inside the product's own
+transaction (`Product.save` is atomic). Writes whose outcome is not known in
+Python -- an `F()` inventory expression, say -- read the row before (locked)
+and after the write and apply the difference the same way. The bulk write
+paths (`products_bulk_changed`) recount the categories involved instead.
+
+Counts can still drift when rows change behind the ORM's back (raw SQL, a
+`queryset.update()` that is not announced); `reconcile_category_counts`
+recomputes every category in one grouped query.
+
+In stock means `inventory > 0`, as in the availability facet.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import cache as catalog_cache
+from .models import Category, Product
+from .signals import deleted_with_parent, products_bulk_changed
+
+COUNTED_FIELDS = {'category', 'category_id', 'inventory'}
+
+
+def count_state(instance):
+    """`(category_id, in_stock)` of a product as held in memory, or None when unknown.
+
+    Deferred fields and expressions (`F('inventory') + 1`) are unknown; values
+    are read from `__dict__` so nothing is loaded.
+    """
+    category_id = instance.__dict__.get('category_id')
+    inventory = instance.__dict__.get('inventory')
+    if category_id is None or inventory is None or hasattr(inventory, 'resolve_expression'):
+        return None
+    try:
+        return category_id, int(inventory) > 0
+    except (TypeError, ValueError):
+        return None
+
+
+def row_state(product_id, using=None, lock=False):
+    """`(category_id, in_stock)` of a product as stored, or None if the row is gone.
+
+    `lock` holds the row (SELECT ... FOR UPDATE) until the transaction ends.
+    """
+    rows = Product.objects.using(using).filter(pk=product_id)
+    if lock:
+        rows = rows.select_for_update()
+    row = rows.values_list('category_id', 'inventory').first()
+    return (row[0], row[1] > 0) if row else None
+
+
+def touches_counts(update_fields):
+    """Whether a save limited to `update_fields` (None: all) can change a count."""
+    return update_fields is None or bool(COUNTED_FIELDS & set(update_fields))
+
+
+def delta(old, new):
+    """`{category_id: [d_total, d_in_stock]}` for a product going from state `old` to `new`.
+
+    None stands for "no product": a create has no old state, a delete no new one.
+    """
+    changes = defaultdict(lambda: [0, 0])
+    for state, sign in ((old, -1), (new, 1)):
+        if state is not None:
+            category_id, in_stock = state
+            changes[category_id][0] += sign
+            changes[category_id][1] += sign * in_stock
+    return {category_id: d for category_id, d in changes.items() if any(d)}
+
+
+def _invalidate():
+    # The category list is cached for a long time, so also bump once the
+    # change commits: a reader that cached the old counts between this bump
+    # and the commit would otherwise keep them until the next change.
+    def bump():
+        try:
+            catalog_cache.bump(catalog_cache.CATEGORIES_TAG)
+        except Exception:
+            pass
+    bump()
+    transaction.on_commit(bump)
+
+
+def apply_changes(changes):
+    """Add `{category_id: (d_total, d_in_stock)}` to the stored counts (one UPDATE per category)."""
+    if not changes:
+        return
+    now = timezone.now()
+    for category_id, (d_total, d_in_stock) in changes.items():
+        # relative updates compose with concurrent writers; never below zero
+        Category.objects.filter(pk=category_id).update(
+            product_count=Greatest(F('product_count') + d_total, 0),
+            in_stock_count=Greatest(F('in_stock_count') + d_in_stock, 0),
+            updated_at=now,
+        )
+    _invalidate()
+
+
+def drift(category_ids=None):
+    """`{category_id: ((stored total, in stock), (actual total, in stock))}` for categories whose counts are off.
+
+    One grouped query over categories and their products; `category_ids`
+    limits it to those categories.
+    """
+    categories = Category.objects.order_by()
+    if category_ids is not None:
+        category_ids = {pk for pk in category_ids if pk is not None}
+        if not category_ids:
+            return {}
+        categories = categories.filter(pk__in=category_ids)
+    rows = categories.annotate(
+        actual_total=Count('products'),
+        actual_in_stock=Count('products', filter=Q(products__inventory__gt=0)),
+    ).values_list('pk', 'product_count', 'in_stock_count', 'actual_total', 'actual_in_stock')
+    return {
+        pk: ((total, in_stock), (actual_total, actual_in_stock))
+        for pk, total, in_stock, actual_total, actual_in_stock in rows
+        if (total, in_stock) != (actual_total, actual_in_stock)
+    }
+
+
+def recount(category_ids=None):
+    """Recompute the counts of `category_ids` (None: every category) and fix the rows that drifted.
+
+    The category rows are locked before counting: a concurrent product write
+    either committed its relative update before the count (and is counted) or
+    waits for this transaction and applies it on top of the new value.
+    Returns what `drift()` found.
+    """
+    with transaction.atomic(savepoint=False):
+        categories = Category.objects.order_by('pk')
+        if category_ids is not None:
+            category_ids = {pk for pk in category_ids if pk is not None}
+            if not category_ids:
+                return {}
+            categories = categories.filter(pk__in=category_ids)
+        list(categories.select_for_update().values_list('pk', flat=True))
+        found = drift(category_ids)
+        if found:
+            now = timezone.now()
+            for pk, (_, (total, in_stock)) in found.items():
+                Category.objects.filter(pk=pk).update(product_count=total, in_stock_count=in_stock, updated_at=now)
+            _invalidate()
+    return found
+
+
+# --- receivers ----------------------------------------------------------------
+# Unlike the cache handlers in catalog/signals.py these are not best-effort:
+# the count update runs in the product write's transaction and fails with it.
+
+def remember_counted_state(sender, instance, **kwargs):
+    # what a loaded product counts for, to diff against on save or delete
+    instance._counted_state = count_state(instance)
+
+
+def load_counted_state(sender, instance, raw=False, update_fields=None, using=None, **kwargs):
+    # A product loaded with deferred category/inventory, or saved with an
+    # expression (`inventory = F('inventory') + n`): read what the row holds
+    # before the save overwrites it. The row stays locked until the save
+    # commits (`Product.save` is atomic), so no concurrent write slips in
+    # between this read and the one in update_category_counts_on_save.
+    if raw or instance._state.adding or not touches_counts(update_fields):
+        return
+    if getattr(instance, '_counted_state', None) is not None and count_state(instance) is not None:
+        return
+    instance._counted_state = row_state(instance.pk, using, lock=True)
+
+
+def update_category_counts_on_save(sender, instance, created=False, raw=False, update_fields=None, using=None,
+                                   **kwargs):
+    if raw or not touches_counts(update_fields):
+        # fixture loads are repaired with `reconcile_category_counts`
+        return
+    old = None if created else getattr(instance, '_counted_state', None)
+    new = count_state(instance)
+    if new is None:
+        # only the database knows the outcome of an expression: read it back
+        new = row_state(instance.pk, using)
+    if new is None or (old is None and not created):
+        recount({old[0] if old else None, new[0] if new else None, instance.__dict__.get('category_id')})
+    else:
+        apply_changes(delta(old, new))
+    instance._counted_state = new
+
+
+def update_category_counts_on_delete(sender, instance, origin=None, **kwargs):
+    # the category row goes with its products
+    if deleted_with_parent(origin, Category):
+        return
+    old = getattr(instance, '_counted_state', None)
+    if old is None:
+        recount([instance.__dict__.get('category_id')])
+    else:
+        apply_changes(delta(old, None))
+
+
+def recount_categories_on_bulk_change(sender, product_ids=(), category_ids=(), **kwargs):
+    # A bulk move only reaches the old category when the sender lists it in
+    # `category_ids`.
+    category_ids = set(category_ids)
+    if product_ids:
+        category_ids.update(Product.objects.filter(pk__in=list(product_ids)).values_list('category_id', flat=True))
+    recount(category_ids)
+
+
+def connect_signals():
+    """Connect the count receivers (from `CatalogConfig.ready()`)."""
+    post_init.connect(remember_counted_state, sender=Product)
+    pre_save.connect(load_counted_state, sender=Product)
+    post_save.connect(update_category_counts_on_save, sender=Product)
+    post_delete.connect(update_category_counts_on_delete, sender=Product)
+    products_bulk_changed.connect(recount_categories_on_bulk_change)
@@ -0,0 +1,147 @@
+"""Precomputed product read documents.
+
+Each product has a `ProductDocument` row holding its serialized representation.
+List/detail views read those rows instead of running `ProductSerializer` (and
+its image/variant lookups) per request; writes to products, images, variants
+and categories rebuild the affected documents (receivers at the end).
+
+Documents are stored without a request, so image URLs are kept relative and
+made absolute when a response is assembled.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .models import Category, Product, ProductDocument, ProductImage, ProductVariant
+from .serializers import PRODUCT_ROW_FIELDS, serialize_product_rows
+from .signals import deleted_with_parent, products_bulk_changed
+
+# number of products serialized per rebuild batch
+REBUILD_BATCH_SIZE = 500
+
+# fields to fetch for a list/detail page: the lean row plus its stored document
+# (`document__updated_at` feeds the conditional GET validators)
+PRODUCT_PAGE_FIELDS = PRODUCT_ROW_FIELDS + ('document__data', 'document__updated_at')
+
+
+def rebuild_documents(product_ids=None, batch_size=REBUILD_BATCH_SIZE):
+    """Rebuild documents for `product_ids` (all products when None).
+
+    Returns the number of documents written. Ids that no longer exist are
+    skipped; their documents were removed with the product row.
+    """
+    qs = Product.objects.order_by('pk').values(*PRODUCT_ROW_FIELDS)
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return 0
+        qs = qs.filter(pk__in=product_ids)
+
+    written = 0
+    last_pk = None
+    while True:
+        batch_qs = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+        rows = list(batch_qs[:batch_size])
+        if not rows:
+            break
+        docs = [ProductDocument(product_id=data['id'], data=data) for data in serialize_product_rows(rows)]
+        with transaction.atomic():
+            ProductDocument.objects.bulk_create(
+                docs,
+                update_conflicts=True,
+                unique_fields=['product'],
+                update_fields=['data', 'updated_at'],
+            )
+        written += len(docs)
+        last_pk = rows[-1]['id']
+    return written
+
+
+def render_document(data, request=None):
+    """Return a response-ready copy of a stored document."""
+    payload = dict(data)
+    image = payload.get('image')
+    if image and request is not None:
+        payload['image'] = request.build_absolute_uri(image)
+    return payload
+
+
+def product_payloads(rows, request=None):
+    """Render `.values(*PRODUCT_PAGE_FIELDS)` rows for a response.
+
+    Rows with a stored document are rendered from it directly; the rest (e.g.
+    products created through a bulk path that did not rebuild documents) go
+    through the lean row serializer in one batch.
+    """
+    rows = list(rows)
+    missing = [row for row in rows if row.get('document__data') is None]
+    fallback = {data['id']: data for data in serialize_product_rows(missing, request)} if missing else {}
+    payloads = []
+    for row in rows:
+        if row['id'] in fallback:
+            payloads.append(fallback[row['id']])
+        else:
+            payloads.append(render_document(row['document__data'], request))
+    return payloads
+
+
+def rows_for_ids(product_ids):
+    """`.values(*PRODUCT_PAGE_FIELDS)` rows for `product_ids`, in that order.
+
+    Ids that no longer exist are skipped.
+    """
+    rows = {row['id']: row for row in Product.objects.filter(pk__in=product_ids).values(*PRODUCT_PAGE_FIELDS)}
+    return [rows[pid] for pid in product_ids if pid in rows]
+
+
+# --- receivers ----------------------------------------------------------------
+# Rebuilds are best-effort like the cache handlers in catalog/signals.py: a
+# missing or stale document falls back to the live serializer and
+# `rebuild_product_documents` repairs it.
+
+def _rebuild_documents(product_ids):
+    try:
+        rebuild_documents(product_ids)
+    except Exception:
+        pass
+
+
+def rebuild_document_on_product_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _rebuild_documents([instance.pk])
+
+
+def rebuild_document_on_child_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _rebuild_documents([instance.product_id])
+
+
+def rebuild_document_on_child_delete(sender, instance, origin=None, **kwargs):
+    # When the product itself is being deleted its document goes with it.
+    if deleted_with_parent(origin, Product) or deleted_with_parent(origin, Category):
+        return
+    _rebuild_documents([instance.product_id])
+
+
+def rebuild_documents_on_category_save(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    _rebuild_documents(Product.objects.filter(category_id=instance.pk).values_list('pk', flat=True))
+
+
+def rebuild_documents_on_bulk_change(sender, product_ids=(), category_ids=(), **kwargs):
+    product_ids = set(product_ids)
+    if category_ids:
+        product_ids.update(Product.objects.filter(category_id__in=category_ids).values_list('pk', flat=True))
+    _rebuild_documents(product_ids)
+
+
+def connect_signals():
+    """Connect the document rebuild receivers (from `CatalogConfig.ready()`)."""
+    post_save.connect(rebuild_document_on_product_save, sender=Product)
+    for model in (ProductImage, ProductVariant):
+        post_save.connect(rebuild_document_on_child_save, sender=model)
+        post_delete.connect(rebuild_document_on_child_delete, sender=model)
+    post_save.connect(rebuild_documents_on_category_save, sender=Category)
+    products_bulk_changed.connect(rebuild_documents_on_bulk_change)
@@ -0,0 +1,123 @@
+"""Streaming catalog export (NDJSON or CSV, optionally gzipped).
+
+Products are read with `.iterator(chunk_size=...)` (a server-side cursor on
+PostgreSQL) and rendered one chunk at a time from their read documents, so
+variants and images come along without extra queries; products without a
+document cost two queries per chunk through the lean serializer. Output is
+produced as a generator of byte chunks, so memory stays flat regardless of
+catalog size, whether it is written to a file or streamed in an HTTP
+response.
+
+NDJSON has one product per line, shaped like the API's product payload. CSV
+has one row per variant (or one row for a product without variants).
+"""
+import csv
+import io
+import json
+import zlib
+
+from .documents import PRODUCT_PAGE_FIELDS, product_payloads
+from .models import Product
+
+DEFAULT_CHUNK_SIZE = 1000
+# Encoded output is handed out in pieces of roughly this size.
+FLUSH_BYTES = 64 * 1024
+FORMATS = ('ndjson', 'csv')
+
+CSV_COLUMNS = [
+    'product_id', 'slug', 'name', 'description', 'price', 'inventory', 'category_slug', 'category_name',
+    'image', 'images', 'created_at', 'updated_at',
+    'variant_sku', 'variant_name', 'variant_price', 'variant_inventory', 'variant_attributes',
+]
+
+
+def iter_products(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE, request=None):
+    """Yield product payloads, reading `chunk_size` rows at a time."""
+    queryset = Product.objects.all() if queryset is None else queryset
+    rows = queryset.order_by('pk').values(*PRODUCT_PAGE_FIELDS).iterator(chunk_size=chunk_size)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield from product_payloads(batch, request)
+            batch = []
+    if batch:
+        yield from product_payloads(batch, request)
+
+
+def _ndjson_lines(products):
+    for product in products:
+        yield json.dumps(product, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+def _csv_rows(product):
+    images = '|'.join(image['url'] for image in product['images'] if image['url'])
+    base = [
+        product['id'], product['slug'], product['name'], product['description'], product['price'],
+        product['inventory'], product['category']['slug'], product['category']['name'],
+        product['image'] or '', images, product['created_at'], product['updated_at'],
+    ]
+    if not product['variants']:
+        yield base + [''] * 5
+    for variant in product['variants']:
+        yield base + [
+            variant['sku'], variant['name'], variant['price'] or '', variant['inventory'],
+            json.dumps(variant['attributes'], separators=(',', ':'), ensure_ascii=False),
+        ]
+
+
+def _csv_lines(products):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for product in products:
+        for row in _csv_rows(product):
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _buffered(pieces):
+    """Encode text pieces to UTF-8 and group them into chunks of about FLUSH_BYTES."""
+    chunk, size = [], 0
+    for piece in pieces:
+        data = piece.encode('utf-8')
+        chunk.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            yield b''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for data in chunks:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(fmt='ndjson', compress=False, queryset=None, chunk_size=DEFAULT_CHUNK_SIZE, request=None):
+    """Yield the export as byte chunks."""
+    if fmt not in FORMATS:
+        raise ValueError(f'unsupported format: {fmt}')
+    products = iter_products(queryset, chunk_size=chunk_size, request=request)
+    lines = _csv_lines(products) if fmt == 'csv' else _ndjson_lines(products)
+    chunks = _buffered(lines)
+    return _gzipped(chunks) if compress else chunks
+
+
+def content_type(fmt, compress=False):
+    if compress:
+        return 'application/gzip'
+    return 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson'
+
+
+def filename(fmt, compress=False):
+    return f"catalog.{fmt}{'.gz' if compress else ''}"
@@ -0,0 +1,110 @@
+"""Facet counts for the product list (`?facets=1`).
+
+Facets are disjunctive: the category counts ignore the category filter and the
+price buckets ignore the price filter, so a client can show "other choices"
+next to the active one. Availability counts use every filter.
+
+Counts come from the columnar snapshot (catalog/columnar.py) when it is
+enabled, otherwise from the aggregate queries built here and the variant
+attribute counts of catalog/attributes.py.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .attributes import attribute_facets, attribute_params, parse_attribute_params
+from .filters import ProductFilter
+
+CATEGORY_PARAMS = ('category__id', 'category__slug')
+PRICE_PARAMS = ('min_price', 'max_price')
+
+
+def wants_facets(request):
+    return request.query_params.get('facets', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def price_edges():
+    """Bucket boundaries as Decimals; the last bucket is open-ended."""
+    return [Decimal(str(edge)) for edge in getattr(settings, 'CATALOG_PRICE_FACET_EDGES', [0, 10, 25, 50, 100])]
+
+
+def parse_price_bounds(params):
+    """Return `(min_price, max_price)` Decimals (or None) from query params."""
+    bounds = []
+    for name in PRICE_PARAMS:
+        value = params.get(name)
+        try:
+            bounds.append(Decimal(value) if value not in (None, '') else None)
+        except InvalidOperation:
+            raise ValueError(f'invalid {name}')
+    return tuple(bounds)
+
+
+def format_facets(category_counts, categories, price_counts, in_stock, out_of_stock):
+    """Build the `facets` block.
+
+    `category_counts` maps category id to count, `categories` maps id to
+    `(name, slug)`, and `price_counts` is aligned with `price_edges()`.
+    """
+    edges = price_edges()
+    category_facet = [
+        {'id': cid, 'name': categories[cid][0], 'slug': categories[cid][1], 'count': count}
+        for cid, count in category_counts.items() if count and cid in categories
+    ]
+    category_facet.sort(key=lambda c: (-c['count'], c['name']))
+    price_facet = [
+        {
+            'min': f'{edge:.2f}',
+            'max': f'{edges[i + 1]:.2f}' if i + 1 < len(edges) else None,
+            'count': price_counts[i],
+        }
+        for i, edge in enumerate(edges)
+    ]
+    return {
+        'categories': category_facet,
+        'price': price_facet,
+        'availability': {'in_stock': in_stock, 'out_of_stock': out_of_stock},
+    }
+
+
+def _without(params, names):
+    params = params.copy()
+    for name in names:
+        params.pop(name, None)
+    return params
+
+
+def database_facets(request, base):
+    """Facets from the database; `base` is the product queryset before ProductFilter."""
+    params = request.query_params
+    by_price = ProductFilter(_without(params, CATEGORY_PARAMS), queryset=base).qs.order_by()
+    by_category = ProductFilter(_without(params, PRICE_PARAMS), queryset=base).qs.order_by()
+    filtered = ProductFilter(params, queryset=base).qs.order_by()
+
+    rows = by_price.values('category_id', 'category__name', 'category__slug').annotate(count=Count('pk'))
+    category_counts = {row['category_id']: row['count'] for row in rows}
+    categories = {row['category_id']: (row['category__name'], row['category__slug']) for row in rows}
+
+    edges = price_edges()
+    buckets = {}
+    for i, edge in enumerate(edges):
+        condition = Q(price__gte=edge)
+        if i + 1 < len(edges):
+            condition &= Q(price__lt=edges[i + 1])
+        buckets[f'bucket_{i}'] = Count('pk', filter=condition)
+    price = by_category.aggregate(**buckets)
+
+    stock = filtered.aggregate(in_stock=Count('pk', filter=Q(inventory__gt=0)),
+                               out_of_stock=Count('pk', filter=Q(inventory=0)))
+    facets = format_facets(category_counts, categories, [price[f'bucket_{i}'] for i in range(len(edges))],
+                           stock['in_stock'], stock['out_of_stock'])
+    facets['attributes'] = database_attribute_facets(request, base)
+    return facets
+
+
+def database_attribute_facets(request, base):
+    """Variant attribute counts within every filter but the attribute filters themselves."""
+    params = request.query_params
+    products = ProductFilter(_without(params, attribute_params(params)), queryset=base).qs
+    return attribute_facets(products, parse_attribute_params(params))
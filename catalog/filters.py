@@ -1,5 +1,6 @@
 import django_filters
 from .models import Product
+from .attributes import filter_by_attributes, parse_attribute_params
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -9,3 +10,9 @@ class ProductFilter(django_filters.FilterSet):
     class Meta:
         model = Product
         fields = ['category__id', 'category__slug', 'min_price', 'max_price']
+
+    def filter_queryset(self, queryset):
+        # `attr_<name>=v1,v2` variant attribute filters (catalog/attributes.py)
+        # take any attribute name, so they are not declared filters
+        queryset = super().filter_queryset(queryset)
+        return filter_by_attributes(queryset, parse_attribute_params(self.data))
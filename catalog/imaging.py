@@ -0,0 +1,80 @@
+"""Image resizing for the rendition pipeline (see catalog/renditions.py).
+
+Plain Pillow code with no Django imports: `render` takes and returns bytes so
+it can run in a worker process.
+"""
+import base64
+import io
+
+from PIL import Image, ImageOps
+
+# width of the blurred placeholder embedded in payloads as a data URI
+PLACEHOLDER_WIDTH = 16
+# EXIF orientations that swap width and height
+ORIENTATION_TAG = 0x0112
+ROTATED = {5, 6, 7, 8}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+def _flatten(image):
+    """RGB copy of `image`, with transparency composited onto white."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _resize(image, width):
+    if width >= image.width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    # reducing_gap shrinks by an integer factor first, which is much cheaper
+    # than a full LANCZOS pass over a large source
+    return image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+
+
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, **{**SAVE_OPTIONS[fmt], **options})
+    return buffer.getvalue()
+
+
+def render(data, widths, formats):
+    """Render an encoded image into fixed-width renditions.
+
+    Returns `{'width', 'height', 'placeholder', 'files'}` where `files` maps
+    format to `{width: bytes}`. Widths at or above the source width are
+    skipped; a source narrower than every width gets one rendition at its own
+    size.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        width, height = source.size
+        if source.getexif().get(ORIENTATION_TAG) in ROTATED:
+            width, height = height, width
+        largest = max((w for w in widths if w > 0), default=width)
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale; keep both sides at
+        # least `largest` so the orientation does not matter
+        source.draft('RGB', (largest, largest))
+        image = _flatten(ImageOps.exif_transpose(source))
+
+    targets = sorted({w for w in widths if 0 < w < width}) or [image.width]
+    files = {fmt: {} for fmt in formats}
+    for target in targets:
+        resized = _resize(image, target)
+        for fmt in formats:
+            files[fmt][target] = _encode(resized, fmt)
+
+    placeholder_format = 'webp' if 'webp' in formats else 'jpeg'
+    placeholder = _encode(_resize(image, PLACEHOLDER_WIDTH), placeholder_format, quality=40)
+    return {
+        'width': width,
+        'height': height,
+        'placeholder': f'data:image/{placeholder_format};base64,{base64.b64encode(placeholder).decode("ascii")}',
+        'files': files,
+    }
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.bm25 import build_index, snapshot_path
+
+
+class Command(BaseCommand):
+    help = 'Build the in-process BM25 search index and write its snapshot for workers to load at boot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Snapshot file (defaults to CATALOG_SEARCH_INDEX_PATH)')
+
+    def handle(self, *args, **options):
+        path = options['path'] or snapshot_path()
+        if not path:
+            self.stderr.write('No snapshot path: pass --path or set CATALOG_SEARCH_INDEX_PATH.')
+            return
+        started = time.perf_counter()
+        index = build_index(path)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index)} products ({len(index.postings)} terms) in {elapsed:.2f}s -> {path}'))
@@ -0,0 +1,36 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import bulk
+
+
+class Command(BaseCommand):
+    help = 'Apply bulk price/inventory patches (NDJSON or CSV keyed by product slug or variant SKU).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Patch file, or - for stdin')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='Input format (defaults to the file extension, else ndjson)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows applied per UPDATE batch')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        try:
+            stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(str(exc))
+        started = time.perf_counter()
+        with stream:
+            report = bulk.apply_patches(bulk.iter_records(stream, fmt), chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']} ({error['key']}): {error['error']}")
+        if report.failed > len(report.errors):
+            self.stderr.write(f'... and {report.failed - len(report.errors)} more errors')
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.rows} rows in {elapsed:.2f}s: {report.updated} updated, '
+            f'{report.unchanged} unchanged, {report.failed} failed.'))
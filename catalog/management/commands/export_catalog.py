@@ -0,0 +1,51 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import export
+from catalog.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Stream the catalog to a file or stdout as NDJSON (one product per line) or CSV (one row per variant).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file, or - for stdout (default)')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='Output format (defaults to the file extension, else ndjson)')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output (implied by a .gz path)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Products read per database round trip')
+        parser.add_argument('--category', help='Only export products in this category slug')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        name = path.lower()
+        compress = options['gzip'] or name.endswith('.gz')
+        if name.endswith('.gz'):
+            name = name[:-3]
+        fmt = options['format'] or ('csv' if name.endswith('.csv') else 'ndjson')
+
+        queryset = Product.objects.all()
+        if options['category']:
+            queryset = queryset.filter(category__slug=options['category'])
+
+        try:
+            stream = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        except OSError as exc:
+            raise CommandError(str(exc))
+        started = time.perf_counter()
+        written = 0
+        try:
+            for chunk in export.export_chunks(fmt, compress=compress, queryset=queryset,
+                                              chunk_size=options['chunk_size']):
+                stream.write(chunk)
+                written += len(chunk)
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+            else:
+                stream.flush()
+        elapsed = time.perf_counter() - started
+        # keep stdout clean for the data when streaming to it
+        self.stderr.write(self.style.SUCCESS(f'Wrote {written} bytes of {fmt} in {elapsed:.2f}s.'))
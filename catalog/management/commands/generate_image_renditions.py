@@ -0,0 +1,68 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from catalog import renditions
+from catalog.models import Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+# longest pause after repeated errors in --loop mode
+MAX_ERROR_BACKOFF_SECONDS = 60
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG renditions for product images that do not have them yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that already exist')
+        parser.add_argument('--workers', type=int, help='Resizing processes (defaults to CATALOG_RENDITION_WORKERS)')
+        parser.add_argument('--only', choices=['products', 'images'],
+                            help='Only product main images or only gallery images')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new uploads (the worker for CATALOG_RENDITIONS_MODE=worker)')
+        parser.add_argument('--interval', type=float,
+                            help='Seconds between polls (defaults to CATALOG_RENDITIONS_POLL_SECONDS)')
+
+    def handle(self, *args, **options):
+        models = {'products': (Product,), 'images': (ProductImage,)}.get(options['only'], (Product, ProductImage))
+        if options['loop']:
+            if options['force']:
+                raise CommandError('--force would re-render every image on each pass; run it without --loop.')
+            self.poll(models, options)
+            return
+        started = time.perf_counter()
+        generated, failed = renditions.backfill(models, force=options['force'], workers=options['workers'],
+                                                report=self.stderr.write)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated renditions for {generated} images in {elapsed:.2f}s ({failed} failed).'))
+
+    def poll(self, models, options):
+        interval = options['interval']
+        if interval is None:
+            interval = getattr(settings, 'CATALOG_RENDITIONS_POLL_SECONDS', 10.0)
+        workers = options['workers'] or max(1, getattr(settings, 'CATALOG_RENDITION_WORKERS', 2))
+        # images that failed, retried once their source changes
+        skip = set()
+        errors = 0
+        with renditions.process_pool(workers) as pool:
+            while True:
+                try:
+                    generated, failed = renditions.backfill(models, workers=workers, report=self.stderr.write,
+                                                            pool=pool, skip=skip)
+                except Exception:
+                    errors += 1
+                    pause = min(max(interval, 1) * 2 ** errors, MAX_ERROR_BACKOFF_SECONDS)
+                    logger.exception('Rendition pass failed; retrying in %.0fs', pause)
+                    close_old_connections()
+                    time.sleep(pause)
+                    continue
+                errors = 0
+                if generated or failed:
+                    self.stdout.write(f'Generated renditions for {generated} images ({failed} failed).')
+                close_old_connections()
+                time.sleep(interval)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from catalog.documents import rebuild_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuild precomputed product read documents (all products, or the given ids).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int, help='Only rebuild these product ids')
+        parser.add_argument('--batch-size', type=int, default=500, help='Products serialized per batch')
+
+    def handle(self, *args, **options):
+        product_ids = options['product_ids'] or None
+        written = rebuild_documents(product_ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} product documents.'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from catalog import counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute Category.product_count / in_stock_count in one grouped query and fix drifted rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('category_ids', nargs='*', type=int, help='Only reconcile these category ids')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, **options):
+        category_ids = options['category_ids'] or None
+        found = (counts.drift if options['dry_run'] else counts.recount)(category_ids)
+        for pk, ((total, in_stock), (actual_total, actual_in_stock)) in sorted(found.items()):
+            self.stdout.write(f'category {pk}: products {total} -> {actual_total}, '
+                              f'in stock {in_stock} -> {actual_in_stock}')
+        verb = 'would fix' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'{len(found)} categories drifted; {verb} {len(found)}.'))
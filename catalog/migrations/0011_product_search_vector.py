@@ -0,0 +1,57 @@
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _add_search_vector(apps, schema_editor):
+    # Only apply when running against PostgreSQL; other databases fall back
+    # to SearchFilter (see catalog/search.py)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        # A stored generated column is kept current by PostgreSQL itself,
+        # including for bulk_create/raw COPY loads that bypass model signals.
+        # Adding it rewrites catalog_product under an ACCESS EXCLUSIVE lock;
+        # the GIN index is built without blocking writes in 0016.
+        cursor.execute(
+            "ALTER TABLE catalog_product ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+            ") STORED"
+        )
+
+
+def _remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("ALTER TABLE catalog_product DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_category_updated_at'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(_add_search_vector, _remove_search_vector),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='ProductSearchVector',
+                    fields=[
+                        ('product', models.OneToOneField(db_column='id', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_vector', serialize=False, to='catalog.product')),
+                        ('vector', django.contrib.postgres.search.SearchVectorField(db_column='search_vector', null=True)),
+                    ],
+                    options={
+                        'db_table': 'catalog_product',
+                        'managed': False,
+                    },
+                ),
+            ],
+        ),
+    ]
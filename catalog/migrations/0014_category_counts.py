@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:48
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def _backfill_counts(apps, schema_editor):
+    # one grouped query over products, then one update per non-empty category
+    Category = apps.get_model('catalog', 'Category')
+    Product = apps.get_model('catalog', 'Product')
+    rows = Product.objects.order_by().values('category_id').annotate(
+        total=Count('pk'), in_stock=Count('pk', filter=Q(inventory__gt=0)))
+    for row in rows:
+        Category.objects.filter(pk=row['category_id']).update(
+            product_count=row['total'], in_stock_count=row['in_stock'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='in_stock_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(_backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.30 on 2026-10-18 05:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+import json
+
+
+def _add_attributes_index(apps, schema_editor):
+    # jsonb containment (`attributes @> '{"size": "M"}'`) is indexed on PostgreSQL;
+    # other databases filter through the VariantAttribute table instead.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS catalog_variant_attributes_gin "
+            "ON catalog_productvariant USING GIN (attributes jsonb_path_ops)"
+        )
+
+
+def _remove_attributes_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX IF EXISTS catalog_variant_attributes_gin")
+
+
+def _backfill_attribute_rows(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+    ProductVariant = apps.get_model('catalog', 'ProductVariant')
+    VariantAttribute = apps.get_model('catalog', 'VariantAttribute')
+    rows = []
+    for pk, product_id, attributes in ProductVariant.objects.values_list('pk', 'product_id', 'attributes').iterator():
+        if not isinstance(attributes, dict):
+            continue
+        for name, value in attributes.items():
+            # same spelling as catalog.attributes.text_value
+            if isinstance(value, (dict, list)) or value is None or len(name) > 64:
+                continue
+            value = value if isinstance(value, str) else json.dumps(value)
+            if len(value) <= 255:
+                rows.append(VariantAttribute(variant_id=pk, product_id=product_id, name=name, value=value))
+    VariantAttribute.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_category_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariantAttribute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('value', models.CharField(max_length=255)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.product')),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attribute_values', to='catalog.productvariant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'value', 'variant'], name='catalog_var_name_948945_idx'), models.Index(fields=['product', 'name', 'value'], name='catalog_var_product_a375bd_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='variantattribute',
+            constraint=models.UniqueConstraint(fields=('variant', 'name'), name='catalog_variantattr_variant_name_uniq'),
+        ),
+        migrations.RunPython(_add_attributes_index, _remove_attributes_index),
+        migrations.RunPython(_backfill_attribute_rows, migrations.RunPython.noop),
+    ]
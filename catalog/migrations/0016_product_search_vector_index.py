@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def _add_search_vector_index(apps, schema_editor):
+    # CONCURRENTLY builds the index without blocking writes to catalog_product,
+    # which is why this migration is not atomic.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        # a failed concurrent build leaves an invalid index behind; IF NOT EXISTS would keep it
+        cursor.execute(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = 'catalog_product_search_vector_idx' AND NOT i.indisvalid"
+        )
+        if cursor.fetchone():
+            cursor.execute("DROP INDEX CONCURRENTLY catalog_product_search_vector_idx")
+        cursor.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS catalog_product_search_vector_idx "
+            "ON catalog_product USING GIN (search_vector)"
+        )
+
+
+def _remove_search_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS catalog_product_search_vector_idx")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('catalog', '0015_variant_attributes'),
+    ]
+
+    operations = [
+        migrations.RunPython(_add_search_vector_index, _remove_search_vector_index),
+    ]
@@ -1,8 +1,14 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 
 class Category(models.Model):
     name = models.CharField(max_length=128, unique=True)
     slug = models.SlugField(max_length=128, unique=True)
+    # drives Last-Modified/ETag validators for category responses
+    updated_at = models.DateTimeField(auto_now=True)
+    # denormalized, maintained by catalog/counts.py; `reconcile_category_counts` repairs drift
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    in_stock_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['name']
@@ -22,6 +28,43 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     image = models.ImageField(upload_to='products/', null=True, blank=True)  # optional product image stored under MEDIA_ROOT/products/
+    # filled in by the rendition pipeline (catalog/renditions.py) after an upload
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        # Keyset pagination seeks on (sort key, id) for each ordering the list
+        # allows, with and without a category filter (see ProductCursorPagination).
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['name', 'id']),
+            models.Index(fields=['category', 'created_at', 'id']),
+            models.Index(fields=['category', 'price', 'id']),
+            models.Index(fields=['category', 'name', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # the category count update in post_save (catalog/counts.py) commits with the row
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class ProductSearchVector(models.Model):
+    """The PostgreSQL-only `catalog_product.search_vector` column (migration 0011).
+
+    A stored generated column cannot be written, so it is not a `Product`
+    field; this unmanaged model maps it for `catalog/search.py`, which joins
+    it by primary key. Other databases do not have the column.
+    """
+    product = models.OneToOneField(Product, primary_key=True, db_column='id', related_name='search_vector',
+                                   on_delete=models.DO_NOTHING)
+    vector = SearchVectorField(db_column='search_vector', null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'catalog_product'
 
 
 class ProductImage(models.Model):
@@ -29,6 +72,10 @@ class ProductImage(models.Model):
     image = models.ImageField(upload_to='products/images/')
     alt = models.CharField(max_length=255, blank=True)
     order = models.PositiveIntegerField(default=0)
+    # filled in by the rendition pipeline (catalog/renditions.py) after an upload
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         ordering = ['order']
@@ -58,3 +105,43 @@ class ProductVariant(models.Model):
             models.Index(fields=['product']),
         ]
         ordering = ['sku']
+
+
+class VariantAttribute(models.Model):
+    """One name/value pair of `ProductVariant.attributes`, for attribute filters on
+    databases that cannot index JSON (see catalog/attributes.py). Kept in sync by
+    catalog signals; unused (and empty) on PostgreSQL.
+    """
+    variant = models.ForeignKey(ProductVariant, related_name='attribute_values', on_delete=models.CASCADE)
+    # denormalized from the variant so facet counts skip a join
+    product = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    name = models.CharField(max_length=64)
+    value = models.CharField(max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['variant', 'name'], name='catalog_variantattr_variant_name_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['name', 'value', 'variant']),
+            models.Index(fields=['product', 'name', 'value']),
+        ]
+
+    def __str__(self):
+        return f"{self.name}={self.value} ({self.variant_id})"
+
+
+class ProductDocument(models.Model):
+    """Denormalized read model for a product.
+
+    `data` holds the product exactly as the catalog API renders it (category,
+    images and variants embedded) so list/detail responses can be assembled
+    from one row per product. Documents are rebuilt from catalog signals on
+    writes; `python manage.py rebuild_product_documents` backfills them.
+    """
+    product = models.OneToOneField(Product, related_name='document', on_delete=models.CASCADE, primary_key=True)
+    data = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Document for product {self.product_id}"
@@ -1,9 +1,151 @@
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import CursorPagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Product
+from .search import SEARCH_RANK, is_ranked
+
+
+class KeysetCursor:
+    """Position after (or, when `reverse`, before) the row `(value, pk)` for `ordering`."""
+
+    def __init__(self, ordering, value, pk, reverse=False):
+        self.ordering = ordering
+        self.value = value
+        self.pk = pk
+        self.reverse = reverse
 
 
 class ProductCursorPagination(CursorPagination):
+    """Keyset pagination on `(sort key, id)`.
+
+    Each page is fetched with `WHERE (key, id) > (last key, last id) ORDER BY
+    key, id LIMIT n` (mirrored for descending orderings and for `previous`
+    links), so the cost of a page does not depend on how deep it is and rows
+    sharing a sort key are never skipped or repeated. The composite indexes on
+    Product back each allowed ordering, with and without a category filter.
+
+    Only the first ordering field is used as the sort key; `id` always breaks
+    ties in the same direction.
+    """
     page_size = 10
     # allow clients to control page size using the `limit` query param (keeps compatibility
     # with previous LimitOffset clients/tests)
     page_size_query_param = 'limit'
     ordering = '-created_at'
+
+    def get_ordering(self, request, queryset, view):
+        # Full-text search results are ordered by relevance unless the client
+        # asked for an explicit ordering.
+        if is_ranked(queryset) and not request.query_params.get(api_settings.ORDERING_PARAM):
+            return ('-' + SEARCH_RANK,)
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.sort_field = self.ordering[0]
+        self.cursor = self.decode_cursor(request)
+
+        descending = self.sort_field.startswith('-')
+        key = self.sort_field.lstrip('-')
+        reverse = self.cursor is not None and self.cursor.reverse
+        # walk backwards from the cursor for `previous` pages
+        scan_descending = descending != reverse
+        prefix = '-' if scan_descending else ''
+        queryset = queryset.order_by(prefix + key, prefix + 'id') if key != 'id' else queryset.order_by(prefix + 'id')
+        if self.cursor is not None:
+            queryset = self.seek(queryset, key, self.cursor.value, self.cursor.pk, scan_descending)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        if not self.page:
+            self.has_next = self.has_previous = False
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def seek(self, queryset, key, value, pk, descending):
+        """Rows strictly after `(value, pk)` in the scan direction."""
+        op = 'lt' if descending else 'gt'
+        if not isinstance(queryset, QuerySet):
+            return queryset.seek(key, value, pk, descending)
+        if key == 'id':
+            return queryset.filter(**{f'pk__{op}': pk})
+        # `key <= value` (or `>=`) leads so the composite index bounds the scan;
+        # the OR only has to skip the rows that share `value`.
+        return queryset.filter(Q(**{f'{key}__{op}e': value})).filter(
+            Q(**{f'{key}__{op}': value}) | Q(**{f'pk__{op}': pk}))
+
+    def _position(self, row):
+        key = self.sort_field.lstrip('-')
+        if isinstance(row, dict):
+            return row[key], row['id']
+        return getattr(row, key), row.pk
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        value, pk = self._position(self.page[-1])
+        return self.encode_cursor(KeysetCursor(self.sort_field, value, pk, reverse=False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        value, pk = self._position(self.page[0])
+        return self.encode_cursor(KeysetCursor(self.sort_field, value, pk, reverse=True))
+
+    def encode_cursor(self, cursor):
+        tokens = {'o': cursor.ordering, 'v': str(cursor.value), 'i': str(cursor.pk)}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        encoded = b64encode(parse.urlencode(tokens, doseq=True).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            ordering = tokens['o'][0]
+            value = tokens['v'][0]
+            pk = int(tokens['i'][0])
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError, KeyError, IndexError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        # a cursor only makes sense for the ordering it was issued for
+        if ordering != self.sort_field:
+            raise NotFound(self.invalid_cursor_message)
+        return KeysetCursor(ordering, self._clean_value(ordering.lstrip('-'), value), pk, reverse)
+
+    def _clean_value(self, key, value):
+        # Reject values the database would choke on before they reach a query.
+        try:
+            if key == SEARCH_RANK:
+                return float(value)
+            field = Product._meta.get_field(key)
+            return field.to_python(value)
+        except (FieldDoesNotExist, ValidationError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,303 @@
+"""Resized renditions of product images.
+
+Every `Product.image` and `ProductImage.image` gets fixed-width WebP/JPEG
+copies (CATALOG_RENDITION_WIDTHS x CATALOG_RENDITION_FORMATS, never wider
+than the source), a tiny inline placeholder and its width/height. The source
+row stores them in a JSON field:
+
+    {"source": "products/kettle.jpg", "placeholder": "data:image/webp;base64,...",
+     "files": {"webp": {"320": "products/renditions/kettle-320w.webp", ...}, "jpeg": {...}}}
+
+`source` records which upload the files were made from, so renditions of a
+replaced image are never served. Payloads expose them as a srcset map (see
+`rendition_map`).
+
+Uploads are picked up by `schedule_renditions_on_save` once the write commits, and
+CATALOG_RENDITIONS_MODE decides where they are rendered:
+
+- 'inline' (default): right there, in the process that saved the upload.
+- 'worker': nowhere in the web process. `generate_image_renditions --loop`
+  polls for images whose renditions are missing or stale, so nothing is lost
+  when a web worker is recycled. It needs the web service's media storage.
+- 'pool': a process pool fed by a few dispatcher threads inside each web
+  worker. Every gunicorn worker starts its own CATALOG_RENDITION_WORKERS
+  interpreters, and queued work dies with the worker, so this is opt-in.
+
+`generate_image_renditions` without `--loop` backfills existing media.
+"""
+import logging
+import multiprocessing
+import posixpath
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+
+from . import imaging
+from .models import Product, ProductImage
+from .signals import products_bulk_changed
+
+logger = logging.getLogger(__name__)
+
+# model -> (image field, width field, height field, renditions field)
+SOURCES = {
+    Product: ('image', 'image_width', 'image_height', 'image_renditions'),
+    ProductImage: ('image', 'width', 'height', 'renditions'),
+}
+
+_lock = threading.Lock()
+_dispatcher = None
+_pool = None
+
+
+def widths():
+    return list(getattr(settings, 'CATALOG_RENDITION_WIDTHS', [160, 320, 640, 1024]))
+
+
+def formats():
+    return [fmt for fmt in getattr(settings, 'CATALOG_RENDITION_FORMATS', ['webp', 'jpeg']) if fmt in imaging.EXTENSIONS]
+
+
+def rendition_name(source, width, fmt):
+    """`products/kettle.jpg` -> `products/renditions/kettle-320w.webp`."""
+    directory, filename = posixpath.split(source)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'renditions', f'{stem}-{width}w.{imaging.EXTENSIONS[fmt]}')
+
+
+def is_current(renditions, source):
+    return bool(source) and bool(renditions) and renditions.get('source') == source
+
+
+def rendition_map(renditions, source, width, height, storage):
+    """Payload for an image's renditions, or None until they exist for `source`.
+
+    `srcset` holds one `srcset` attribute value per format, smallest first.
+    """
+    if not is_current(renditions, source):
+        return None
+    srcset = {}
+    for fmt, files in renditions.get('files', {}).items():
+        ordered = sorted(files.items(), key=lambda item: int(item[0]))
+        srcset[fmt] = ', '.join(f'{storage.url(name)} {w}w' for w, name in ordered)
+    return {'width': width, 'height': height, 'placeholder': renditions.get('placeholder'), 'srcset': srcset}
+
+
+def thumbnail_url(renditions, source, storage, fmt='jpeg'):
+    """URL of the smallest `fmt` rendition, or None."""
+    if not is_current(renditions, source):
+        return None
+    files = renditions.get('files', {}).get(fmt)
+    if not files:
+        return None
+    return storage.url(files[min(files, key=int)])
+
+
+def needs_renditions(instance):
+    image_field, _, _, renditions_field = SOURCES[type(instance)]
+    source = getattr(instance, image_field).name
+    return bool(source) and not is_current(getattr(instance, renditions_field), source)
+
+
+def _storage(model):
+    return model._meta.get_field(SOURCES[model][0]).storage
+
+
+def _load(model, pk, force=False):
+    """Return `(source, old renditions, product id, bytes)`, or None when there is nothing to do."""
+    image_field, _, _, renditions_field = SOURCES[model]
+    fields = [image_field, renditions_field] + (['product_id'] if model is ProductImage else [])
+    row = model.objects.filter(pk=pk).values(*fields).first()
+    if row is None or not row[image_field]:
+        return None
+    source = row[image_field]
+    if not force and is_current(row[renditions_field], source):
+        return None
+    with _storage(model).open(source, 'rb') as fh:
+        data = fh.read()
+    return source, row[renditions_field] or {}, row.get('product_id', pk), data
+
+
+def _delete_files(storage, renditions):
+    for files in renditions.get('files', {}).values():
+        for name in files.values():
+            try:
+                storage.delete(name)
+            except Exception:
+                pass
+
+
+def _store(model, pk, loaded, result):
+    """Save rendered files and record them on the row; returns True if the row took them."""
+    source, old, product_id, _ = loaded
+    image_field, width_field, height_field, renditions_field = SOURCES[model]
+    storage = _storage(model)
+    files = {}
+    for fmt, by_width in result['files'].items():
+        files[fmt] = {str(width): storage.save(rendition_name(source, width, fmt), ContentFile(content))
+                      for width, content in by_width.items()}
+    renditions = {'source': source, 'placeholder': result['placeholder'], 'files': files}
+    # only if the row still points at the image we rendered
+    updated = model.objects.filter(pk=pk, **{image_field: source}).update(**{
+        width_field: result['width'], height_field: result['height'], renditions_field: renditions})
+    _delete_files(storage, old if updated else renditions)
+    if updated:
+        # rebuilds the product's document and drops cached pages
+        products_bulk_changed.send(sender=model, product_ids=[product_id])
+    return bool(updated)
+
+
+def generate(model, pk, force=False, pool=None):
+    """Render and store renditions for one row, in `pool` when given.
+
+    Returns True when new renditions were recorded.
+    """
+    loaded = _load(model, pk, force)
+    if loaded is None:
+        return False
+    args = (loaded[3], widths(), formats())
+    result = pool.submit(imaging.render, *args).result() if pool is not None else imaging.render(*args)
+    return _store(model, pk, loaded, result)
+
+
+def _executors():
+    global _dispatcher, _pool
+    with _lock:
+        if _pool is None:
+            workers = max(1, getattr(settings, 'CATALOG_RENDITION_WORKERS', 2))
+            _pool = process_pool(workers)
+            _dispatcher = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='renditions')
+        return _dispatcher, _pool
+
+
+def shutdown(wait=True):
+    global _dispatcher, _pool
+    with _lock:
+        dispatcher, pool, _dispatcher, _pool = _dispatcher, _pool, None, None
+    if dispatcher is not None:
+        dispatcher.shutdown(wait=wait)
+        pool.shutdown(wait=wait)
+
+
+def _run(model, pk, pool=None):
+    if pool is not None:
+        # dispatcher threads hold their own database connections
+        close_old_connections()
+    try:
+        generate(model, pk, pool=pool)
+    except Exception:
+        logger.exception('rendering %s %s failed', model._meta.label, pk)
+    finally:
+        if pool is not None:
+            close_old_connections()
+
+
+def mode():
+    return getattr(settings, 'CATALOG_RENDITIONS_MODE', 'inline')
+
+
+def schedule(model, pk):
+    """Generate renditions for a newly saved upload as CATALOG_RENDITIONS_MODE says."""
+    if not getattr(settings, 'CATALOG_RENDITIONS_ENABLED', True):
+        return
+    current = mode()
+    if current == 'worker':
+        # picked up by `generate_image_renditions --loop`
+        return
+    if current != 'pool':
+        _run(model, pk)
+        return
+    dispatcher, pool = _executors()
+    dispatcher.submit(_run, model, pk, pool)
+
+
+def process_pool(workers):
+    # spawn: forking a threaded web worker would copy its locks and
+    # database connections into the children
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def backfill(models=(Product, ProductImage), force=False, workers=None, report=None, pool=None, skip=None):
+    """Render missing (or, with `force`, all) renditions for `models`.
+
+    Database and storage work stays on the calling thread; only resizing is
+    sent to a process pool (`pool`, else one for this call), with at most two
+    jobs per worker in flight. Images that fail are added to the `skip` set
+    as `(model, pk, source)` and passed over while in it.
+    Returns `(generated, failed)`.
+    """
+    workers = workers or max(1, getattr(settings, 'CATALOG_RENDITION_WORKERS', 2))
+    if pool is None:
+        with process_pool(workers) as pool:
+            return backfill(models, force, workers, report, pool, skip)
+    skip = set() if skip is None else skip
+    generated = failed = 0
+    args = (widths(), formats())
+    pending = {}
+
+    def drain(block):
+        nonlocal generated, failed
+        done, _ = wait(pending, return_when=FIRST_COMPLETED) if block else (
+            [future for future in pending if future.done()], None)
+        for future in done:
+            model, pk, loaded = pending.pop(future)
+            try:
+                generated += _store(model, pk, loaded, future.result())
+            except Exception as exc:
+                failed += 1
+                skip.add((model, pk, loaded[0]))
+                if report:
+                    report(f'{model._meta.label} {pk}: {exc}')
+
+    for model in models:
+        image_field, _, _, renditions_field = SOURCES[model]
+        # only the recorded source, not the whole renditions map
+        rows = model.objects.exclude(**{image_field: ''}).exclude(**{f'{image_field}__isnull': True}).order_by(
+            'pk').values_list('pk', image_field, f'{renditions_field}__source').iterator()
+        # collect ids first: rows are updated while we go
+        todo = [(pk, source) for pk, source, rendered in rows
+                if (force or rendered != source) and (model, pk, source) not in skip]
+        for pk, source in todo:
+            try:
+                loaded = _load(model, pk, force=True)
+            except Exception as exc:
+                failed += 1
+                skip.add((model, pk, source))
+                if report:
+                    report(f'{model._meta.label} {pk}: {exc}')
+                continue
+            if loaded is None:
+                continue
+            pending[pool.submit(imaging.render, loaded[3], *args)] = (model, pk, loaded)
+            while len(pending) >= workers * 2:
+                drain(block=True)
+            drain(block=False)
+    while pending:
+        drain(block=True)
+    return generated, failed
+
+
+# --- receivers ----------------------------------------------------------------
+# A new or replaced upload gets resized copies once the write commits; the
+# pipeline records them with a queryset update, so this does not fire again
+# for its own writes.
+
+def schedule_renditions_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        if not needs_renditions(instance):
+            return
+    except Exception:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: schedule(sender, pk))
+
+
+def connect_signals():
+    """Connect the rendition receiver (from `CatalogConfig.ready()`)."""
+    for model in (Product, ProductImage):
+        post_save.connect(schedule_renditions_on_save, sender=model)
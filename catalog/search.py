@@ -0,0 +1,78 @@
+"""Product search backends.
+
+On PostgreSQL, `?search=` is answered from the `search_vector` column added by
+migration 0011: a stored, generated `tsvector` (name weighted A, description
+weighted B) with a GIN index (migration 0016), mapped to the ORM by
+`ProductSearchVector`. The query string is parsed with
+`websearch_to_tsquery`, so quoted phrases, `or` and `-term` work as users
+expect, and results are ranked with `ts_rank`. Other databases keep DRF's
+`SearchFilter` (`icontains` over `search_fields`).
+"""
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from rest_framework.filters import SearchFilter
+
+# Must match the configuration used by the generated column in migration 0011.
+SEARCH_CONFIG = 'english'
+SEARCH_RANK = 'search_rank'
+
+
+def full_text_search_enabled():
+    return connection.vendor == 'postgresql' and getattr(settings, 'CATALOG_FULL_TEXT_SEARCH', True)
+
+
+def search_products(queryset, text):
+    """Filter `queryset` to products matching `text`, annotated with `search_rank`."""
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    # ts_rank returns a float4; casting to float8 keeps the value exact through
+    # the cursor pagination round trip (str -> float -> SQL parameter).
+    rank = Cast(SearchRank(F('search_vector__vector'), query), FloatField())
+    return queryset.filter(search_vector__vector=query).annotate(**{SEARCH_RANK: rank})
+
+
+def is_ranked(queryset):
+    query = getattr(queryset, 'query', None)
+    return query is not None and SEARCH_RANK in query.annotations
+
+
+class ProductSearchFilter(SearchFilter):
+    """`SearchFilter` that uses the full-text index on PostgreSQL."""
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').replace('\x00', '').strip()
+        if not text or not full_text_search_enabled():
+            return super().filter_queryset(request, queryset, view)
+        return search_products(queryset, text)
+
+
+class BM25SearchFilter(SearchFilter):
+    """`?search=` answered from the in-process BM25 index (catalog/bm25.py).
+
+    Meant for SQLite deployments, where `SearchFilter` can only run unranked
+    `LIKE` scans. Matches are ranked by BM25 score; the best
+    `CATALOG_SEARCH_MAX_RESULTS` are returned.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        from .bm25 import get_index
+
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        limit = getattr(settings, 'CATALOG_SEARCH_MAX_RESULTS', 500)
+        hits = get_index().search(text, limit=limit)
+        if not hits:
+            return queryset.none()
+        rank = Case(*(When(pk=pk, then=Value(score)) for pk, score in hits),
+                    default=Value(0.0), output_field=FloatField())
+        return queryset.filter(pk__in=[pk for pk, _ in hits]).annotate(**{SEARCH_RANK: rank})
+
+
+def product_search_backend():
+    """Filter backend used for `?search=` on the product list."""
+    if getattr(settings, 'CATALOG_SEARCH_BACKEND', 'auto') == 'bm25':
+        return BM25SearchFilter
+    return ProductSearchFilter
@@ -1,26 +1,126 @@
 from rest_framework import serializers
 from .models import Category, Product
 from .models import ProductImage, ProductVariant
+from .renditions import rendition_map
 
 class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'slug', 'product_count', 'in_stock_count']
+        read_only_fields = ['product_count', 'in_stock_count']
+
+
+class CategorySummarySerializer(serializers.ModelSerializer):
+    """The category as embedded in product payloads (no counts)."""
+
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug']
 
 
 class ProductSerializer(serializers.ModelSerializer):
-    category = CategorySerializer(read_only=True)
+    category = CategorySummarySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), write_only=True, source='category')
     image = serializers.ImageField(required=False, allow_null=True)
+    image_renditions = serializers.SerializerMethodField()
     images = serializers.SerializerMethodField()
     variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'slug', 'description', 'price', 'inventory', 'category', 'category_id', 'image', 'images', 'variants', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'slug', 'description', 'price', 'inventory', 'category', 'category_id', 'image', 'image_renditions', 'images', 'variants', 'created_at', 'updated_at']
+
+    def get_image_renditions(self, obj):
+        return rendition_map(obj.image_renditions, obj.image.name, obj.image_width, obj.image_height, obj.image.storage)
 
     def get_images(self, obj):
-        return [{'id': i.id, 'url': i.image.url if i.image else None, 'alt': i.alt, 'order': i.order} for i in obj.images.all()]
+        return [{'id': i.id, 'url': i.image.url if i.image else None, 'alt': i.alt, 'order': i.order,
+                 'renditions': rendition_map(i.renditions, i.image.name, i.width, i.height, i.image.storage)}
+                for i in obj.images.all()]
 
     def get_variants(self, obj):
         return [{'id': v.id, 'sku': v.sku, 'name': v.name, 'price': str(v.price) if v.price is not None else None, 'inventory': v.inventory, 'attributes': v.attributes} for v in obj.variants.all()]
+
+
+# --- lean read path ----------------------------------------------------------
+# `serialize_product_rows` renders the same JSON shape as ProductSerializer from
+# `.values()` rows without building model instances. Images and variants for the
+# whole page are fetched in one query each and grouped by product id, so the
+# query count does not grow with the page size.
+
+PRODUCT_ROW_FIELDS = (
+    'id', 'name', 'slug', 'description', 'price', 'inventory',
+    'category_id', 'category__name', 'category__slug',
+    'image', 'image_width', 'image_height', 'image_renditions', 'created_at', 'updated_at',
+)
+
+_price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+_datetime_field = serializers.DateTimeField()
+
+
+def _file_url(model, field_name, name):
+    if not name:
+        return None
+    return model._meta.get_field(field_name).storage.url(name)
+
+
+def _group_by_product(rows):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.pop('product_id'), []).append(row)
+    return grouped
+
+
+def _renditions(model, field_name, renditions, name, width, height):
+    return rendition_map(renditions, name, width, height, model._meta.get_field(field_name).storage)
+
+
+def _image_payload(row):
+    return {'id': row['id'], 'url': _file_url(ProductImage, 'image', row['image']), 'alt': row['alt'], 'order': row['order'],
+            'renditions': _renditions(ProductImage, 'image', row['renditions'], row['image'], row['width'], row['height'])}
+
+
+def _variant_payload(row):
+    price = row['price']
+    return {'id': row['id'], 'sku': row['sku'], 'name': row['name'], 'price': str(price) if price is not None else None,
+            'inventory': row['inventory'], 'attributes': row['attributes']}
+
+
+def serialize_product_rows(rows, request=None):
+    """Serialize product `.values(*PRODUCT_ROW_FIELDS)` rows like ProductSerializer.
+
+    Runs two queries (images, variants) for the whole batch. When `request` is
+    given the product image URL is made absolute, matching the ImageField output.
+    """
+    rows = list(rows)
+    ids = [row['id'] for row in rows]
+    images = {}
+    variants = {}
+    if ids:
+        images = _group_by_product(ProductImage.objects.filter(product_id__in=ids).values(
+            'id', 'product_id', 'image', 'alt', 'order', 'width', 'height', 'renditions'))
+        variants = _group_by_product(ProductVariant.objects.filter(product_id__in=ids).values(
+            'id', 'product_id', 'sku', 'name', 'price', 'inventory', 'attributes'))
+
+    payloads = []
+    for row in rows:
+        image = _file_url(Product, 'image', row['image'])
+        if image and request is not None:
+            image = request.build_absolute_uri(image)
+        payloads.append({
+            'id': row['id'],
+            'name': row['name'],
+            'slug': row['slug'],
+            'description': row['description'],
+            'price': _price_field.to_representation(row['price']),
+            'inventory': row['inventory'],
+            'category': {'id': row['category_id'], 'name': row['category__name'], 'slug': row['category__slug']},
+            'image': image,
+            'image_renditions': _renditions(Product, 'image', row['image_renditions'], row['image'],
+                                            row['image_width'], row['image_height']),
+            'images': [_image_payload(i) for i in images.get(row['id'], [])],
+            'variants': [_variant_payload(v) for v in variants.get(row['id'], [])],
+            'created_at': _datetime_field.to_representation(row['created_at']),
+            'updated_at': _datetime_field.to_representation(row['updated_at']),
+        })
+    return payloads
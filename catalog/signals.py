@@ -1,52 +1,154 @@
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from django.core.cache import cache, caches
-from django.conf import settings
+"""Catalog signals and cache invalidation.
 
-from .models import Product
+This module defines `products_bulk_changed` and keeps the tag cache
+(catalog/cache.py) current. The other features that follow product writes
+connect their own receivers next to their code: category counts
+(catalog/counts.py), read documents (catalog/documents.py), the BM25 index
+(catalog/bm25.py), the columnar snapshot (catalog/columnar.py), image
+renditions (catalog/renditions.py) and variant attribute rows
+(catalog/attributes.py). `CatalogConfig.ready()` connects them all.
+"""
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import Signal
 
-# helper to compute cache keys used by ProductViewSet
-def _product_list_key_for_request_path(path):
-    return f"product:list:{path}"
+from . import cache as catalog_cache
+from .models import Category, Product, ProductImage, ProductVariant
 
-def _product_detail_key(product_id):
-    return f"product:detail:{product_id}"
+# Sent by bulk write paths (bulk_create, queryset.update, raw inserts) that
+# bypass per-row model signals. Keyword arguments:
+#   product_ids  -- ids of products created/updated (or whose images/variants changed)
+#   category_ids -- ids of categories whose membership or data changed (optional)
+products_bulk_changed = Signal()
 
-@receiver(post_save, sender=Product)
-def clear_product_cache_on_save(sender, instance, **kwargs):
-    """Clear product-related cache when a product is created or updated."""
-    try:
-        # Targeted invalidation: remove product detail for this id and any list pages
-        # Note: we can't enumerate all list keys easily; remove a few common variants.
-        cache.delete(_product_detail_key(instance.pk))
-        # remove root list and possible filtered variants by prefix if backend supports it
+
+def deleted_with_parent(origin, parent_model):
+    """True when a row is being removed by a cascade from `parent_model`."""
+    if isinstance(origin, parent_model):
+        return True
+    return getattr(origin, 'model', None) is parent_model
+
+
+def invalidation_tags(product_ids=(), category_ids=()):
+    """The cache tags covering `product_ids` and `category_ids`.
+
+    Always includes the catalog-wide tag since unfiltered list pages may
+    contain any product. Costs one query (category slugs).
+    """
+    tags = [catalog_cache.CATALOG_TAG]
+    tags.extend(catalog_cache.product_tag(pid) for pid in product_ids)
+    category_ids = {cid for cid in category_ids if cid is not None}
+    for cid in category_ids:
+        tags.extend(catalog_cache.category_tags(cid))
+    if category_ids:
+        for cid, slug in Category.objects.filter(pk__in=category_ids).values_list('pk', 'slug'):
+            tags.extend(catalog_cache.category_tags(cid, slug))
+    return tags
+
+
+def invalidate_products(product_ids=(), category_ids=()):
+    """Bump the cache tags covering `product_ids` and `category_ids` (one `incr` per tag)."""
+    catalog_cache.bump(*invalidation_tags(product_ids, category_ids))
+
+
+def _bump(tags):
+    # Best-effort: do not raise in signal handlers. Inside a transaction bump
+    # again once it commits: a reader that cached the pre-commit rows against
+    # the first bump would otherwise keep serving them (as catalog/counts.py).
+    def bump():
         try:
-            default_cache = caches['default']
-            if hasattr(default_cache, 'delete_pattern'):
-                # django-redis supports delete_pattern
-                default_cache.delete_pattern('product:list:*')
-            else:
-                # Best-effort: delete common root key
-                cache.delete(_product_list_key_for_request_path('/api/products/'))
+            catalog_cache.bump(*tags)
         except Exception:
-            # Fallback to deleting the root key
-            cache.delete(_product_list_key_for_request_path('/api/products/'))
+            pass
+    in_transaction = transaction.get_connection().in_atomic_block
+    bump()
+    if in_transaction:
+        transaction.on_commit(bump)
+
+
+def _invalidate(product_ids=(), category_ids=()):
+    try:
+        tags = invalidation_tags(product_ids, category_ids)
     except Exception:
-        # Best-effort: do not raise in signal handlers.
-        pass
+        return
+    _bump(tags)
+
+
+def remember_loaded_category(sender, instance, **kwargs):
+    # Remember the category a product was loaded with so moving it to another
+    # category also invalidates the old category's list pages. Read from
+    # __dict__ to avoid loading a deferred field.
+    instance._loaded_category_id = instance.__dict__.get('category_id')
+
+
+def clear_product_cache_on_save(sender, instance, raw=False, **kwargs):
+    """Invalidate caches covering a product when it is created or updated."""
+    if raw:
+        return
+    _invalidate([instance.pk], [instance.category_id, getattr(instance, '_loaded_category_id', None)])
+    instance._loaded_category_id = instance.category_id
+
 
-@receiver(post_delete, sender=Product)
 def clear_product_cache_on_delete(sender, instance, **kwargs):
-    """Clear product-related cache when a product is deleted."""
+    """Invalidate caches covering a product when it is deleted."""
+    _invalidate([instance.pk], [instance.category_id])
+
+
+def clear_product_cache_on_child_save(sender, instance, raw=False, **kwargs):
+    """Images and variants are embedded in product payloads."""
+    if raw:
+        return
+    _invalidate([instance.product_id], [instance.product.category_id])
+
+
+def clear_product_cache_on_child_delete(sender, instance, origin=None, **kwargs):
+    # A cascade from the product/category already invalidated via its own handler
+    if deleted_with_parent(origin, Product) or deleted_with_parent(origin, Category):
+        return
+    # category-filtered pages are only tagged with the category
     try:
-        cache.delete(_product_detail_key(instance.pk))
-        try:
-            default_cache = caches['default']
-            if hasattr(default_cache, 'delete_pattern'):
-                default_cache.delete_pattern('product:list:*')
-            else:
-                cache.delete(_product_list_key_for_request_path('/api/products/'))
-        except Exception:
-            cache.delete(_product_list_key_for_request_path('/api/products/'))
+        category_id = instance.product.category_id
+    except Product.DoesNotExist:
+        category_id = None
+    _invalidate([instance.product_id], [category_id])
+
+
+def remember_loaded_slug(sender, instance, **kwargs):
+    instance._loaded_slug = instance.__dict__.get('slug')
+
+
+def clear_category_cache(sender, instance, raw=False, **kwargs):
+    """Category data is embedded in every product payload of that category."""
+    if raw:
+        return
+    tags = [catalog_cache.CATALOG_TAG, catalog_cache.CATEGORIES_TAG,
+            *catalog_cache.category_tags(instance.pk, instance.slug)]
+    # a renamed slug must also drop pages cached for the old slug filter
+    tags.extend(catalog_cache.category_tags(instance.pk, getattr(instance, '_loaded_slug', None)))
+    _bump(tags)
+    instance._loaded_slug = instance.slug
+
+
+def clear_cache_on_bulk_change(sender, product_ids=(), category_ids=(), **kwargs):
+    # category-filtered pages list the changed products even when membership
+    # did not change (e.g. a price update)
+    category_ids = set(category_ids)
+    try:
+        category_ids.update(Product.objects.filter(pk__in=list(product_ids)).values_list('category_id', flat=True))
     except Exception:
         pass
+    _invalidate(product_ids, category_ids)
+
+
+def connect_signals():
+    """Connect the cache invalidation receivers (from `CatalogConfig.ready()`)."""
+    post_init.connect(remember_loaded_category, sender=Product)
+    post_save.connect(clear_product_cache_on_save, sender=Product)
+    post_delete.connect(clear_product_cache_on_delete, sender=Product)
+    for model in (ProductImage, ProductVariant):
+        post_save.connect(clear_product_cache_on_child_save, sender=model)
+        post_delete.connect(clear_product_cache_on_child_delete, sender=model)
+    post_init.connect(remember_loaded_slug, sender=Category)
+    post_save.connect(clear_category_cache, sender=Category)
+    post_delete.connect(clear_category_cache, sender=Category)
+    products_bulk_changed.connect(clear_cache_on_bulk_change)
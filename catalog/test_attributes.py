@@ -0,0 +1,108 @@
+from unittest import skipIf, skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog import columnar
+from catalog.attributes import parse_attribute_params
+from catalog.models import Category, Product, ProductVariant, VariantAttribute
+from catalog.signals import products_bulk_changed
+
+
+class AttributeFixtureMixin:
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('product-list')
+        self.shirts = Category.objects.create(name='Shirts', slug='shirts')
+        self.shoes = Category.objects.create(name='Shoes', slug='shoes')
+        self.tee = self._product('tee', self.shirts, [{'size': 'M', 'color': 'red'}, {'size': 'L', 'color': 'blue'}])
+        self.polo = self._product('polo', self.shirts, [{'size': 'M', 'color': 'blue'}])
+        self.boot = self._product('boot', self.shoes, [{'size': 42, 'color': 'red'}])
+
+    def _product(self, slug, category, variants):
+        product = Product.objects.create(name=slug, slug=slug, price='20.00', inventory=5, category=category)
+        for i, attributes in enumerate(variants):
+            ProductVariant.objects.create(product=product, sku=f'{slug}-{i}', attributes=attributes)
+        return product
+
+    def _slugs(self, **params):
+        resp = self.client.get(self.url, params)
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return sorted(p['slug'] for p in resp.data['results'])
+
+
+class AttributeFilterTests(AttributeFixtureMixin, TestCase):
+    def test_parse_params(self):
+        params = {'attr_size': 'M, L', 'attr_bad name': 'x', 'attr_color': '', 'min_price': '1'}
+        self.assertEqual(parse_attribute_params(params), {'size': ['L', 'M']})
+
+    def test_filters_match_one_variant(self):
+        self.assertEqual(self._slugs(attr_size='M'), ['polo', 'tee'])
+        self.assertEqual(self._slugs(attr_size='M', attr_color='red'), ['tee'])
+        # the tee has an L and a red variant, but no red L
+        self.assertEqual(self._slugs(attr_size='L', attr_color='red'), [])
+        self.assertEqual(self._slugs(attr_color='red,blue', category__slug='shirts'), ['polo', 'tee'])
+
+    def test_numeric_values_compare_as_text(self):
+        self.assertEqual(self._slugs(attr_size='42'), ['boot'])
+
+    def test_variant_writes_resync_rows(self):
+        variant = self.polo.variants.get()
+        variant.attributes = {'size': 'S'}
+        variant.save()
+        self.assertEqual(self._slugs(attr_size='M'), ['tee'])
+        ProductVariant.objects.filter(sku='tee-0').delete()
+        self.assertEqual(self._slugs(attr_size='M'), [])
+
+    @skipUnless(connection.vendor != 'postgresql', 'lookup rows are only kept without jsonb')
+    def test_bulk_change_resyncs_rows(self):
+        ProductVariant.objects.filter(product=self.boot).update(attributes={'size': 'M'})
+        products_bulk_changed.send(sender=Product, product_ids=[self.boot.pk])
+        self.assertEqual(
+            set(VariantAttribute.objects.filter(product=self.boot).values_list('name', 'value')), {('size', 'M')})
+
+
+class AttributeFacetTests(AttributeFixtureMixin, TestCase):
+    def _facets(self, **params):
+        resp = self.client.get(self.url, {'facets': 'true', **params})
+        self.assertEqual(resp.status_code, 200, resp.data)
+        return resp.data['facets']['attributes']
+
+    def test_counts_products_per_value(self):
+        facets = self._facets()
+        self.assertEqual(facets['color'], [{'value': 'blue', 'count': 2}, {'value': 'red', 'count': 2}])
+        self.assertEqual(facets['size'], [{'value': 'M', 'count': 2}, {'value': '42', 'count': 1},
+                                          {'value': 'L', 'count': 1}])
+
+    def test_counts_are_disjunctive(self):
+        facets = self._facets(attr_color='red')
+        # the sizes red comes in (not the tee's blue L); colours ignore the colour filter
+        self.assertEqual({f['value'] for f in facets['size']}, {'M', '42'})
+        self.assertEqual({f['value']: f['count'] for f in facets['color']}, {'red': 2, 'blue': 2})
+
+    def test_counts_follow_other_filters(self):
+        facets = self._facets(category__slug='shoes')
+        self.assertEqual(facets['size'], [{'value': '42', 'count': 1}])
+
+    @override_settings(CATALOG_ATTRIBUTE_FACETS=['color'])
+    def test_listed_attributes_only(self):
+        self.assertEqual(list(self._facets()), ['color'])
+
+    @skipIf(columnar.np is None, 'numpy is not installed')
+    @override_settings(CATALOG_COLUMNAR_SYNC_SECONDS=3600)
+    def test_columnar_snapshot_counts_the_same(self):
+        columnar.reset_snapshot()
+        self.addCleanup(columnar.reset_snapshot)
+        for params in ({}, {'category__slug': 'shirts'}, {'min_price': '30'}):
+            expected = self._facets(**params)
+            with override_settings(CATALOG_COLUMNAR_ENABLED=True):
+                self.assertEqual(self._facets(**params), expected, params)
+        # a variant edit reaches the snapshot once it commits
+        with override_settings(CATALOG_COLUMNAR_ENABLED=True), self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.get(sku='boot-0').delete()
+        with override_settings(CATALOG_COLUMNAR_ENABLED=True):
+            self.assertEqual(self._facets()['size'], [{'value': 'M', 'count': 2}, {'value': 'L', 'count': 1}])
@@ -0,0 +1,147 @@
+import os
+import pickle
+import tempfile
+import threading
+import zipfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from catalog import background, bm25
+from catalog.models import Category, Product
+from catalog.signals import products_bulk_changed
+
+
+class BM25IndexTests(TestCase):
+    def test_ranks_name_matches_and_rare_terms_first(self):
+        index = bm25.BM25Index()
+        index.add(1, 'Red Kettle', 'Boils water fast')
+        index.add(2, 'Teapot', 'Pairs with any kettle')
+        index.add(3, 'Red Mug', 'Holds water')
+        self.assertEqual([pid for pid, _ in index.search('kettle')], [1, 2])
+        self.assertEqual(index.search('red kettle')[0][0], 1)
+        self.assertEqual(index.search('nothing here'), [])
+
+    def test_reindex_and_remove_leave_no_stale_postings(self):
+        index = bm25.BM25Index()
+        index.add(1, 'Kettle', '')
+        index.add(1, 'Toaster', '')
+        index.add(2, 'Kettle', '')
+        index.remove(2)
+        self.assertEqual(index.search('kettle'), [])
+        self.assertEqual([pid for pid, _ in index.search('toaster')], [1])
+        index.compact()
+        self.assertEqual(list(index.doc_ids), [1])
+        self.assertEqual(set(index.postings), {'toaster'})
+
+    def test_snapshot_round_trip(self):
+        index = bm25.BM25Index()
+        index.add(1, 'Kettle', 'steel')
+        index.add(2, 'Mug', 'steel')
+        index.remove(1)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.zip')
+            index.save(path)
+            loaded = bm25.BM25Index.load(path)
+        self.assertEqual(loaded.search('steel'), index.search('steel'))
+        self.assertEqual(len(loaded), 1)
+
+    def test_unreadable_snapshots_are_ignored(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.zip')
+            with open(path, 'wb') as fh:
+                pickle.dump({'version': 1}, fh)
+            self.assertIsNone(bm25.BM25Index.load(path))
+            with zipfile.ZipFile(path, 'w') as zf:
+                zf.writestr('header.json', '{"version": 2}')
+            self.assertIsNone(bm25.BM25Index.load(path))
+
+
+class BM25SearchBackendTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'index.zip')
+        settings = override_settings(CATALOG_SEARCH_BACKEND='bm25', CATALOG_SEARCH_INDEX_PATH=self.path,
+                                     CATALOG_SEARCH_INDEX_SYNC_SECONDS=3600)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        bm25.reset_index()
+        self.addCleanup(bm25.reset_index)
+        self.client = APIClient()
+        self.cat = Category.objects.create(name='Kitchen', slug='kitchen')
+        Product.objects.create(name='Kettle', slug='kettle', price='30.00', category=self.cat,
+                               description='Electric kettle')
+        Product.objects.create(name='Teapot', slug='teapot', price='20.00', category=self.cat,
+                               description='Use with a kettle')
+
+    def _slugs(self, **params):
+        resp = self.client.get(reverse('product-list'), params)
+        self.assertEqual(resp.status_code, 200)
+        return [p['slug'] for p in resp.data['results']]
+
+    def test_results_are_ranked_and_index_is_snapshotted(self):
+        self.assertEqual(self._slugs(search='kettle'), ['kettle', 'teapot'])
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(self._slugs(search='kettle', ordering='price'), ['teapot', 'kettle'])
+        self.assertEqual(self._slugs(search='kettle', category__slug='nope'), [])
+        self.assertEqual(self._slugs(search='zzz'), [])
+
+    def test_signals_update_the_loaded_index(self):
+        self._slugs(search='kettle')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Kettle Descaler', slug='descaler', price='5.00', category=self.cat)
+        self.assertIn('descaler', self._slugs(search='kettle'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(slug='kettle').delete()
+        self.assertNotIn('kettle', self._slugs(search='kettle'))
+        created = Product.objects.bulk_create([Product(name='Kettle Lid', slug='lid', price='2.00', category=self.cat)])
+        with self.captureOnCommitCallbacks(execute=True):
+            products_bulk_changed.send(sender=Product, product_ids=[p.pk for p in created])
+        self.assertIn('lid', self._slugs(search='lid'))
+
+    def test_sync_catches_writes_from_other_processes(self):
+        self._slugs(search='kettle')
+        # simulate another worker: no signals reach this process's index
+        Product.objects.filter(slug='teapot').update(name='Infuser', description='', updated_at=timezone.now())
+        Product.objects.filter(slug='kettle').delete()
+        bm25.get_index().sync()
+        self.assertEqual(self._slugs(search='kettle'), [])
+        self.assertEqual(self._slugs(search='infuser'), ['teapot'])
+
+    def test_stale_index_syncs_without_blocking_searches(self):
+        index = bm25.get_index()
+        release = threading.Event()
+        index.last_sync = 0.0
+        with mock.patch.object(index, 'background_sync', side_effect=lambda: release.wait(5)) as sync:
+            with self.assertNumQueries(0):
+                self.assertIs(bm25.get_index(), index)
+            # the sync is still running: searches go ahead and no second one starts
+            self.assertEqual([pid for pid, _ in index.search('kettle')][:1], [Product.objects.get(slug='kettle').pk])
+            self.assertIsNone(background.sync_if_stale(index, 0, 'search-index'))
+            release.set()
+        for thread in threading.enumerate():
+            if thread.name == 'search-index-sync':
+                thread.join(5)
+        self.assertEqual(sync.call_count, 1)
+
+    def test_background_sync_reconciles_deletions_when_due(self):
+        index = bm25.get_index()
+        Product.objects.filter(slug='kettle').delete()
+        with self.assertNumQueries(1):
+            index.background_sync()
+        self.assertEqual(len(index), 2)
+        index.last_reconcile = 0.0
+        index.background_sync()
+        self.assertEqual(len(index), 1)
+
+    def test_workers_boot_from_snapshot(self):
+        call_command('build_search_index', stdout=open(os.devnull, 'w'))
+        bm25.reset_index()
+        loaded = bm25.BM25Index.load(self.path)
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual(self._slugs(search='electric'), ['kettle'])
@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog.models import Category, Product, ProductDocument, ProductVariant
+
+User = get_user_model()
+
+
+def ndjson(*rows):
+    return '\n'.join(r if isinstance(r, str) else json.dumps(r) for r in rows).encode()
+
+
+class BulkPatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.staff = User.objects.create_user(username='erp', password='x', is_staff=True)
+        self.cat = Category.objects.create(name='Kitchen', slug='kitchen')
+        self.kettle = Product.objects.create(name='Kettle', slug='kettle', price='30.00', inventory=5, category=self.cat)
+        self.mug = Product.objects.create(name='Mug', slug='mug', price='8.00', inventory=50, category=self.cat)
+        self.variant = ProductVariant.objects.create(product=self.kettle, sku='KETTLE-RED', inventory=1)
+        self.url = reverse('product-bulk-patch')
+
+    def _post(self, body, content_type='application/x-ndjson', **params):
+        self.client.force_authenticate(self.staff)
+        url = self.url + ('?' + '&'.join(f'{k}={v}' for k, v in params.items()) if params else '')
+        return self.client.generic('POST', url, body, content_type=content_type)
+
+    def test_ndjson_updates_and_reports_errors(self):
+        resp = self._post(ndjson(
+            {'slug': 'kettle', 'price': 27.5},
+            {'slug': 'mug', 'price': '8.00', 'inventory': 50},   # no-op
+            {'sku': 'KETTLE-RED', 'inventory': 12, 'price': None},
+            {'slug': 'nope', 'price': '1.00'},
+            {'slug': 'mug', 'price': '-3'},
+            {'slug': 'mug', 'price': '1.999'},
+            '{not json',
+            {'slug': 'mug', 'sku': 'KETTLE-RED', 'inventory': 1},
+        ))
+        self.assertEqual(resp.status_code, 200)
+        report = resp.json()
+        self.assertEqual((report['rows'], report['updated'], report['unchanged'], report['failed']), (8, 2, 1, 5))
+        self.assertEqual([e['line'] for e in report['errors']], [4, 5, 6, 7, 8])
+        self.assertEqual(report['errors'][0], {'line': 4, 'key': 'nope', 'error': 'unknown product slug'})
+
+        self.kettle.refresh_from_db()
+        self.assertEqual(self.kettle.price, Decimal('27.50'))
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.inventory, 12)
+        # documents follow through the bulk signal
+        data = ProductDocument.objects.get(product=self.kettle).data
+        self.assertEqual(data['price'], '27.50')
+        self.assertEqual(data['variants'][0]['inventory'], 12)
+
+    @override_settings(CATALOG_CACHE_ENABLED=True)
+    def test_invalidates_category_pages_once_per_chunk(self):
+        list_url = reverse('product-list')
+        self.client.get(list_url, {'category__slug': 'kitchen', 'ordering': 'price'})
+        self._post(ndjson({'slug': 'mug', 'price': '99.00'}))
+        resp = self.client.get(list_url, {'category__slug': 'kitchen', 'ordering': 'price'})
+        self.assertEqual(resp.data['results'][-1]['slug'], 'mug')
+
+    def test_chunk_is_one_update_per_model(self):
+        for i in range(40):
+            Product.objects.create(name=f'P{i}', slug=f'p-{i}', price='1.00', category=self.cat)
+        body = ndjson(*[{'slug': f'p-{i}', 'price': f'{i + 2}.00', 'inventory': i} for i in range(40)])
+        with CaptureQueriesContext(connection) as ctx:
+            report = self._post(body).json()
+        self.assertEqual(report['updated'], 40)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "catalog_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Product.objects.get(slug='p-39').price, Decimal('41.00'))
+
+    def test_csv_upload(self):
+        csv_body = b'slug,sku,price,inventory\nmug,,9.50,\n,KETTLE-RED,,3\n'
+        upload = SimpleUploadedFile('prices.csv', csv_body, content_type='text/csv')
+        self.client.force_authenticate(self.staff)
+        resp = self.client.post(self.url, {'file': upload}, format='multipart')
+        self.assertEqual(resp.json()['updated'], 2)
+        self.assertEqual(Product.objects.get(slug='mug').price, Decimal('9.50'))
+        self.assertEqual(ProductVariant.objects.get(sku='KETTLE-RED').inventory, 3)
+        # raw CSV body works too
+        resp = self._post(b'slug,price\nmug,9.75\n', content_type='text/csv')
+        self.assertEqual(resp.json()['updated'], 1)
+
+    def test_invalid_utf8_is_a_row_error(self):
+        report = self._post(ndjson({'slug': 'mug', 'price': '9.00'}) + b'\n{"slug": "\xff"}').json()
+        self.assertEqual((report['updated'], report['failed']), (1, 1))
+        self.assertEqual(report['errors'][0]['line'], 2)
+        self.assertIn('invalid UTF-8', report['errors'][0]['error'])
+        report = self._post(b'slug,price\nmug,9.50\nkettle\xe9,1.00\n', content_type='text/csv').json()
+        self.assertEqual((report['updated'], report['failed']), (1, 1))
+        self.assertEqual(report['errors'][0], {'line': 3, 'key': None, 'error': 'invalid UTF-8'})
+
+    def test_staff_only(self):
+        user = User.objects.create_user(username='shopper', password='x')
+        self.client.force_authenticate(user)
+        resp = self.client.generic('POST', self.url, ndjson({'slug': 'mug', 'price': '1.00'}),
+                                   content_type='application/x-ndjson')
+        self.assertEqual(resp.status_code, 403)
+
+    def test_management_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'patch.ndjson')
+            with open(path, 'wb') as fh:
+                fh.write(ndjson({'slug': 'kettle', 'inventory': 0}, {'slug': 'ghost', 'inventory': 1}))
+            with open(os.devnull, 'w') as devnull:
+                call_command('bulk_patch_catalog', path, '--chunk-size', '1', stdout=devnull, stderr=devnull)
+        self.assertEqual(Product.objects.get(slug='kettle').inventory, 0)
@@ -0,0 +1,97 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog import cache as catalog_cache
+from catalog.models import Category, Product, ProductImage
+from catalog.signals import products_bulk_changed
+
+
+class TagCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_invalidates_only_dependent_entries(self):
+        catalog_cache.store('a', 1, catalog_cache.tag_versions(['product:1']))
+        catalog_cache.store('b', 2, catalog_cache.tag_versions(['product:2']))
+        catalog_cache.bump('product:1')
+        self.assertIs(catalog_cache.lookup('a'), catalog_cache.MISS)
+        self.assertEqual(catalog_cache.lookup('b'), 2)
+
+    def test_cached_none_is_a_hit(self):
+        catalog_cache.store('neg', None, catalog_cache.tag_versions(['product:9']))
+        self.assertIsNone(catalog_cache.lookup('neg'))
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True)
+class ProductListCacheInvalidationTests(TestCase):
+    """List pages are dropped only when a write touches what they show."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('product-list')
+        self.books = Category.objects.create(name='Books', slug='books')
+        self.toys = Category.objects.create(name='Toys', slug='toys')
+        self.novel = Product.objects.create(name='Novel', slug='novel', price='10.00', category=self.books)
+        self.yoyo = Product.objects.create(name='Yoyo', slug='yoyo', price='3.00', category=self.toys)
+
+    def _get(self, **params):
+        return self.client.get(self.url, params)
+
+    def test_product_write_keeps_other_category_pages(self):
+        self._get(category__slug='books')
+        self._get(category__slug='toys')
+        self.novel.price = '12.00'
+        self.novel.save()
+        with self.assertNumQueries(0):
+            self._get(category__slug='toys')
+        resp = self._get(category__slug='books')
+        self.assertEqual(resp.data['results'][0]['price'], '12.00')
+
+    def test_image_write_invalidates_product_pages(self):
+        self._get()
+        ProductImage.objects.create(product=self.novel, image='products/images/novel.jpg')
+        resp = self._get()
+        novel = next(p for p in resp.data['results'] if p['slug'] == 'novel')
+        self.assertEqual(len(novel['images']), 1)
+
+    def test_image_delete_invalidates_category_pages(self):
+        image = ProductImage.objects.create(product=self.novel, image='products/images/novel.jpg')
+        self._get(category__id=self.books.pk)
+        image.delete()
+        resp = self._get(category__id=self.books.pk)
+        self.assertEqual(resp.data['results'][0]['images'], [])
+
+    def test_write_bumps_again_on_commit(self):
+        tag = catalog_cache.product_tag(self.novel.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.novel.price = '12.00'
+            self.novel.save()
+        bumped = catalog_cache.tag_versions([tag])
+        for callback in callbacks:
+            callback()
+        # pages cached between the write and its commit are dropped too
+        self.assertNotEqual(catalog_cache.tag_versions([tag]), bumped)
+
+    def test_category_move_invalidates_old_category(self):
+        self._get(category__id=self.books.pk)
+        self.novel.category = self.toys
+        self.novel.save()
+        resp = self._get(category__id=self.books.pk)
+        self.assertEqual(resp.data['results'], [])
+
+    def test_category_rename_invalidates_embedded_category(self):
+        self._get(category__slug='books')
+        self.books.name = 'Literature'
+        self.books.save()
+        resp = self._get(category__slug='books')
+        self.assertEqual(resp.data['results'][0]['category']['name'], 'Literature')
+
+    def test_bulk_changed_signal_invalidates(self):
+        self._get(category__slug='toys')
+        created = Product.objects.bulk_create([Product(name='Kite', slug='kite', price='8.00', category=self.toys)])
+        products_bulk_changed.send(sender=Product, product_ids=[p.pk for p in created], category_ids=[self.toys.pk])
+        resp = self._get(category__slug='toys')
+        self.assertEqual({p['slug'] for p in resp.data['results']}, {'yoyo', 'kite'})
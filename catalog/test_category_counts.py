@@ -0,0 +1,150 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog import counts
+from catalog.models import Category, Product
+from catalog.signals import products_bulk_changed
+
+
+class CategoryCountTests(TestCase):
+    """Product writes keep Category.product_count / in_stock_count current."""
+
+    def setUp(self):
+        self.books = Category.objects.create(name='Books', slug='books')
+        self.toys = Category.objects.create(name='Toys', slug='toys')
+
+    def assertCounts(self, category, total, in_stock):
+        category.refresh_from_db()
+        self.assertEqual((category.product_count, category.in_stock_count), (total, in_stock))
+
+    def _product(self, slug, inventory=5, category=None):
+        return Product.objects.create(name=slug, slug=slug, price='9.00', inventory=inventory,
+                                      category=category or self.books)
+
+    def test_create_and_delete(self):
+        novel = self._product('novel')
+        self._product('atlas', inventory=0)
+        self.assertCounts(self.books, 2, 1)
+        novel.delete()
+        self.assertCounts(self.books, 1, 0)
+
+    def test_inventory_transitions(self):
+        novel = self._product('novel', inventory=1)
+        novel.inventory = 0
+        novel.save()
+        self.assertCounts(self.books, 1, 0)
+        # a change that stays in stock issues no count update
+        novel.inventory = 3
+        novel.save()
+        novel.inventory = 7
+        with CaptureQueriesContext(connection) as queries:
+            novel.save(update_fields=['inventory'])
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE "catalog_category"')])
+        self.assertCounts(self.books, 1, 1)
+
+    def test_category_move(self):
+        novel = self._product('novel')
+        novel.category = self.toys
+        novel.save()
+        self.assertCounts(self.books, 0, 0)
+        self.assertCounts(self.toys, 1, 1)
+
+    def test_expression_and_deferred_writes_recount(self):
+        novel = self._product('novel', inventory=0)
+        novel.inventory = F('inventory') + 2
+        novel.save()
+        self.assertCounts(self.books, 1, 1)
+        deferred = Product.objects.only('name').get(pk=novel.pk)
+        deferred.category = self.toys
+        deferred.save()
+        self.assertCounts(self.books, 0, 0)
+        self.assertCounts(self.toys, 1, 1)
+
+    def test_expression_write_applies_a_relative_update(self):
+        novel = self._product('novel', inventory=0)
+        # another writer changes the count meanwhile; an absolute recount would erase its change
+        Category.objects.filter(pk=self.books.pk).update(product_count=F('product_count') + 5)
+        novel.inventory = F('inventory') + 2
+        with CaptureQueriesContext(connection) as queries:
+            novel.save()
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+        self.assertCounts(self.books, 6, 1)
+        novel.inventory = F('inventory') - 2
+        novel.save()
+        self.assertCounts(self.books, 6, 0)
+
+    def test_bulk_change_recounts(self):
+        novel = self._product('novel')
+        Product.objects.filter(pk=novel.pk).update(inventory=0, category=self.toys)
+        products_bulk_changed.send(sender=Product, product_ids=[novel.pk], category_ids=[self.books.pk])
+        self.assertCounts(self.books, 0, 0)
+        self.assertCounts(self.toys, 1, 0)
+
+    def test_category_delete_cascades(self):
+        self._product('novel')
+        self.books.delete()
+        self.assertFalse(Product.objects.exists())
+
+    def test_reconcile_command(self):
+        self._product('novel')
+        self._product('atlas', inventory=0, category=self.toys)
+        Category.objects.update(product_count=9, in_stock_count=9)
+        out = StringIO()
+        call_command('reconcile_category_counts', '--dry-run', stdout=out)
+        self.assertIn('2 categories drifted', out.getvalue())
+        self.assertCounts(self.books, 9, 9)
+        # lock the categories, count, fix the two drifted rows
+        with self.assertNumQueries(1 + 1 + 2):
+            call_command('reconcile_category_counts', stdout=StringIO())
+        self.assertCounts(self.books, 1, 1)
+        self.assertCounts(self.toys, 1, 0)
+        self.assertEqual(counts.drift(), {})
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True)
+class CategoryListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('category-list')
+        self.books = Category.objects.create(name='Books', slug='books')
+        Category.objects.create(name='Toys', slug='toys')
+        self.novel = Product.objects.create(name='Novel', slug='novel', price='10.00', inventory=2,
+                                            category=self.books)
+
+    def test_list_includes_counts_and_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.data['count'], 2)
+        self.assertEqual(first.data['results'][0],
+                         {'id': self.books.pk, 'name': 'Books', 'slug': 'books', 'product_count': 1, 'in_stock_count': 1})
+        with self.assertNumQueries(0):
+            page = self.client.get(self.url, {'limit': 1, 'offset': 1})
+        self.assertEqual(page.data['count'], 2)
+        self.assertEqual([c['slug'] for c in page.data['results']], ['toys'])
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_count_change_invalidates(self):
+        self.client.get(self.url)
+        self.novel.inventory = 0
+        self.novel.save()
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.data['results'][0]['in_stock_count'], 0)
+
+    def test_category_write_invalidates(self):
+        self.client.get(self.url)
+        Category.objects.create(name='Games', slug='games')
+        self.assertEqual(self.client.get(self.url).data['count'], 3)
+
+    def test_product_payload_category_has_no_counts(self):
+        resp = self.client.get(reverse('product-detail', args=[self.novel.pk]))
+        self.assertEqual(resp.data['category'], {'id': self.books.pk, 'name': 'Books', 'slug': 'books'})
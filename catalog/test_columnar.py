@@ -0,0 +1,164 @@
+import threading
+from datetime import timedelta
+from unittest import mock, skipIf
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from catalog import columnar
+from catalog.models import Category, Product
+from catalog.signals import products_bulk_changed
+
+
+class CatalogFixtureMixin:
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.books = Category.objects.create(name='Books', slug='books')
+        self.games = Category.objects.create(name='Games', slug='games')
+        base = timezone.now() - timedelta(days=1)
+        prices = ['5.00', '12.50', '12.50', '30.00', '99.99', '250.00', '7.25', '12.50']
+        for i, price in enumerate(prices):
+            product = Product.objects.create(name=f'Item {i}', slug=f'item-{i}', price=price, inventory=i % 3,
+                                             category=self.books if i % 2 else self.games)
+            # two products share a created_at so cursors have to break ties
+            Product.objects.filter(pk=product.pk).update(created_at=base + timedelta(minutes=min(i, 5)))
+        products_bulk_changed.send(sender=Product, product_ids=list(Product.objects.values_list('pk', flat=True)))
+
+    def _walk(self, params):
+        """Follow `next` links; return the products seen and the first response."""
+        products, first = [], None
+        url, query = reverse('product-list'), dict(params, limit=3)
+        while url:
+            resp = self.client.get(url, query)
+            self.assertEqual(resp.status_code, 200)
+            first = first or resp
+            products += resp.data['results']
+            url, query = resp.data['next'], None
+        return products, first
+
+
+class DatabaseFacetTests(CatalogFixtureMixin, TestCase):
+    def test_facets_are_disjunctive(self):
+        resp = self.client.get(reverse('product-list'), {'category__slug': 'books', 'max_price': '20', 'facets': '1'})
+        facets = resp.data['facets']
+        # category counts ignore the category filter but keep the price filter
+        self.assertEqual({c['slug']: c['count'] for c in facets['categories']}, {'books': 2, 'games': 3})
+        # price buckets ignore the price filter but keep the category filter
+        self.assertEqual({b['min']: b['count'] for b in facets['price'] if b['count']},
+                         {'10.00': 2, '25.00': 1, '250.00': 1})
+        self.assertIsNone(facets['price'][-1]['max'])
+        self.assertEqual(facets['availability'], {'in_stock': 2, 'out_of_stock': 0})
+
+    def test_facets_only_when_requested(self):
+        self.assertNotIn('facets', self.client.get(reverse('product-list')).data)
+
+
+@skipIf(columnar.np is None, 'numpy is not installed')
+@override_settings(CATALOG_COLUMNAR_SYNC_SECONDS=3600)
+class ColumnarFastPathTests(CatalogFixtureMixin, TestCase):
+    PARAMS = [
+        {},
+        {'ordering': 'price'},
+        {'ordering': '-price', 'category__slug': 'books'},
+        {'ordering': 'created_at', 'min_price': '10', 'max_price': '100'},
+        {'category__id': None, 'facets': '1'},
+        {'category__slug': 'nope'},
+    ]
+
+    def setUp(self):
+        super().setUp()
+        columnar.reset_snapshot()
+        self.addCleanup(columnar.reset_snapshot)
+
+    def _cases(self):
+        for params in self.PARAMS:
+            yield {k: (v if v is not None else self.games.pk) for k, v in params.items()}
+
+    def test_matches_database_path(self):
+        expected = [self._walk(params) for params in self._cases()]
+        with override_settings(CATALOG_COLUMNAR_ENABLED=True):
+            for params, (products, first) in zip(self._cases(), expected):
+                fast_products, fast_first = self._walk(params)
+                # rows with equal sort keys may come in either order
+                key = (params.get('ordering') or '-created_at').lstrip('-')
+                self.assertEqual([p[key] for p in fast_products], [p[key] for p in products], params)
+                self.assertCountEqual(fast_products, products, params)
+                self.assertEqual(fast_first.data.get('facets'), first.data.get('facets'), params)
+                self.assertEqual(fast_first['ETag'], first['ETag'], params)
+        self.assertIsNotNone(columnar.loaded_snapshot())
+
+    @override_settings(CATALOG_COLUMNAR_ENABLED=True)
+    def test_page_costs_one_query(self):
+        self.client.get(reverse('product-list'))
+        with self.assertNumQueries(1):
+            resp = self.client.get(reverse('product-list'), {'ordering': 'price', 'facets': '1'})
+        self.assertEqual(resp.data['results'][0]['slug'], 'item-0')
+        # a search still goes to the database
+        resp = self.client.get(reverse('product-list'), {'search': 'Item 3'})
+        self.assertIn('item-3', [p['slug'] for p in resp.data['results']])
+
+    @override_settings(CATALOG_COLUMNAR_ENABLED=True)
+    def test_cursors_carry_over_from_database_path(self):
+        with override_settings(CATALOG_COLUMNAR_ENABLED=False):
+            next_url = self.client.get(reverse('product-list'), {'ordering': 'price', 'limit': 2}).data['next']
+        resp = self.client.get(next_url)
+        self.assertEqual([p['price'] for p in resp.data['results']], ['12.50', '12.50'])
+        resp = self.client.get(resp.data['next'])
+        self.assertEqual([p['price'] for p in resp.data['results']], ['12.50', '30.00'])
+
+    @override_settings(CATALOG_COLUMNAR_ENABLED=True)
+    def test_signals_and_sync_keep_snapshot_current(self):
+        self.client.get(reverse('product-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Cheap', slug='cheap', price='0.50', category=self.books)
+        resp = self.client.get(reverse('product-list'), {'ordering': 'price'})
+        self.assertEqual(resp.data['results'][0]['slug'], 'cheap')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(slug='cheap').delete()
+        # a write from another worker is only seen on the next sync
+        Product.objects.filter(slug='item-5').update(price='1.00', updated_at=timezone.now())
+        columnar.get_snapshot().sync()
+        resp = self.client.get(reverse('product-list'), {'ordering': 'price'})
+        self.assertEqual(resp.data['results'][0]['slug'], 'item-5')
+
+    @override_settings(CATALOG_COLUMNAR_ENABLED=True)
+    def test_views_do_not_see_later_writes(self):
+        snapshot = columnar.get_snapshot()
+        cols = snapshot.view()
+        row = snapshot.rows[Product.objects.get(slug='item-0').pk]
+        item_1 = Product.objects.get(slug='item-1')
+        snapshot.upsert([(cols['id'][row], self.books.pk, '1.00', 40, timezone.now(), timezone.now(), None)])
+        snapshot.remove([item_1.pk])
+        self.assertEqual((cols['price'][row], cols['inventory'][row], cols['category_id'][row]),
+                         (500, 0, self.games.pk))
+        self.assertTrue(cols['alive'].all())
+        self.assertEqual(snapshot.view()['price'][row], 100)
+
+    @override_settings(CATALOG_COLUMNAR_ENABLED=True)
+    def test_stale_snapshot_syncs_in_the_background(self):
+        snapshot = columnar.get_snapshot()
+        Product.objects.filter(slug='item-0').update(price='999.00', updated_at=timezone.now())
+        release = threading.Event()
+        snapshot.last_sync = 0.0
+        with mock.patch.object(snapshot, 'background_sync', side_effect=lambda: release.wait(5)) as sync:
+            # the request is answered from the snapshot as it is
+            with self.assertNumQueries(1):
+                resp = self.client.get(reverse('product-list'), {'ordering': '-price'})
+            self.assertEqual(resp.data['results'][0]['slug'], 'item-5')
+            release.set()
+        for thread in threading.enumerate():
+            if thread.name == 'columnar-sync':
+                thread.join(5)
+        self.assertEqual(sync.call_count, 1)
+        # the periodic sync only scans for deletions when that is due
+        Product.objects.filter(slug='item-5').delete()
+        snapshot.background_sync()
+        self.assertEqual(snapshot.view()['price'][snapshot.rows[Product.objects.get(slug='item-0').pk]], 99900)
+        self.assertEqual(len(snapshot), 8)
+        snapshot.last_reconcile = 0.0
+        snapshot.background_sync()
+        self.assertEqual(len(snapshot), 7)
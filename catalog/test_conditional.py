@@ -0,0 +1,72 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog.models import Category, Product, ProductImage
+
+
+class ConditionalGetTests(TestCase):
+    """Catalog endpoints send validators and answer matching requests with 304."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.cat = Category.objects.create(name='Kitchen', slug='kitchen')
+        self.product = Product.objects.create(name='Kettle', slug='kettle', price='30.00', category=self.cat)
+
+    def assertRevalidates(self, url, params=None):
+        first = self.client.get(url, params or {})
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('ETag', first)
+        self.assertIn('Last-Modified', first)
+        again = self.client.get(url, params or {}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+        return first['ETag']
+
+    def test_product_list_and_detail(self):
+        self.assertRevalidates(reverse('product-list'))
+        self.assertRevalidates(reverse('product-list'), {'category__slug': 'kitchen'})
+        self.assertRevalidates(reverse('product-detail', args=[self.product.pk]))
+        self.assertRevalidates(reverse('product-by-slug', kwargs={'slug': 'kettle'}))
+
+    def test_category_list_and_detail(self):
+        self.assertRevalidates(reverse('category-list'))
+        self.assertRevalidates(reverse('category-detail', args=[self.cat.pk]))
+
+    def test_category_detail_bad_pk_is_404(self):
+        self.assertEqual(self.client.get('/api/catalog/categories/abc/').status_code, 404)
+        self.assertEqual(self.client.get(reverse('category-detail', args=[self.cat.pk + 1])).status_code, 404)
+
+    def test_304_skips_serialization(self):
+        etag = self.assertRevalidates(reverse('product-list'))
+        # only the validator aggregate runs
+        with self.assertNumQueries(1):
+            self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag)
+
+    def test_embedded_changes_change_etag(self):
+        list_etag = self.assertRevalidates(reverse('product-list'))
+        detail_url = reverse('product-detail', args=[self.product.pk])
+        detail_etag = self.assertRevalidates(detail_url)
+        ProductImage.objects.create(product=self.product, image='products/images/kettle.jpg')
+        resp = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data['results'][0]['images']), 1)
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+
+    def test_deleting_a_product_changes_list_etag(self):
+        Product.objects.create(name='Toaster', slug='toaster', price='25.00', category=self.cat)
+        etag = self.assertRevalidates(reverse('product-list'))
+        self.product.delete()
+        self.assertEqual(self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(CATALOG_CACHE_ENABLED=True)
+    def test_cached_pages_revalidate_without_queries(self):
+        etag = self.assertRevalidates(reverse('product-list'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        detail_url = reverse('product-detail', args=[self.product.pk])
+        etag = self.assertRevalidates(detail_url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog import cache as catalog_cache
+from catalog.models import Category, Product, ProductVariant
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True)
+class ProductDetailCacheTests(TestCase):
+    """Detail reads by id and slug are served from the tag-invalidated cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.cat = Category.objects.create(name='Audio', slug='audio')
+        self.product = Product.objects.create(name='Speaker', slug='speaker', price='99.00', category=self.cat)
+
+    def detail_url(self, pk):
+        return reverse('product-detail', args=[pk])
+
+    def slug_url(self, slug):
+        return reverse('product-by-slug', kwargs={'slug': slug})
+
+    def test_repeat_detail_hits_skip_database(self):
+        first = self.client.get(self.detail_url(self.product.pk))
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.detail_url(self.product.pk))
+        self.assertEqual(first.data, second.data)
+
+    def test_lookup_by_slug_shares_detail_entry(self):
+        self.client.get(self.detail_url(self.product.pk))
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.slug_url('speaker'))
+        self.assertEqual(resp.data['id'], self.product.pk)
+        with self.assertNumQueries(0):
+            self.client.get(self.slug_url('speaker'))
+
+    def test_writes_invalidate_detail(self):
+        self.client.get(self.detail_url(self.product.pk))
+        ProductVariant.objects.create(product=self.product, sku='SPK-1')
+        resp = self.client.get(self.detail_url(self.product.pk))
+        self.assertEqual([v['sku'] for v in resp.data['variants']], ['SPK-1'])
+
+        self.cat.name = 'Sound'
+        self.cat.save()
+        resp = self.client.get(self.detail_url(self.product.pk))
+        self.assertEqual(resp.data['category']['name'], 'Sound')
+
+    def test_slug_change_invalidates_old_slug(self):
+        self.client.get(self.slug_url('speaker'))
+        self.product.slug = 'speaker-v2'
+        self.product.save()
+        self.assertEqual(self.client.get(self.slug_url('speaker')).status_code, 404)
+        self.assertEqual(self.client.get(self.slug_url('speaker-v2')).status_code, 200)
+
+    def test_missing_products_are_negatively_cached(self):
+        missing_pk = self.product.pk + 100
+        self.assertEqual(self.client.get(self.detail_url(missing_pk)).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.detail_url(missing_pk)).status_code, 404)
+        self.assertEqual(self.client.get(self.slug_url('headphones')).status_code, 404)
+        with self.assertNumQueries(0):
+            self.client.get(self.slug_url('headphones'))
+
+        # creating the product drops the negative entries
+        Product.objects.create(pk=missing_pk, name='Headphones', slug='headphones', price='50.00', category=self.cat)
+        self.assertEqual(self.client.get(self.detail_url(missing_pk)).status_code, 200)
+        self.assertEqual(self.client.get(self.slug_url('headphones')).status_code, 200)
+
+    def test_non_numeric_id_is_404(self):
+        self.assertEqual(self.client.get('/api/catalog/products/abc/').status_code, 404)
+
+    def test_cache_outage_falls_back_to_database(self):
+        with mock.patch.object(catalog_cache, 'lookup', side_effect=ConnectionError('cache down')), \
+                mock.patch.object(catalog_cache, 'store', side_effect=ConnectionError('cache down')):
+            self.assertEqual(self.client.get(self.detail_url(self.product.pk)).data['slug'], 'speaker')
+            self.assertEqual(self.client.get(self.slug_url('speaker')).data['id'], self.product.pk)
+            self.assertEqual(self.client.get(self.detail_url(self.product.pk + 1)).status_code, 404)
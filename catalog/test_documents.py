@@ -0,0 +1,67 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog.models import Category, Product, ProductDocument, ProductImage, ProductVariant
+from catalog.serializers import ProductSerializer
+
+
+class ProductDocumentTests(TestCase):
+    """Read documents are rebuilt on catalog writes and used by list/detail."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cat = Category.objects.create(name='Apparel', slug='apparel')
+        self.product = Product.objects.create(name='Shirt', slug='shirt', price='19.99', inventory=4, category=self.cat)
+
+    def test_document_built_on_create(self):
+        doc = ProductDocument.objects.get(product=self.product)
+        self.assertEqual(doc.data['slug'], 'shirt')
+        self.assertEqual(doc.data['category'], {'id': self.cat.pk, 'name': 'Apparel', 'slug': 'apparel'})
+
+    def test_document_follows_variants_images_and_category(self):
+        ProductVariant.objects.create(product=self.product, sku='SHIRT-M', attributes={'size': 'M'})
+        ProductImage.objects.create(product=self.product, image='products/images/shirt.jpg', alt='front')
+        self.cat.name = 'Clothing'
+        self.cat.save()
+        data = ProductDocument.objects.get(product=self.product).data
+        self.assertEqual([v['sku'] for v in data['variants']], ['SHIRT-M'])
+        self.assertEqual(data['images'][0]['alt'], 'front')
+        self.assertEqual(data['category']['name'], 'Clothing')
+
+        ProductVariant.objects.filter(sku='SHIRT-M').get().delete()
+        self.assertEqual(ProductDocument.objects.get(product=self.product).data['variants'], [])
+
+    def test_deleting_product_removes_document(self):
+        ProductVariant.objects.create(product=self.product, sku='SHIRT-L')
+        self.product.delete()
+        self.assertFalse(ProductDocument.objects.exists())
+
+    def test_list_and_detail_match_serializer(self):
+        ProductVariant.objects.create(product=self.product, sku='SHIRT-S', price='17.50')
+        expected = ProductSerializer(Product.objects.get(pk=self.product.pk)).data
+        resp = self.client.get(reverse('product-list'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['results'][0], expected)
+        resp = self.client.get(reverse('product-detail', args=[self.product.pk]))
+        self.assertEqual(resp.data, expected)
+
+    def test_list_query_count_independent_of_images_and_variants(self):
+        for i in range(5):
+            ProductVariant.objects.create(product=self.product, sku=f'SHIRT-{i}')
+            ProductImage.objects.create(product=self.product, image=f'products/images/{i}.jpg')
+        # conditional GET validators + the page itself
+        with self.assertNumQueries(2):
+            self.client.get(reverse('product-list'))
+
+    def test_rebuild_command_backfills_missing_documents(self):
+        Product.objects.bulk_create([
+            Product(name=f'Bulk{i}', slug=f'bulk-{i}', price='1.00', category=self.cat) for i in range(3)
+        ])
+        self.assertEqual(ProductDocument.objects.count(), 1)
+        # products without documents still render through the serializer fallback
+        resp = self.client.get(reverse('product-list'))
+        self.assertEqual(len(resp.data['results']), 4)
+        call_command('rebuild_product_documents', stdout=open('/dev/null', 'w'))
+        self.assertEqual(ProductDocument.objects.count(), 4)
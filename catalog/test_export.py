@@ -0,0 +1,117 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog import export
+from catalog.models import Category, Product, ProductDocument, ProductVariant
+
+User = get_user_model()
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.staff = User.objects.create_user(username='feeds', password='x', is_staff=True)
+        self.kitchen = Category.objects.create(name='Kitchen', slug='kitchen')
+        self.garden = Category.objects.create(name='Garden', slug='garden')
+        self.kettle = Product.objects.create(name='Kettle', slug='kettle', price='30.00', inventory=5,
+                                             category=self.kitchen)
+        ProductVariant.objects.create(product=self.kettle, sku='KETTLE-RED', name='Red', inventory=1,
+                                      attributes={'color': 'red'})
+        ProductVariant.objects.create(product=self.kettle, sku='KETTLE-BLUE', name='Blue', price='32.00', inventory=0)
+        for i in range(5):
+            Product.objects.create(name=f'Hose {i}', slug=f'hose-{i}', price='12.50', inventory=i, category=self.garden)
+        self.url = reverse('product-export')
+
+    def _ndjson(self, data):
+        return [json.loads(line) for line in data.decode().splitlines()]
+
+    def test_ndjson_matches_product_payloads(self):
+        products = self._ndjson(b''.join(export.export_chunks(chunk_size=2)))
+        self.assertEqual([p['slug'] for p in products], ['kettle'] + [f'hose-{i}' for i in range(5)])
+        self.assertEqual({v['sku'] for v in products[0]['variants']}, {'KETTLE-RED', 'KETTLE-BLUE'})
+        self.assertEqual(products[0]['category'], {'id': self.kitchen.pk, 'name': 'Kitchen', 'slug': 'kitchen'})
+
+    def test_products_without_documents_are_serialized(self):
+        ProductDocument.objects.all().delete()
+        products = self._ndjson(b''.join(export.export_chunks(chunk_size=4)))
+        self.assertEqual(len(products), 6)
+        self.assertEqual(len(products[0]['variants']), 2)
+
+    def test_csv_has_a_row_per_variant(self):
+        rows = list(csv.DictReader(io.StringIO(b''.join(export.export_chunks('csv')).decode())))
+        self.assertEqual(len(rows), 2 + 5)
+        kettle = [row for row in rows if row['slug'] == 'kettle']
+        self.assertEqual({row['variant_sku'] for row in kettle}, {'KETTLE-RED', 'KETTLE-BLUE'})
+        red = next(row for row in kettle if row['variant_sku'] == 'KETTLE-RED')
+        self.assertEqual(json.loads(red['variant_attributes']), {'color': 'red'})
+        self.assertEqual(red['variant_price'], '')
+        self.assertEqual(rows[-1]['variant_sku'], '')
+
+    def test_queries_grow_with_chunks_not_rows(self):
+        ProductDocument.objects.all().delete()
+        with CaptureQueriesContext(connection) as small:
+            b''.join(export.export_chunks(chunk_size=100))
+        with CaptureQueriesContext(connection) as chunked:
+            b''.join(export.export_chunks(chunk_size=2))
+        # one read of the products plus images and variants per chunk
+        self.assertEqual(len(small), 3)
+        self.assertEqual(len(chunked), 1 + 2 * 3)
+
+    def test_output_is_flushed_in_pieces(self):
+        with mock.patch.object(export, 'FLUSH_BYTES', 1):
+            chunks = list(export.export_chunks(chunk_size=2))
+        self.assertEqual(len(chunks), 6)
+
+    def test_endpoint_is_staff_only(self):
+        self.assertIn(self.client.get(self.url).status_code, (401, 403))
+        self.client.force_authenticate(User.objects.create_user(username='shopper', password='x'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_endpoint_streams_filtered_gzip(self):
+        self.client.force_authenticate(self.staff)
+        resp = self.client.get(self.url, {'category__slug': 'garden', 'gzip': '1'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Type'], 'application/gzip')
+        self.assertIn('catalog.ndjson.gz', resp['Content-Disposition'])
+        products = self._ndjson(gzip.decompress(b''.join(resp.streaming_content)))
+        self.assertEqual({p['slug'] for p in products}, {f'hose-{i}' for i in range(5)})
+        self.assertEqual(products[0]['category']['slug'], 'garden')
+
+    def test_endpoint_csv_and_bad_format(self):
+        self.client.force_authenticate(self.staff)
+        resp = self.client.get(self.url, {'output_format': 'csv'})
+        self.assertEqual(resp['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertTrue(b''.join(resp.streaming_content).startswith(b'product_id,slug,'))
+        self.assertEqual(self.client.get(self.url, {'output_format': 'xml'}).status_code, 400)
+
+    def test_endpoint_rejects_invalid_filters(self):
+        self.client.force_authenticate(self.staff)
+        for params in ({'min_price': 'abc'}, {'category__id': 'kitchen'}):
+            resp = self.client.get(self.url, params)
+            self.assertEqual(resp.status_code, 400)
+            self.assertFalse(resp.streaming)
+            self.assertIn(next(iter(params)), resp.json())
+
+    def test_command_writes_gzip_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'catalog.csv.gz')
+            call_command('export_catalog', path, '--category', 'kitchen', stderr=io.StringIO())
+            with gzip.open(path, 'rt') as fh:
+                rows = list(csv.DictReader(fh))
+        self.assertEqual({row['variant_sku'] for row in rows}, {'KETTLE-RED', 'KETTLE-BLUE'})
@@ -0,0 +1,39 @@
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog.models import Category, Product, ProductDocument, ProductImage, ProductVariant
+from catalog.serializers import PRODUCT_ROW_FIELDS, ProductSerializer, serialize_product_rows
+
+
+class FastProductSerializerTests(TestCase):
+    """The values()-based serializer matches ProductSerializer with constant queries."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cat = Category.objects.create(name='Garden', slug='garden')
+        for i in range(40):
+            p = Product.objects.create(name=f'Tool{i}', slug=f'tool-{i}', price=f'{i}.5', inventory=i,
+                                       category=self.cat, image=f'products/tool-{i}.jpg' if i % 2 else None)
+            ProductImage.objects.create(product=p, image=f'products/images/tool-{i}-b.jpg', order=2)
+            ProductImage.objects.create(product=p, image=f'products/images/tool-{i}-a.jpg', alt='a', order=1)
+            ProductVariant.objects.create(product=p, sku=f'TOOL-{i}-B', price='3.10', attributes={'size': 'L'})
+            ProductVariant.objects.create(product=p, sku=f'TOOL-{i}-A')
+
+    def test_rows_match_model_serializer(self):
+        request = RequestFactory().get('/')
+        products = Product.objects.select_related('category').order_by('pk')
+        expected = ProductSerializer(products, many=True, context={'request': request}).data
+        rows = Product.objects.order_by('pk').values(*PRODUCT_ROW_FIELDS)
+        self.assertEqual(serialize_product_rows(rows, request), [dict(p) for p in expected])
+
+    def test_list_query_count_constant_without_documents(self):
+        ProductDocument.objects.all().delete()
+        url = reverse('product-list')
+        for limit in (5, 40):
+            # validators, page rows, then one query each for images and variants
+            with self.assertNumQueries(4):
+                resp = self.client.get(url, {'limit': limit})
+            self.assertEqual(len(resp.data['results']), limit)
+            self.assertEqual(len(resp.data['results'][0]['variants']), 2)
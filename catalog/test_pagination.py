@@ -0,0 +1,64 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog.models import Category, Product
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursors are `(sort key, id)` pairs: every row appears exactly once, in order."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.cat = Category.objects.create(name='Tools', slug='tools')
+        # heavy ties on price and name, identical created_at within the bulk insert
+        Product.objects.bulk_create([
+            Product(name=f'Tool {i % 4}', slug=f'tool-{i}', price=f'{i % 3}.00', category=self.cat)
+            for i in range(23)
+        ])
+
+    def _walk(self, ordering, link='next', start=None):
+        seen, url = [], start or reverse('product-list')
+        params = {'ordering': ordering, 'limit': 4} if start is None else None
+        while url:
+            resp = self.client.get(url, params)
+            self.assertEqual(resp.status_code, 200)
+            page = [p['slug'] for p in resp.data['results']]
+            seen = seen + page if link == 'next' else page + seen
+            url, params = resp.data[link], None
+        return seen, resp
+
+    def _expected(self, ordering):
+        key = ordering.lstrip('-')
+        order = (ordering, '-id') if ordering.startswith('-') else (ordering, 'id')
+        return list(Product.objects.order_by(*order).values_list('slug', flat=True)) if key else []
+
+    def test_every_ordering_in_both_directions(self):
+        for ordering in ('price', '-price', 'name', '-name', 'created_at', '-created_at'):
+            cache.clear()  # stay under the products throttle
+            forward, last = self._walk(ordering)
+            self.assertEqual(forward, self._expected(ordering), ordering)
+            # and back again through the previous links
+            backward, _ = self._walk(ordering, link='previous', start=last.wsgi_request.get_full_path())
+            self.assertEqual(backward, forward, ordering)
+
+    def test_deep_pages_seek_instead_of_offset(self):
+        _, last = self._walk('price')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(last.wsgi_request.get_full_path())
+        page_sql = [q['sql'] for q in ctx.captured_queries if 'LIMIT' in q['sql']]
+        self.assertTrue(page_sql)
+        self.assertNotIn('OFFSET', page_sql[-1])
+
+    def test_bad_cursors_are_rejected(self):
+        next_url = self.client.get(reverse('product-list'), {'ordering': 'price', 'limit': 4}).data['next']
+        cursor = next_url.split('cursor=')[1].split('&')[0]
+        # a price cursor cannot be replayed against another ordering
+        resp = self.client.get(reverse('product-list'), {'ordering': 'name', 'cursor': cursor})
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get(reverse('product-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(resp.status_code, 404)
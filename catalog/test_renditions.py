@@ -0,0 +1,151 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.admin.sites import site
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from catalog import imaging, renditions
+from catalog.admin import ProductAdmin
+from catalog.models import Category, Product, ProductImage
+from catalog.serializers import ProductSerializer
+
+
+def jpeg(width, height, color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class ImagingTests(TestCase):
+    def test_render_skips_widths_above_the_source(self):
+        result = imaging.render(jpeg(800, 600), [160, 320, 1024], ['webp', 'jpeg'])
+        self.assertEqual((result['width'], result['height']), (800, 600))
+        self.assertEqual(sorted(result['files']['webp']), [160, 320])
+        with Image.open(io.BytesIO(result['files']['jpeg'][320])) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (320, 240)))
+        with Image.open(io.BytesIO(result['files']['webp'][160])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (160, 120)))
+        self.assertTrue(result['placeholder'].startswith('data:image/webp;base64,'))
+
+    def test_small_source_gets_one_rendition_at_its_size(self):
+        result = imaging.render(jpeg(100, 50), [160, 320], ['jpeg'])
+        self.assertEqual(list(result['files']['jpeg']), [100])
+        self.assertTrue(result['placeholder'].startswith('data:image/jpeg;base64,'))
+
+    def test_transparent_png_is_flattened(self):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (400, 400), (0, 0, 0, 0)).save(buffer, format='PNG')
+        result = imaging.render(buffer.getvalue(), [200], ['jpeg'])
+        with Image.open(io.BytesIO(result['files']['jpeg'][200])) as image:
+            self.assertEqual(image.getpixel((10, 10)), (255, 255, 255))
+
+
+@override_settings(CATALOG_RENDITION_WIDTHS=[160, 320], CATALOG_RENDITION_FORMATS=['webp', 'jpeg'],
+                   CATALOG_RENDITIONS_MODE='inline')
+class RenditionPipelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.cat = Category.objects.create(name='Kitchen', slug='kitchen')
+        self.product = Product.objects.create(name='Kettle', slug='kettle', price='30.00', category=self.cat)
+
+    def _upload(self, instance, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.image.save(name, ContentFile(data))
+
+    def test_upload_generates_renditions_and_srcset(self):
+        self._upload(self.product, 'kettle.jpg', jpeg(640, 480))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.image_width, self.product.image_height), (640, 480))
+        files = self.product.image_renditions['files']
+        self.assertEqual(files['webp']['320'], 'products/renditions/kettle-320w.webp')
+        self.assertTrue(default_storage.exists(files['jpeg']['160']))
+
+        payload = self.client.get(reverse('product-detail', args=[self.product.pk])).json()['image_renditions']
+        self.assertEqual(payload['srcset']['webp'],
+                         '/media/products/renditions/kettle-160w.webp 160w, /media/products/renditions/kettle-320w.webp 320w')
+        self.assertEqual((payload['width'], payload['height']), (640, 480))
+        self.assertTrue(payload['placeholder'].startswith('data:image/webp'))
+        # the stored document and the model serializer agree
+        expected = ProductSerializer(Product.objects.get(pk=self.product.pk)).data
+        self.assertEqual(payload, expected['image_renditions'])
+
+    def test_gallery_images_get_renditions(self):
+        image = ProductImage(product=self.product, alt='side')
+        self._upload(image, 'side.jpg', jpeg(400, 400))
+        image.refresh_from_db()
+        self.assertEqual(image.width, 400)
+        payload = self.client.get(reverse('product-detail', args=[self.product.pk])).json()
+        self.assertIn('side-160w.jpg 160w', payload['images'][0]['renditions']['srcset']['jpeg'])
+
+    def test_replaced_image_hides_stale_renditions_and_removes_files(self):
+        self._upload(self.product, 'kettle.jpg', jpeg(640, 480))
+        self.product.refresh_from_db()
+        old = self.product.image_renditions['files']['jpeg']['320']
+
+        with override_settings(CATALOG_RENDITIONS_ENABLED=False):
+            self._upload(self.product, 'kettle-new.jpg', jpeg(500, 500))
+        self.assertIsNone(ProductSerializer(Product.objects.get(pk=self.product.pk)).data['image_renditions'])
+
+        self.assertTrue(renditions.generate(Product, self.product.pk))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_width, 500)
+        self.assertFalse(default_storage.exists(old))
+        # nothing to do once current
+        self.assertFalse(renditions.generate(Product, self.product.pk))
+
+    def test_backfill_command_uses_process_pool(self):
+        with override_settings(CATALOG_RENDITIONS_ENABLED=False):
+            self._upload(self.product, 'kettle.jpg', jpeg(640, 480))
+            image = ProductImage(product=self.product)
+            self._upload(image, 'side.jpg', jpeg(300, 200))
+        ProductImage.objects.create(product=self.product, image='products/images/missing.jpg')
+        out, err = io.StringIO(), io.StringIO()
+        call_command('generate_image_renditions', '--workers', '2', stdout=out, stderr=err)
+        self.assertIn('Generated renditions for 2 images', out.getvalue())
+        self.assertIn('1 failed', out.getvalue())
+        self.assertIn('missing.jpg', err.getvalue())
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (300, 200))
+        self.assertEqual(sorted(image.renditions['files']['webp']), ['160'])
+
+    @override_settings(CATALOG_RENDITIONS_MODE='worker')
+    def test_worker_mode_leaves_uploads_to_the_polling_command(self):
+        self._upload(self.product, 'kettle.jpg', jpeg(640, 480))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_renditions, {})
+        out = io.StringIO()
+        # one pass, then stop the loop at its first pause
+        with mock.patch('time.sleep', side_effect=KeyboardInterrupt), self.assertRaises(KeyboardInterrupt):
+            call_command('generate_image_renditions', '--loop', '--workers', '1', stdout=out)
+        self.assertIn('Generated renditions for 1 images', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image_width, 640)
+        with self.assertRaises(CommandError):
+            call_command('generate_image_renditions', '--loop', '--force')
+
+
+class AdminThumbnailTests(TestCase):
+    def test_admin_uses_smallest_rendition(self):
+        cat = Category.objects.create(name='Kitchen', slug='kitchen')
+        product = Product.objects.create(
+            name='Kettle', slug='kettle', price='1.00', category=cat, image='products/kettle.jpg',
+            image_renditions={'source': 'products/kettle.jpg', 'files': {'jpeg': {
+                '320': 'products/renditions/kettle-320w.jpg', '160': 'products/renditions/kettle-160w.jpg'}}})
+        tag = ProductAdmin(Product, site).image_tag(product)
+        self.assertIn('src="/media/products/renditions/kettle-160w.jpg"', tag)
+
+        product.image = 'products/replaced.jpg'
+        self.assertIn('src="/media/products/replaced.jpg"', ProductAdmin(Product, site).image_tag(product))
@@ -0,0 +1,47 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from catalog.models import Category, Product
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cat = Category.objects.create(name='Outdoor', slug='outdoor')
+        Product.objects.create(name='Camping Tent', slug='camping-tent', price='120.00', category=cat,
+                               description='Two person tent')
+        Product.objects.create(name='Sleeping Bag', slug='sleeping-bag', price='60.00', category=cat,
+                               description='Warm bag, pairs well with a tent')
+        Product.objects.create(name='Stove', slug='stove', price='40.00', category=cat,
+                               description='Compact camping stove')
+
+    def _slugs(self, **params):
+        resp = self.client.get(reverse('product-list'), params)
+        self.assertEqual(resp.status_code, 200)
+        return [p['slug'] for p in resp.data['results']]
+
+    def test_search_matches_name_and_description(self):
+        self.assertEqual(set(self._slugs(search='tent')), {'camping-tent', 'sleeping-bag'})
+        self.assertEqual(self._slugs(search='stove compact'), ['stove'])
+
+    def test_explicit_ordering_is_kept(self):
+        self.assertEqual(self._slugs(search='tent', ordering='price'), ['sleeping-bag', 'camping-tent'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search requires PostgreSQL')
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self._slugs(search='tent'), ['camping-tent', 'sleeping-bag'])
+        self.assertEqual(self._slugs(search='camping -stove'), ['camping-tent'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search requires PostgreSQL')
+    def test_ranked_results_paginate_without_gaps(self):
+        seen, params = [], {'search': 'tent', 'limit': 1}
+        url = reverse('product-list')
+        while url:
+            resp = self.client.get(url, params)
+            seen += [p['slug'] for p in resp.data['results']]
+            url, params = resp.data['next'], None
+        self.assertEqual(seen, ['camping-tent', 'sleeping-bag'])
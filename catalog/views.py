@@ -1,27 +1,113 @@
-from rest_framework import viewsets, permissions
+from rest_framework import viewsets, permissions, status
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.parsers import MultiPartParser, FormParser
-from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiExample
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiExample, OpenApiParameter
 from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
 from django.conf import settings
-from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.response import Response
+from rest_framework.decorators import action
+from django.http import Http404, StreamingHttpResponse
+from nexus.throttling import ScopedRateThrottle
 from rest_framework.decorators import throttle_classes
 from .models import Category, Product
 from .serializers import CategorySerializer, ProductSerializer
 from .permissions import IsStaffOrReadOnly
 from .filters import ProductFilter
 from .pagination import ProductCursorPagination
+from .documents import PRODUCT_PAGE_FIELDS, product_payloads, render_document, rows_for_ids
+from . import cache as catalog_cache
+from .conditional import ConditionalGetMixin, aggregate_validators, latest
+from .search import SEARCH_RANK, is_ranked, product_search_backend
+from . import bulk, columnar
+from . import export as catalog_export
+from .facets import database_facets, wants_facets
 
+# Query params the columnar fast path understands; anything else goes to the database.
+COLUMNAR_PARAMS = {'category__id', 'category__slug', 'min_price', 'max_price', 'ordering', 'search',
+                   'limit', 'cursor', 'facets', 'format'}
+# Category list requests answered from the cached full list.
+CATEGORY_LIST_CACHE_PARAMS = {'limit', 'offset'}
 
-class CategoryViewSet(viewsets.ModelViewSet):
+
+class CategoryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsStaffOrReadOnly]
 
+    def list(self, request, *args, **kwargs):
+        if getattr(settings, 'CATALOG_CACHE_ENABLED', False) and set(request.query_params) <= CATEGORY_LIST_CACHE_PARAMS:
+            return self._cached_list(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        not_modified = self.not_modified(request, *aggregate_validators(queryset, 'updated_at'))
+        if not_modified is not None:
+            return not_modified
+        return super().list(request, *args, **kwargs)
+
+    def _cached_list(self, request):
+        """Serve the list from one cached entry holding every category and its validators.
+
+        The entry depends on the `categories` tag alone, bumped by category
+        writes and product count changes, so it can live for
+        CATALOG_CATEGORY_CACHE_TTL. Pages are cut from it in memory: a hit
+        costs no queries, not even the paginator's COUNT.
+        """
+        cache_key = f'category:list:{request.build_absolute_uri(request.path)}'
+        try:
+            cached = catalog_cache.lookup(cache_key)
+            versions = None
+            if cached is catalog_cache.MISS:
+                versions = catalog_cache.tag_versions([catalog_cache.CATEGORIES_TAG])
+        except Exception:
+            cached, versions = catalog_cache.MISS, None
+
+        if cached is catalog_cache.MISS:
+            queryset = self.get_queryset()
+            cached = {'data': self.get_serializer(queryset, many=True).data,
+                      'validators': aggregate_validators(queryset, 'updated_at')}
+            if versions is not None:
+                try:
+                    catalog_cache.store(cache_key, cached, versions,
+                                        getattr(settings, 'CATALOG_CATEGORY_CACHE_TTL', 86400))
+                except Exception:
+                    pass
+        not_modified = self.not_modified(request, *cached['validators'])
+        if not_modified is not None:
+            return not_modified
+        page = self.paginate_queryset(cached['data'])
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(cached['data'])
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs[self.lookup_field])
+        except (TypeError, ValueError):
+            raise Http404
+        queryset = self.get_queryset().filter(pk=pk)
+        not_modified = self.not_modified(request, *aggregate_validators(queryset, 'updated_at'))
+        if not_modified is not None:
+            return not_modified
+        return super().retrieve(request, *args, **kwargs)
+
 
 @extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'facets', bool,
+                description='Add a `facets` block: category counts, price buckets, availability '
+                            'and variant attribute values.',
+            ),
+            OpenApiParameter(
+                'attr_<name>', str,
+                description='Variant attribute filter, e.g. `attr_size=M&attr_color=red,blue`: products with a '
+                            'variant having every listed attribute, with any of the comma-separated values.',
+            ),
+        ],
+    ),
     create=extend_schema(
         description="Create product (multipart/form-data with optional image).",
         request=ProductSerializer,
@@ -49,10 +135,9 @@ class CategoryViewSet(viewsets.ModelViewSet):
         responses=ProductSerializer,
     ),
 )
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [IsStaffOrReadOnly]
-    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
     filterset_class = ProductFilter
     ordering_fields = ['price', 'created_at', 'name']
     search_fields = ['name', 'description']
@@ -63,33 +148,294 @@ class ProductViewSet(viewsets.ModelViewSet):
     throttle_classes = [ScopedRateThrottle]
     throttle_scope = 'products'
 
+    @property
+    def filter_backends(self):
+        # The search backend is chosen by settings (CATALOG_SEARCH_BACKEND)
+        return [DjangoFilterBackend, OrderingFilter, product_search_backend()]
+
     def get_queryset(self):
         # Ensure we prefetch related category for list/detail to reduce queries
         return Product.objects.select_related('category').all()
 
-    # Cache the list view when caching is enabled in settings
-    if getattr(settings, 'USE_REDIS', False):
-        from rest_framework.response import Response
+    def _list_source(self, request, queryset):
+        """Where the list page comes from.
 
-        def _build_list_cache_key(request):
-            # Use full path (path + query string) to differentiate pages/filters
-            return f"product:list:{request.get_full_path()}"
+        With CATALOG_COLUMNAR_ENABLED, requests that only filter by category
+        and price and order by price or created_at are answered from the
+        in-memory snapshot (catalog/columnar.py); everything else uses the
+        filtered queryset.
+        """
+        params = request.query_params
+        if params.get('search') or set(params) - COLUMNAR_PARAMS:
+            return queryset
+        ordering = params.get('ordering')
+        if ordering and ordering.lstrip('-') not in columnar.SORTABLE:
+            return queryset
+        snapshot = columnar.get_snapshot()
+        if snapshot is None:
+            return queryset
+        try:
+            return columnar.ColumnarSelection(snapshot, params)
+        except ValueError:
+            return queryset
 
-        def list(self, request, *args, **kwargs):
-            # Manual caching allows targeted invalidation from signals
-            cache_key = _build_list_cache_key(request)
-            try:
-                cached = cache.get(cache_key)
-                if cached is not None:
-                    return Response(cached)
-            except Exception:
-                # On any cache error, fall back to normal behavior
-                return super().list(request, *args, **kwargs)
+    def _facet_base(self, request):
+        # Facets count beyond the category/price filters, but within the search
+        return product_search_backend()().filter_queryset(request, self.get_queryset(), self)
+
+    def _list_response(self, request, source):
+        if isinstance(source, columnar.ColumnarSelection):
+            page = self.paginate_queryset(source.query())
+            response = self.get_paginated_response(
+                product_payloads(rows_for_ids([row['id'] for row in page]), request))
+        else:
+            # Read path: fetch lean `.values()` rows joined with the precomputed
+            # document instead of model instances, so a page costs one query when
+            # documents are present and three when some must be serialized live.
+            fields = PRODUCT_PAGE_FIELDS + ((SEARCH_RANK,) if is_ranked(source) else ())
+            queryset = source.values(*fields)
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                response = self.get_paginated_response(product_payloads(page, request))
+            else:
+                response = Response(product_payloads(queryset, request))
+        if wants_facets(request) and isinstance(response.data, dict):
+            if isinstance(source, columnar.ColumnarSelection):
+                response.data['facets'] = source.facets()
+            else:
+                response.data['facets'] = database_facets(request, self._facet_base(request))
+        return response
+
+    def _list_cache_tags(self, request):
+        # A page filtered by category only depends on that category's products;
+        # anything else (including facet counts) may contain any product.
+        params = request.query_params
+        if wants_facets(request):
+            return [catalog_cache.CATALOG_TAG]
+        if params.get('category__id'):
+            return catalog_cache.category_tags(params['category__id'])
+        if params.get('category__slug'):
+            return [f"category-slug:{params['category__slug']}"]
+        return [catalog_cache.CATALOG_TAG]
+
+    def _list_validators(self, request, source):
+        # Facet counts cover products outside the filtered page.
+        if isinstance(source, columnar.ColumnarSelection):
+            return source.validators(everything=wants_facets(request))
+        if wants_facets(request):
+            source = self._facet_base(request)
+        # Document rebuilds track image/variant/category edits that leave
+        # Product.updated_at untouched.
+        return aggregate_validators(source, 'updated_at', 'document__updated_at')
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
 
-            resp = super().list(request, *args, **kwargs)
+        # Cache the list view when caching is enabled in settings
+        if not getattr(settings, 'CATALOG_CACHE_ENABLED', False):
+            source = self._list_source(request, queryset)
+            not_modified = self.not_modified(request, *self._list_validators(request, source))
+            if not_modified is not None:
+                return not_modified
+            return self._list_response(request, source)
+
+        # Entries are validated against tag versions bumped by catalog.signals,
+        # so writes only invalidate the pages they can affect. The page's
+        # validators are cached with it so a hit costs no queries at all.
+        # Use full URI (host + path + query string) to differentiate pages/filters
+        cache_key = f"product:list:{request.build_absolute_uri()}"
+        try:
+            cached = catalog_cache.lookup(cache_key)
+            versions = None
+            if cached is catalog_cache.MISS:
+                versions = catalog_cache.tag_versions(self._list_cache_tags(request))
+        except Exception:
+            # On any cache error, fall back to normal behavior
+            cached, versions = catalog_cache.MISS, None
+
+        if cached is not catalog_cache.MISS:
+            validators = cached['validators']
+        else:
+            source = self._list_source(request, queryset)
+            validators = self._list_validators(request, source)
+        not_modified = self.not_modified(request, *validators)
+        if not_modified is not None:
+            return not_modified
+        if cached is not catalog_cache.MISS:
+            return Response(cached['data'])
+
+        resp = self._list_response(request, source)
+        if versions is not None:
             try:
                 # Store serialized response data (resp.data) for quick return
-                cache.set(cache_key, resp.data, getattr(settings, 'CACHE_TTL', 60))
+                catalog_cache.store(cache_key, {'data': resp.data, 'validators': validators}, versions,
+                                    getattr(settings, 'CACHE_TTL', 60))
             except Exception:
                 pass
-            return resp
+        return resp
+
+    def _product_row(self, **lookup):
+        return self.get_queryset().values(*PRODUCT_PAGE_FIELDS).filter(**lookup).first()
+
+    @staticmethod
+    def _detail_validators(row):
+        modified = latest(row['updated_at'], row['document__updated_at'])
+        return f"{row['id']}:{modified.isoformat()}", modified
+
+    def _cached_entry(self, pk):
+        """Read-through detail cache; returns `{payload, validators}` or None if missing.
+
+        Missing ids are cached too (negative caching) with a short TTL; creating
+        a product bumps its `product:<id>` tag so the entry is dropped early.
+        """
+        key = f"product:detail:{pk}"
+        # On any cache error, fall back to the database (as the list does)
+        cached, versions = self._cache_lookup(key, [catalog_cache.product_tag(pk)])
+        if cached is not catalog_cache.MISS:
+            return cached
+        row = self._product_row(pk=pk)
+        if row is None:
+            self._cache_store(key, None, versions, getattr(settings, 'CATALOG_NEGATIVE_CACHE_TTL', 30))
+            return None
+        entry = {'payload': product_payloads([row])[0], 'validators': self._detail_validators(row)}
+        self._cache_store(key, entry, versions, getattr(settings, 'CATALOG_DETAIL_CACHE_TTL', 300),
+                          extra_tags=catalog_cache.category_tags(row['category_id']))
+        return entry
+
+    def _cached_pk_for_slug(self, slug):
+        key = f"product:detail:slug:{slug}"
+        # Unknown slugs are tagged with the catalog tag, which every product
+        # write (including bulk paths) bumps, so a new product shows up at once.
+        cached, versions = self._cache_lookup(key, [catalog_cache.CATALOG_TAG])
+        if cached is not catalog_cache.MISS:
+            return cached
+        pk = Product.objects.filter(slug=slug).values_list('pk', flat=True).first()
+        if pk is None:
+            self._cache_store(key, None, versions, getattr(settings, 'CATALOG_NEGATIVE_CACHE_TTL', 30))
+        elif versions is not None:
+            # a slug change saves the product, bumping its tag
+            self._cache_store(key, pk, {}, getattr(settings, 'CATALOG_DETAIL_CACHE_TTL', 300),
+                              extra_tags=[catalog_cache.product_tag(pk)])
+        return pk
+
+    @staticmethod
+    def _cache_lookup(key, tags):
+        """`(cached value or MISS, versions of tags to store a miss against)`; `(MISS, None)` on cache errors."""
+        try:
+            cached = catalog_cache.lookup(key)
+            if cached is not catalog_cache.MISS:
+                return cached, None
+            return cached, catalog_cache.tag_versions(tags)
+        except Exception:
+            return catalog_cache.MISS, None
+
+    @staticmethod
+    def _cache_store(key, value, versions, timeout, extra_tags=()):
+        # versions is None when the lookup failed: the cache is not usable
+        if versions is None:
+            return
+        try:
+            if extra_tags:
+                versions = {**versions, **catalog_cache.tag_versions(extra_tags)}
+            catalog_cache.store(key, value, versions, timeout)
+        except Exception:
+            pass
+
+    def _detail_response(self, request, pk=None, slug=None):
+        if getattr(settings, 'CATALOG_CACHE_ENABLED', False):
+            if slug is not None:
+                pk = self._cached_pk_for_slug(slug)
+            entry = self._cached_entry(pk) if pk is not None else None
+            if entry is None:
+                raise Http404
+            not_modified = self.not_modified(request, *entry['validators'])
+            if not_modified is not None:
+                return not_modified
+            return Response(render_document(entry['payload'], request))
+
+        row = self._product_row(slug=slug) if slug is not None else self._product_row(pk=pk)
+        if row is None:
+            raise Http404
+        not_modified = self.not_modified(request, *self._detail_validators(row))
+        if not_modified is not None:
+            return not_modified
+        return Response(product_payloads([row], request)[0])
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs[self.lookup_field])
+        except (TypeError, ValueError):
+            raise Http404
+        return self._detail_response(request, pk=pk)
+
+    @extend_schema(responses=ProductSerializer, description="Retrieve a product by its unique slug.")
+    @action(detail=False, methods=['get'], url_path=r'by-slug/(?P<slug>[-\w]+)')
+    def by_slug(self, request, slug=None):
+        return self._detail_response(request, slug=slug)
+
+    @extend_schema(
+        description=(
+            "Staff only. Bulk price/inventory update keyed by product `slug` or variant `sku`. "
+            "Send NDJSON (`application/x-ndjson`) or CSV (`text/csv`) as the request body, or upload "
+            "it as `file` in multipart form data. Rows are applied in chunks; invalid rows are "
+            "reported and skipped."
+        ),
+        request={
+            'application/x-ndjson': OpenApiTypes.BINARY,
+            'text/csv': OpenApiTypes.BINARY,
+            'multipart/form-data': {'type': 'object', 'properties': {'file': {'type': 'string', 'format': 'binary'}}},
+        },
+        responses=OpenApiTypes.OBJECT,
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-patch', permission_classes=[permissions.IsAdminUser])
+    def bulk_patch(self, request):
+        content_type = request.content_type.split(';')[0].strip().lower()
+        if content_type == 'multipart/form-data':
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'detail': 'Upload the patch file as "file".'}, status=status.HTTP_400_BAD_REQUEST)
+            stream, name = upload, upload.name.lower()
+        else:
+            # read the body lazily instead of through a parser
+            stream, name = request.stream, ''
+        fmt = request.query_params.get('input_format')
+        if not fmt:
+            fmt = 'csv' if content_type == 'text/csv' or name.endswith('.csv') else 'ndjson'
+        if fmt not in ('csv', 'ndjson'):
+            return Response({'detail': 'input_format must be "csv" or "ndjson".'}, status=status.HTTP_400_BAD_REQUEST)
+        if stream is None:
+            return Response({'detail': 'Empty request body.'}, status=status.HTTP_400_BAD_REQUEST)
+        report = bulk.apply_patches(bulk.iter_records(stream, fmt))
+        return Response(report.as_dict())
+
+    @extend_schema(
+        description=(
+            "Staff only. Stream the catalog (or the products matching the usual filters) as NDJSON, "
+            "one product per line, or CSV, one row per variant. Pass `gzip=1` to download a gzip "
+            "file instead. Rows are read and encoded in chunks, so the export never has to fit in "
+            "memory."
+        ),
+        parameters=[
+            OpenApiParameter('output_format', OpenApiTypes.STR, enum=catalog_export.FORMATS,
+                             description='ndjson (default) or csv'),
+            OpenApiParameter('gzip', OpenApiTypes.BOOL, description='Compress the output with gzip'),
+        ],
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.BINARY, (200, 'text/csv'): OpenApiTypes.BINARY},
+    )
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        fmt = request.query_params.get('output_format', 'ndjson')
+        if fmt not in catalog_export.FORMATS:
+            return Response({'detail': 'output_format must be "csv" or "ndjson".'}, status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes', 'on')
+        # like DjangoFilterBackend: an invalid filter is an error, not an unfiltered dump
+        filterset = ProductFilter(request.query_params, queryset=Product.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        queryset = filterset.qs
+        response = StreamingHttpResponse(
+            catalog_export.export_chunks(fmt, compress=compress, queryset=queryset, request=request),
+            content_type=catalog_export.content_type(fmt, compress),
+        )
+        response['Content-Disposition'] = f'attachment; filename="{catalog_export.filename(fmt, compress)}"'
+        return response
@@ -0,0 +1,70 @@
+import json
+import shutil
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from nexus.profiling import ProfileStore, format_stats, issue_token
+
+
+class Command(BaseCommand):
+    help = 'Issue staff profiling tokens and list or dump stored request profiles (see nexus/profiling.py).'
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+        token = actions.add_parser('token', help='Print a profiling token for a staff user')
+        token.add_argument('--user', required=True, help='Username of an active staff user')
+        actions.add_parser('list', help='List stored profiles, newest first')
+        dump = actions.add_parser('dump', help='Print one profile (id, unique id prefix, or "latest")')
+        dump.add_argument('profile_id')
+        dump.add_argument('--sort', default='cumulative', help='pstats sort key (cumulative, tottime, calls, ...)')
+        dump.add_argument('--limit', type=int, default=30, help='Functions to print')
+        dump.add_argument('--sql', action='store_true', help='Also print the SQL timeline')
+        dump.add_argument('--json', action='store_true', help='Print the stored JSON instead of a report')
+        dump.add_argument('--output', help='Copy the .prof file here (for snakeviz, pstats, ...)')
+
+    def handle(self, *args, **options):
+        return getattr(self, f"handle_{options['action']}")(options)
+
+    def handle_token(self, options):
+        user = get_user_model().objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"no user {options['user']!r}")
+        try:
+            self.stdout.write(issue_token(user))
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+    def handle_list(self, options):
+        store = ProfileStore()
+        ids = store.ids()
+        for profile_id in reversed(ids):
+            meta = store.load(profile_id)
+            self.stdout.write(f"{profile_id}  {meta['created_at']}  {meta['status']}  {meta['duration_ms']:>9.1f}ms  "
+                              f"{meta['sql']['count']:>4} sql  {meta['method']} {meta['path']}")
+        self.stdout.write(self.style.SUCCESS(f'{len(ids)} profiles in {store.directory}'))
+
+    def handle_dump(self, options):
+        store = ProfileStore()
+        try:
+            profile_id = store.resolve(options['profile_id'])
+        except KeyError as exc:
+            raise CommandError(exc.args[0])
+        meta = store.load(profile_id)
+        if options['output']:
+            shutil.copyfile(store.stats_path(profile_id), options['output'])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+            return
+        if options['json']:
+            self.stdout.write(json.dumps(meta, indent=2))
+            return
+        self.stdout.write(f"{meta['method']} {meta['path']} -> {meta['status']} in {meta['duration_ms']:.1f}ms "
+                          f"({meta['sql']['count']} queries, {meta['sql']['total_ms']:.1f}ms SQL)")
+        self.stdout.write(format_stats(store.stats_path(profile_id), options['sort'], options['limit']))
+        if options['sql']:
+            for entry in meta['sql']['timeline']:
+                self.stdout.write(f"{entry['start_ms']:>10.1f} +{entry['duration_ms']:>7.1f}ms  {entry['sql']}")
+                if entry['site']:
+                    self.stdout.write(f"{'':>21}{entry['site']}")
+            if meta['sql']['truncated']:
+                self.stdout.write(f"... timeline truncated at {len(meta['sql']['timeline'])} statements")
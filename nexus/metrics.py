@@ -0,0 +1,313 @@
+"""Per-view request metrics in Prometheus text format.
+
+`MetricsMiddleware` records for every request, labelled by URL name
+(`product-list`, `cart-add-item`, ...):
+
+- nexus_http_requests_total{view,method,status} and nexus_http_throttled_total{view}
+- nexus_http_request_duration_seconds{view,method} (histogram)
+- nexus_http_response_bytes{view} (histogram)
+- nexus_db_queries_per_request{view} and nexus_db_query_duration_seconds{view} (histograms)
+- nexus_cache_requests_total{view,cache,result} from read-through caches calling `record_cache`
+- nexus_http_queue_seconds (histogram), when the proxy sets X-Request-Start
+
+Each process keeps its series in memory and writes them to
+`METRICS_DIR/<pid>-<start>.json` at most every METRICS_FLUSH_SECONDS (the
+write is atomic). The endpoint (`/internal/metrics`) flushes its own process
+and sums the files of all workers, so every gunicorn worker's requests are
+counted whichever worker answers the scrape. Files of exited workers are kept
+so counters do not go backwards; clear the directory when the server starts
+(start.sh does). The endpoint answers METRICS_ALLOWED_IPS, or requests
+carrying `Authorization: Bearer <METRICS_TOKEN>`.
+"""
+import atexit
+import contextvars
+import hmac
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'nexus_http_requests_total': ('counter', 'Requests by view, method and status.', None),
+    'nexus_http_throttled_total': ('counter', 'Requests answered 429 by a throttle.', None),
+    'nexus_http_request_duration_seconds': ('histogram', 'Time spent in Django per request.', LATENCY_BUCKETS),
+    'nexus_http_response_bytes': ('histogram', 'Response body size.', BYTES_BUCKETS),
+    'nexus_http_queue_seconds': ('histogram', 'Time between the proxy (X-Request-Start) and Django.',
+                                 LATENCY_BUCKETS),
+    'nexus_db_queries_per_request': ('histogram', 'SQL statements per request.', QUERY_BUCKETS),
+    'nexus_db_query_duration_seconds': ('histogram', 'SQL time per request.', LATENCY_BUCKETS),
+    'nexus_cache_requests_total': ('counter', 'Read-through cache lookups by result.', None),
+}
+
+_current = contextvars.ContextVar('nexus_metrics_request', default=None)
+
+
+class Registry:
+    """Counters and histograms of this process, keyed by (metric, sorted label pairs)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.pid = os.getpid()
+            self.started = time.time_ns()
+            self.counters = defaultdict(float)
+            # key -> [count per bucket..., +Inf count, sum]
+            self.histograms = {}
+            self.last_flush = 0.0
+
+    def _check_fork(self):
+        # a worker forked from a process that already recorded starts from zero
+        if self.pid != os.getpid():
+            self.reset()
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            for i, edge in enumerate(buckets):
+                if value <= edge:
+                    series[i] += 1
+                    break
+            else:
+                series[len(buckets)] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(series)] for (name, labels), series in self.histograms.items()],
+            }
+
+    def path(self):
+        return Path(metrics_dir()) / f'{self.pid}-{self.started}.json'
+
+    def flush(self):
+        path = self.path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.tmp')
+        tmp.write_text(json.dumps(self.snapshot()), encoding='utf-8')
+        os.replace(tmp, path)
+        self.last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= getattr(settings, 'METRICS_FLUSH_SECONDS', 1.0):
+            self.flush()
+
+
+registry = Registry()
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', Path(settings.BASE_DIR) / 'var' / 'metrics')
+
+
+@atexit.register
+def _flush_at_exit():
+    if registry.counters or registry.histograms:
+        try:
+            registry.flush()
+        except Exception:
+            pass
+
+
+class RequestMetrics:
+    """What one request did; also the `connection.execute_wrapper` hook counting its SQL."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.cache = defaultdict(int)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_seconds += time.perf_counter() - started
+
+
+def record_cache(cache, hit):
+    """Count a read-through cache lookup (`cache` names it, e.g. 'product-detail') for the current request."""
+    current = _current.get()
+    if current is not None:
+        current.cache[(cache, 'hit' if hit else 'miss')] += 1
+
+
+def queue_seconds(header, now=None):
+    """Seconds since the proxy stamped X-Request-Start (`t=<epoch>` in s, ms or us), or None."""
+    if not header:
+        return None
+    value = header.split('t=', 1)[-1].strip()
+    try:
+        stamp = float(value)
+    except ValueError:
+        return None
+    # nginx uses seconds with a fraction, Heroku/Render milliseconds, some proxies microseconds
+    while stamp > 1e11:
+        stamp /= 1000
+    delay = (now if now is not None else time.time()) - stamp
+    return max(delay, 0.0)
+
+
+def _response_bytes(response):
+    if response.streaming:
+        length = response.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        arrived = time.time()
+        started = time.perf_counter()
+        current = RequestMetrics()
+        token = _current.set(current)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(current))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else '<unmatched>'
+        if view == 'metrics':
+            return response
+        registry._check_fork()
+        registry.inc('nexus_http_requests_total', {'view': view, 'method': request.method,
+                                                   'status': str(response.status_code)})
+        if response.status_code == 429:
+            registry.inc('nexus_http_throttled_total', {'view': view})
+        registry.observe('nexus_http_request_duration_seconds', {'view': view, 'method': request.method}, duration)
+        size = _response_bytes(response)
+        if size is not None:
+            registry.observe('nexus_http_response_bytes', {'view': view}, size)
+        registry.observe('nexus_db_queries_per_request', {'view': view}, current.queries)
+        registry.observe('nexus_db_query_duration_seconds', {'view': view}, current.sql_seconds)
+        for (cache, result), n in current.cache.items():
+            registry.inc('nexus_cache_requests_total', {'view': view, 'cache': cache, 'result': result}, n)
+        queued = queue_seconds(request.META.get('HTTP_X_REQUEST_START'), arrived)
+        if queued is not None:
+            registry.observe('nexus_http_queue_seconds', {}, queued)
+        try:
+            registry.maybe_flush()
+        except OSError:
+            # metrics must never fail a request
+            pass
+        return response
+
+
+def collect(directory=None):
+    """Sum the series of every worker file in `directory` -> (counters, histograms)."""
+    counters = defaultdict(float)
+    histograms = {}
+    for path in sorted(Path(directory or metrics_dir()).glob('*.json')):
+        try:
+            data = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            # replaced or removed while we listed the directory
+            continue
+        for name, labels, value in data['counters']:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, series in data['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.get(key)
+            if merged is None or len(merged) != len(series):
+                histograms[key] = list(series)
+            else:
+                histograms[key] = [a + b for a, b in zip(merged, series)]
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def render(counters, histograms):
+    """Prometheus text exposition format (0.0.4)."""
+    by_metric = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_metric[name].append((labels, value))
+    for (name, labels), series in histograms.items():
+        by_metric[name].append((labels, series))
+
+    lines = []
+    for name in sorted(by_metric):
+        kind, help_text, buckets = METRICS.get(name, ('untyped', '', None))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_metric[name]):
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for edge, count in zip(buckets + (float('inf'),), value[:-1]):
+                cumulative += count
+                le = '+Inf' if edge == float('inf') else _number(edge)
+                lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {_number(cumulative)}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {_number(cumulative)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _allowed(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if hmac.compare_digest(header, f'Bearer {token}'):
+            return True
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+
+
+def metrics_view(request):
+    if not _allowed(request):
+        return HttpResponseForbidden('metrics are internal')
+    registry._check_fork()
+    registry.flush()
+    counters, histograms = collect()
+    return HttpResponse(render(counters, histograms), content_type='text/plain; version=0.0.4; charset=utf-8')
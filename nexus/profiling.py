@@ -0,0 +1,222 @@
+"""On-demand request profiling for staff.
+
+A request is profiled only when it carries a signed profiling token in the
+`X-Profile` header or the `_profile` query parameter. Tokens are issued for
+staff users with `python manage.py request_profiles token --user <name>` and
+expire after PROFILING_TOKEN_MAX_AGE seconds; the user must still be active
+staff when the token is used. Requests without the trigger pass straight
+through (one dict lookup and one substring test).
+
+A profiled request runs under cProfile with every SQL statement recorded on
+a timeline (offset, duration, statement, calling line). The result is
+written to PROFILING_DIR as `<id>.prof` (pstats, for snakeviz and friends)
+and `<id>.json` (request, SQL timeline, top functions). The directory is a
+ring buffer holding the newest PROFILING_MAX_PROFILES profiles. The response
+gets an `X-Profile-Id` header; `request_profiles list|dump` reads them back.
+"""
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .querybudget import project_frame
+
+HEADER = 'HTTP_X_PROFILE'
+PARAM = '_profile'
+SALT = 'nexus.profiling'
+# functions kept in the JSON summary
+TOP_FUNCTIONS = 40
+_counter = itertools.count()
+
+
+def issue_token(user):
+    """Signed profiling token for a staff `user`."""
+    if not (user.is_active and user.is_staff):
+        raise ValueError(f'{user} is not active staff')
+    return signing.dumps(user.pk, salt=SALT)
+
+
+def token_user_id(token):
+    """The user id a valid, unexpired token was issued for, or None."""
+    try:
+        return signing.loads(token, salt=SALT, max_age=getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return None
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'var' / 'profiles'))
+
+
+def _new_id():
+    # sorts by time, unique across workers and threads
+    return f'{time.time_ns():020d}-{os.getpid()}-{next(_counter)}'
+
+
+class SQLTimeline:
+    """`connection.execute_wrapper` hook recording statements in order, relative to `started`."""
+
+    def __init__(self, started, limit):
+        self.started = started
+        self.limit = limit
+        self.entries = []
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        begin = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - begin
+            self.count += 1
+            self.seconds += elapsed
+            if len(self.entries) < self.limit:
+                frame = project_frame()
+                self.entries.append({
+                    'start_ms': round((begin - self.started) * 1000, 3),
+                    'duration_ms': round(elapsed * 1000, 3),
+                    'sql': sql,
+                    'site': f'{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}' if frame else None,
+                })
+
+
+def top_functions(profiler, limit=TOP_FUNCTIONS):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({'function': f'{filename}:{line}({name})', 'calls': calls,
+                     'total_ms': round(total * 1000, 3), 'cumulative_ms': round(cumulative * 1000, 3)})
+    rows.sort(key=lambda row: -row['cumulative_ms'])
+    return rows[:limit]
+
+
+class ProfileStore:
+    """Profiles on disk, newest `capacity` kept."""
+
+    def __init__(self, directory=None, capacity=None):
+        self.directory = Path(directory or profile_dir())
+        self.capacity = capacity or getattr(settings, 'PROFILING_MAX_PROFILES', 50)
+
+    def save(self, profile_id, meta, profiler):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        prof_path = self.directory / f'{profile_id}.prof'
+        profiler.dump_stats(str(prof_path))
+        # the .json is written last and atomically; it marks the profile as complete
+        tmp = self.directory / f'.{profile_id}.json.tmp'
+        tmp.write_text(json.dumps(meta, indent=1, default=str), encoding='utf-8')
+        os.replace(tmp, self.directory / f'{profile_id}.json')
+        self.trim()
+
+    def ids(self):
+        if not self.directory.is_dir():
+            return []
+        return sorted(p.stem for p in self.directory.glob('*.json'))
+
+    def trim(self):
+        for profile_id in self.ids()[:-self.capacity]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    (self.directory / f'{profile_id}{suffix}').unlink()
+                except FileNotFoundError:
+                    # another worker trimmed it first
+                    pass
+
+    def load(self, profile_id):
+        return json.loads((self.directory / f'{profile_id}.json').read_text(encoding='utf-8'))
+
+    def stats_path(self, profile_id):
+        return self.directory / f'{profile_id}.prof'
+
+    def resolve(self, prefix):
+        """The stored id starting with `prefix` (`latest` for the newest)."""
+        ids = self.ids()
+        if prefix == 'latest':
+            if not ids:
+                raise KeyError('no profiles stored')
+            return ids[-1]
+        matches = [i for i in ids if i.startswith(prefix)]
+        if len(matches) != 1:
+            raise KeyError(f'{len(matches)} profiles match {prefix!r}')
+        return matches[0]
+
+
+def format_stats(path, sort='cumulative', limit=30):
+    out = io.StringIO()
+    pstats.Stats(str(path), stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        meta = request.META
+        if HEADER not in meta and f'{PARAM}=' not in meta.get('QUERY_STRING', ''):
+            return self.get_response(request)
+        user_id = self._authorized_user(meta.get(HEADER) or request.GET.get(PARAM, ''))
+        if user_id is None:
+            return self.get_response(request)
+        return self._profile(request, user_id)
+
+    @staticmethod
+    def _authorized_user(token):
+        from django.contrib.auth import get_user_model
+        user_id = token_user_id(token)
+        if user_id is None:
+            return None
+        if not get_user_model().objects.filter(pk=user_id, is_active=True, is_staff=True).exists():
+            return None
+        return user_id
+
+    def _profile(self, request, user_id):
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        timeline = SQLTimeline(started, getattr(settings, 'PROFILING_MAX_QUERIES', 2000))
+        profiler = cProfile.Profile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timeline))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+
+        profile_id = _new_id()
+        match = getattr(request, 'resolver_match', None)
+        ProfileStore().save(profile_id, {
+            'id': profile_id,
+            'created_at': started_at.isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'query': {k: v for k, v in request.GET.lists() if k != PARAM},
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'user_id': user_id,
+            'sql': {
+                'count': timeline.count,
+                'total_ms': round(timeline.seconds * 1000, 3),
+                'truncated': timeline.count > len(timeline.entries),
+                'timeline': timeline.entries,
+            },
+            'top': top_functions(profiler),
+        }, profiler)
+        response['X-Profile-Id'] = profile_id
+        return response
@@ -0,0 +1,218 @@
+"""Per-request SQL budgets and N+1 detection.
+
+Every statement run while a request (or a `query_budget` block) is active is
+fingerprinted -- literals, placeholders and IN/VALUES lists collapsed -- and
+grouped by the innermost project frame that issued it. A group that repeats
+QUERY_DUPLICATE_THRESHOLD times or more is the usual N+1 shape: the same
+query from the same line once per row. The report carries the Python stack
+of the first occurrence so the lazy access is easy to find.
+
+`QueryBudgetMiddleware` checks each request against the budget for its view
+(QUERY_BUDGETS, keyed by URL name such as `product-list`, falling back to
+QUERY_BUDGET_DEFAULT) and, depending on QUERY_BUDGET_MODE:
+
+- `log`: logs the report on the `nexus.queries` logger
+- `header`: adds X-Query-Count / X-Query-Time-Ms / X-Query-Budget headers and
+  X-Query-Problems when something is wrong
+- `raise`: raises QueryBudgetExceeded (meant for tests)
+- `off` (default): the middleware removes itself at startup
+
+Queries issued while a streaming response is consumed are not counted.
+"""
+import functools
+import logging
+import re
+import sys
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('nexus.queries')
+
+MODES = ('off', 'log', 'header', 'raise')
+DEFAULT_DUPLICATE_THRESHOLD = 5
+# frames shown per offending query
+STACK_LIMIT = 12
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?|%\(\w+\)s')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """The shape of `sql`: literals and placeholders become `?`, lists become `(...)`."""
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    sql = _ROWS.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+@functools.lru_cache(maxsize=None)
+def _project_root():
+    return str(Path(settings.BASE_DIR).resolve())
+
+
+def _is_project_frame(filename, root):
+    return filename.startswith(root) and 'site-packages' not in filename and filename != __file__
+
+
+def project_frame(skip=2):
+    """The innermost frame of project code, starting `skip` frames up from here.
+
+    The default skips this function and the execute wrapper calling it.
+    """
+    root = _project_root()
+    frame = sys._getframe(skip)
+    while frame is not None:
+        if _is_project_frame(frame.f_code.co_filename, root):
+            return frame
+        frame = frame.f_back
+    return None
+
+
+class QueryGroup:
+    """Statements with one fingerprint from one call site."""
+
+    def __init__(self, fingerprint, site, sql, stack):
+        self.fingerprint = fingerprint
+        self.site = site
+        self.sql = sql
+        self.stack = stack
+        self.count = 0
+        self.seconds = 0.0
+
+    def describe(self):
+        lines = [f'{self.count} x {self.site} ({self.seconds * 1000:.1f}ms)', f'  {self.sql}',
+                 '  Stack (most recent call last):']
+        lines.extend('    ' + line for frame in self.stack for line in frame.rstrip().splitlines())
+        return '\n'.join(lines)
+
+
+class QueryInspector:
+    """`connection.execute_wrapper` hook grouping statements by fingerprint and call site."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.groups = {}
+        self._root = _project_root()
+
+    @contextmanager
+    def capture(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            frame = project_frame()
+            site = (f'{Path(frame.f_code.co_filename).relative_to(self._root)}:{frame.f_lineno} '
+                    f'in {frame.f_code.co_name}') if frame else '<framework>'
+            key = (fingerprint(sql), site)
+            group = self.groups.get(key)
+            if group is None:
+                # the stack is only built once per group
+                stack = []
+                if frame is not None:
+                    summary = traceback.extract_stack(frame)
+                    stack = traceback.format_list(
+                        [f for f in summary if _is_project_frame(f.filename, self._root)][-STACK_LIMIT:])
+                group = self.groups[key] = QueryGroup(key[0], site, sql, stack)
+            group.count += 1
+            group.seconds += elapsed
+
+    def duplicates(self, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+        """Groups repeated at least `threshold` times, most frequent first."""
+        return sorted((g for g in self.groups.values() if g.count >= threshold), key=lambda g: -g.count)
+
+    def problems(self, budget=None, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+        """(over budget: bool, N+1 groups)."""
+        return budget is not None and self.count > budget, self.duplicates(threshold)
+
+    def report(self, label, budget=None, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+        over, repeated = self.problems(budget, threshold)
+        lines = []
+        if over:
+            lines.append(f'{label}: {self.count} queries, budget {budget}')
+        for group in repeated:
+            lines.append(f'{label}: possible N+1, same query repeated {group.describe()}')
+        return '\n'.join(lines)
+
+
+class QueryBudgetExceeded(Exception):
+    """A request or block ran more queries than its budget, or repeated one query per row."""
+
+
+def budget_for(view_name):
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    if view_name in budgets:
+        return budgets[view_name]
+    return getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.mode = getattr(settings, 'QUERY_BUDGET_MODE', 'off')
+        if self.mode not in MODES:
+            raise ValueError(f'QUERY_BUDGET_MODE must be one of {", ".join(MODES)}, not {self.mode!r}')
+        if self.mode == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_DUPLICATE_THRESHOLD', DEFAULT_DUPLICATE_THRESHOLD)
+
+    def __call__(self, request):
+        inspector = QueryInspector()
+        with inspector.capture():
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        budget = budget_for(view_name)
+        over, repeated = inspector.problems(budget, self.threshold)
+        if self.mode == 'header':
+            response['X-Query-Count'] = str(inspector.count)
+            response['X-Query-Time-Ms'] = f'{inspector.seconds * 1000:.1f}'
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+            summary = [f'budget {inspector.count}>{budget}'] if over else []
+            summary += [f'n+1 {g.count}x {g.site}' for g in repeated]
+            if summary:
+                response['X-Query-Problems'] = '; '.join(summary)
+        elif over or repeated:
+            report = inspector.report(f'{request.method} {request.path} ({view_name})', budget, self.threshold)
+            if self.mode == 'raise':
+                raise QueryBudgetExceeded(report)
+            logger.warning(report)
+        return response
+
+
+@contextmanager
+def query_budget(max_queries=None, duplicate_threshold=DEFAULT_DUPLICATE_THRESHOLD, label='block'):
+    """Test helper: fail with an AssertionError when the block exceeds `max_queries`
+    or repeats one query `duplicate_threshold` times from the same line.
+
+        with query_budget(max_queries=3):
+            self.client.get('/api/orders/orders/')
+    """
+    inspector = QueryInspector()
+    with inspector.capture():
+        yield inspector
+    report = inspector.report(label, max_queries, duplicate_threshold)
+    if report:
+        raise AssertionError(report)
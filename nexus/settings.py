@@ -52,7 +52,13 @@ DEBUG = _bool_env('DJANGO_DEBUG', _bool_env('DEBUG', True))
 ALLOWED_HOSTS = os.getenv('DJANGO_ALLOWED_HOSTS', os.getenv('ALLOWED_HOSTS', '*')).split(',')
 
 MIDDLEWARE = [
+    # outermost, so latency covers every other middleware
+    'nexus.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # first, so the session and user lookups count too; removes itself when QUERY_BUDGET_MODE=off
+    'nexus.querybudget.QueryBudgetMiddleware',
+    # profiles requests carrying a signed staff token (X-Profile header or ?_profile=)
+    'nexus.profiling.ProfilingMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -98,6 +104,8 @@ INSTALLED_APPS = [
     'catalog',
     'accounts',
     'orders',
+    # management commands for the project-level tools (nexus/profiling.py)
+    'nexus',
 ]
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -208,7 +216,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_FILTER_BACKENDS': [
@@ -218,17 +226,19 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 20,
-    # Throttling: apply anonymous and user throttles by default and allow scoped throttles
+    # Throttling: apply anonymous and user throttles by default and allow scoped throttles.
+    # nexus/throttling.py keeps the same rates in atomic sliding-window counters.
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.ScopedRateThrottle',
+        'nexus.throttling.AnonRateThrottle',
+        'nexus.throttling.UserRateThrottle',
+        'nexus.throttling.ScopedRateThrottle',
     ],
+    # Rates can be raised from the environment for load tests (scripts/load_test.py)
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '200/day',
-        'user': '2000/day',
+        'anon': os.getenv('THROTTLE_RATE_ANON', '200/day'),
+        'user': os.getenv('THROTTLE_RATE_USER', '2000/day'),
         # scoped key for product endpoints
-        'products': '60/min',
+        'products': os.getenv('THROTTLE_RATE_PRODUCTS', '60/min'),
     },
 }
 
@@ -259,6 +269,111 @@ SPECTACULAR_SETTINGS.setdefault('SECURITY', [{'jwtAuth': []}])
 # Caching configuration: use local memory cache by default, or Redis when USE_REDIS=1
 USE_REDIS = os.getenv('USE_REDIS', '0') == '1'
 CACHE_TTL = int(os.getenv('CACHE_TTL', '60'))  # default cache TTL in seconds for view caching
+# JWT user lookups (accounts/authentication.py): users are read from a per-process LRU
+# (AUTH_USER_LOCAL_SECONDS) backed by the shared cache (AUTH_USER_CACHE_SECONDS) instead of
+# the database. Needs a shared cache, so it follows USE_REDIS by default. AUTH_TOKEN_USER_CLAIMS
+# adds is_staff/is_active claims to new tokens so even an uncached user costs no query. Only the
+# `auth:revoked:<id>` cache markers revoke those claims: if one is evicted or the cache is flushed,
+# a deactivated or demoted user keeps access until their refresh token expires. Use it only with a
+# Redis that does not evict them (e.g. maxmemory-policy noeviction); it refuses per-process caches.
+AUTH_USER_CACHE_ENABLED = _bool_env('AUTH_USER_CACHE_ENABLED', USE_REDIS)
+AUTH_USER_CACHE_SECONDS = int(os.getenv('AUTH_USER_CACHE_SECONDS', '300'))
+AUTH_USER_LOCAL_SECONDS = float(os.getenv('AUTH_USER_LOCAL_SECONDS', '5'))
+AUTH_USER_LOCAL_SIZE = int(os.getenv('AUTH_USER_LOCAL_SIZE', '4096'))
+AUTH_TOKEN_USER_CLAIMS = _bool_env('AUTH_TOKEN_USER_CLAIMS', False)
+# Cache catalog list responses (tag-invalidated, see catalog/cache.py). On by default with Redis;
+# with the local-memory cache each worker would only see its own invalidations.
+CATALOG_CACHE_ENABLED = _bool_env('CATALOG_CACHE_ENABLED', USE_REDIS)
+# Product detail entries are tag-invalidated, so they can live longer than list pages.
+CATALOG_DETAIL_CACHE_TTL = int(os.getenv('CATALOG_DETAIL_CACHE_TTL', '300'))
+# How long "no such product" answers are cached for repeated misses.
+CATALOG_NEGATIVE_CACHE_TTL = int(os.getenv('CATALOG_NEGATIVE_CACHE_TTL', '30'))
+# The category list is one cached entry invalidated by category writes and product count
+# changes, so it can be kept for a long time.
+CATALOG_CATEGORY_CACHE_TTL = int(os.getenv('CATALOG_CATEGORY_CACHE_TTL', '86400'))
+# Ranked tsvector search for ?search= on PostgreSQL (catalog/search.py); other databases
+# always use DRF's SearchFilter.
+CATALOG_FULL_TEXT_SEARCH = _bool_env('CATALOG_FULL_TEXT_SEARCH', True)
+# 'bm25' answers ?search= from the in-process index in catalog/bm25.py (meant for SQLite
+# deployments); 'auto' uses PostgreSQL full-text search or DRF's SearchFilter.
+CATALOG_SEARCH_BACKEND = os.getenv('CATALOG_SEARCH_BACKEND', 'auto')
+CATALOG_SEARCH_INDEX_PATH = os.getenv('CATALOG_SEARCH_INDEX_PATH', str(BASE_DIR / 'var' / 'search_index.zip'))
+# How often a worker re-reads products changed by other workers into its index (on a
+# background thread), and how often that also scans the product ids for deletions.
+CATALOG_SEARCH_INDEX_SYNC_SECONDS = float(os.getenv('CATALOG_SEARCH_INDEX_SYNC_SECONDS', '5'))
+CATALOG_SEARCH_INDEX_RECONCILE_SECONDS = float(os.getenv('CATALOG_SEARCH_INDEX_RECONCILE_SECONDS', '300'))
+CATALOG_SEARCH_MAX_RESULTS = int(os.getenv('CATALOG_SEARCH_MAX_RESULTS', '500'))
+# Answer category/price filtered product lists and facet counts from a per-worker NumPy
+# snapshot (catalog/columnar.py) instead of the database. Requires numpy.
+CATALOG_COLUMNAR_ENABLED = _bool_env('CATALOG_COLUMNAR_ENABLED', False)
+# Background re-sync interval, and how often a sync also scans the product ids for deletions.
+CATALOG_COLUMNAR_SYNC_SECONDS = float(os.getenv('CATALOG_COLUMNAR_SYNC_SECONDS', '5'))
+CATALOG_COLUMNAR_RECONCILE_SECONDS = float(os.getenv('CATALOG_COLUMNAR_RECONCILE_SECONDS', '300'))
+# Variant attributes listed in the facet block (comma-separated); empty lists every attribute.
+CATALOG_ATTRIBUTE_FACETS = [
+    name.strip() for name in os.getenv('CATALOG_ATTRIBUTE_FACETS', '').split(',') if name.strip()
+]
+# Price facet bucket boundaries; the last bucket is open-ended.
+CATALOG_PRICE_FACET_EDGES = [
+    edge.strip() for edge in os.getenv('CATALOG_PRICE_FACET_EDGES', '0,10,25,50,100,250,500').split(',') if edge.strip()
+]
+# Resized WebP/JPEG copies of product images (catalog/renditions.py), generated after an
+# upload commits. CATALOG_RENDITIONS_MODE: 'inline' renders in the process that saved the
+# upload; 'worker' leaves it to `generate_image_renditions --loop` (polling every
+# CATALOG_RENDITIONS_POLL_SECONDS); 'pool' (opt-in) starts a process pool of
+# CATALOG_RENDITION_WORKERS in every web worker. `generate_image_renditions` backfills.
+CATALOG_RENDITIONS_ENABLED = _bool_env('CATALOG_RENDITIONS_ENABLED', True)
+CATALOG_RENDITIONS_MODE = os.getenv('CATALOG_RENDITIONS_MODE', 'inline')
+CATALOG_RENDITIONS_POLL_SECONDS = float(os.getenv('CATALOG_RENDITIONS_POLL_SECONDS', '10'))
+CATALOG_RENDITION_WORKERS = int(os.getenv('CATALOG_RENDITION_WORKERS', '2'))
+CATALOG_RENDITION_WIDTHS = [
+    int(width) for width in os.getenv('CATALOG_RENDITION_WIDTHS', '160,320,640,1024').split(',') if width.strip()
+]
+CATALOG_RENDITION_FORMATS = [
+    fmt.strip() for fmt in os.getenv('CATALOG_RENDITION_FORMATS', 'webp,jpeg').split(',') if fmt.strip()
+]
+# Per-request SQL budgets and N+1 detection (nexus/querybudget.py): 'off', 'log', 'header' or
+# 'raise'. Budgets are keyed by URL name; views without one use QUERY_BUDGET_DEFAULT.
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'off')
+QUERY_BUDGET_DEFAULT = int(os.getenv('QUERY_BUDGET_DEFAULT', '50'))
+QUERY_BUDGETS = {
+    'product-list': 8,
+    'product-detail': 4,
+    'product-by-slug': 4,
+    'category-list': 4,
+    'category-detail': 4,
+    'cart-list': 6,
+    'cart-detail': 6,
+    'cart-add-item': 10,
+    'order-list': 6,
+    'order-detail': 6,
+}
+# The same query from the same line this many times in one request is reported as an N+1.
+QUERY_DUPLICATE_THRESHOLD = int(os.getenv('QUERY_DUPLICATE_THRESHOLD', '5'))
+# On-demand cProfile + SQL timeline for requests with a staff token from
+# `manage.py request_profiles token` (nexus/profiling.py). Profiles are kept in a
+# ring buffer of the newest PROFILING_MAX_PROFILES under PROFILING_DIR.
+PROFILING_ENABLED = _bool_env('PROFILING_ENABLED', True)
+PROFILING_DIR = os.getenv('PROFILING_DIR', str(BASE_DIR / 'var' / 'profiles'))
+PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', '50'))
+PROFILING_MAX_QUERIES = int(os.getenv('PROFILING_MAX_QUERIES', '2000'))
+PROFILING_TOKEN_MAX_AGE = int(os.getenv('PROFILING_TOKEN_MAX_AGE', '3600'))
+# Per-view latency/SQL/cache histograms exposed in Prometheus format at /internal/metrics
+# (nexus/metrics.py). Each worker writes its series to METRICS_DIR at most every
+# METRICS_FLUSH_SECONDS; the endpoint sums all workers. Scrapes are allowed from
+# METRICS_ALLOWED_IPS or with `Authorization: Bearer <METRICS_TOKEN>`.
+METRICS_ENABLED = _bool_env('METRICS_ENABLED', True)
+METRICS_DIR = os.getenv('METRICS_DIR', str(BASE_DIR / 'var' / 'metrics'))
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '1'))
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Throttle counters (nexus/throttling.py): 'auto' uses Redis (one Lua call per check) when
+# USE_REDIS, else the Django cache (shared only on memcached/Redis backends: under LocMemCache
+# each worker counts separately; 'cache' refuses such a cache). Each worker leases tokens for up to THROTTLE_LEASE_SECONDS,
+# at most THROTTLE_LEASE_FRACTION of a limit at a time, and checks them locally.
+THROTTLE_BACKEND = os.getenv('THROTTLE_BACKEND', 'auto')
+THROTTLE_LEASE_SECONDS = float(os.getenv('THROTTLE_LEASE_SECONDS', '1'))
+THROTTLE_LEASE_FRACTION = float(os.getenv('THROTTLE_LEASE_FRACTION', '0.1'))
 if USE_REDIS:
     # django-redis backend
     CACHES = {
@@ -280,3 +395,20 @@ else:
 # Email settings: use console backend in development unless overridden
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@example.com')
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+# SMTP connection for django.core.mail.backends.smtp.EmailBackend
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = _bool_env('EMAIL_USE_TLS', False)
+EMAIL_USE_SSL = _bool_env('EMAIL_USE_SSL', False)
+# Account emails are queued in the outbox table and sent by `manage.py send_outbox --loop`
+# (accounts/outbox.py), OUTBOX_BATCH_SIZE per connection. Failed sends are retried after
+# OUTBOX_RETRY_SECONDS, doubling up to OUTBOX_MAX_RETRY_SECONDS, for OUTBOX_MAX_ATTEMPTS attempts.
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '2'))
+OUTBOX_RETRY_SECONDS = int(os.getenv('OUTBOX_RETRY_SECONDS', '30'))
+OUTBOX_MAX_RETRY_SECONDS = int(os.getenv('OUTBOX_MAX_RETRY_SECONDS', '3600'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_CLAIM_SECONDS = int(os.getenv('OUTBOX_CLAIM_SECONDS', '300'))
+OUTBOX_KEEP_SENT_DAYS = int(os.getenv('OUTBOX_KEEP_SENT_DAYS', '7'))
@@ -0,0 +1,289 @@
+"""Atomic sliding-window throttles with a per-process token-bucket tier.
+
+DRF's throttles keep a list of request timestamps per client and read,
+trim and write it back on every request: several cache round trips that race
+with each other, and work that grows with the history. These drop-in
+replacements (`AnonRateThrottle`, `UserRateThrottle`, `ScopedRateThrottle`)
+keep two integers per client instead, a counter for the current fixed window
+and one for the previous, and estimate the sliding window as
+
+    previous * (share of the previous window still inside the sliding window) + current
+
+The counters live in a window store:
+
+- `RedisWindowStore` (USE_REDIS): one Lua script reads both counters and
+  grants tokens atomically, a single round trip shared by every worker.
+- `CacheWindowStore` (otherwise): the Django cache, updated with `add` and
+  `incr` only, so it is as atomic as the backend's `incr`: across processes
+  on memcached and Redis, within one process on LocMemCache. Tokens are
+  taken optimistically (`incr`) and any excess handed straight back, so
+  racing requests can be refused slightly early but never exceed a limit.
+
+Limits are only shared between workers, and so only enforced as configured,
+with a shared cache whose `incr` is atomic (SHARED_ATOMIC_CACHES). With the
+default LocMemCache each worker counts on its own, as DRF's throttles did,
+and the effective limit is the configured one times the number of workers;
+`build_store` logs a warning then. THROTTLE_BACKEND=cache refuses to start
+on such a cache.
+
+In front of the store each process holds a short lease of tokens per client
+(`LeaseTier`). A check spends a local token; only when the lease is used up
+or expires (THROTTLE_LEASE_SECONDS) does it go to the store, asking for
+twice as many tokens as last time when the previous lease ran out in time,
+up to THROTTLE_LEASE_FRACTION of the limit. Unused tokens are handed back
+with the next request to the store. A denial is also remembered until the
+client may retry. Busy clients are therefore checked locally almost
+always, and idle ones lease a single token at a time so their limit is not
+eaten by leases they never use.
+
+THROTTLE_BACKEND picks the store: `auto` (Redis when USE_REDIS, else the
+cache), `redis` or `cache`.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import throttling
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+Decision = namedtuple('Decision', 'allowed retry_after')
+
+# cache backends whose `incr` is atomic across processes
+SHARED_ATOMIC_CACHES = (
+    'django.core.cache.backends.memcached.',
+    'django.core.cache.backends.redis.',
+    'django_redis.',
+)
+
+# KEYS: current window, previous window. ARGV: limit, previous window weight,
+# tokens wanted, tokens handed back, key TTL. Returns {granted, current, previous}.
+WINDOW_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local refund = tonumber(ARGV[4])
+if refund > 0 then current = math.max(current - refund, 0) end
+local available = math.floor(tonumber(ARGV[1]) - previous * tonumber(ARGV[2]) - current)
+local granted = math.max(math.min(tonumber(ARGV[3]), available), 0)
+current = current + granted
+if granted > 0 or refund > 0 then redis.call('SET', KEYS[1], current, 'EX', ARGV[5]) end
+return {granted, current, previous}
+"""
+
+
+def window_position(now, duration):
+    """`(window index, weight of the previous window)` at `now`."""
+    index = int(now // duration)
+    return index, 1.0 - (now - index * duration) / duration
+
+
+def retry_after(now, duration, limit, current, previous):
+    """Seconds until the sliding window has room for one more request."""
+    index, weight = window_position(now, duration)
+    if current <= limit - 1 and previous > 0:
+        # wait for the previous window's share to decay
+        return max(0.0, duration * (weight - (limit - 1 - current) / previous))
+    remaining = (index + 1) * duration - now
+    if current <= limit - 1:
+        return remaining
+    # the current window alone is full: it becomes the decaying previous one
+    return remaining + duration * max(0.0, 1.0 - (limit - 1) / current)
+
+
+def _window_keys(key, index):
+    return f'{key}:{index}', f'{key}:{index - 1}'
+
+
+def _ttl(duration):
+    # a window is read for two windows' time, as current then as previous
+    return int(math.ceil(2 * duration)) + 1
+
+
+class CacheWindowStore:
+    """Window counters in a Django cache, changed only by `add` and `incr`."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def acquire(self, key, limit, duration, want, refund, now):
+        """Grant up to `want` tokens; returns `(granted, current, previous)`."""
+        index, weight = window_position(now, duration)
+        current_key, previous_key = _window_keys(key, index)
+        self.cache.add(current_key, 0, _ttl(duration))
+        try:
+            current = self.cache.incr(current_key, want - refund)
+        except ValueError:
+            # evicted since the add: start the window again
+            self.cache.add(current_key, 0, _ttl(duration))
+            current = self.cache.incr(current_key, want - refund)
+        previous = self.cache.get(previous_key, 0)
+        excess = min(current - math.floor(limit - previous * weight), want)
+        if excess > 0:
+            # hand back what did not fit
+            current = self.cache.incr(current_key, -excess)
+        return want - max(excess, 0), current, previous
+
+
+class RedisWindowStore:
+    """Window counters in Redis, read and updated by one Lua script call."""
+
+    def __init__(self, client, prefix='nexus:'):
+        self.script = client.register_script(WINDOW_SCRIPT)
+        self.prefix = prefix
+
+    def acquire(self, key, limit, duration, want, refund, now):
+        index, weight = window_position(now, duration)
+        keys = _window_keys(self.prefix + key, index)
+        granted, current, previous = self.script(keys=keys, args=[limit, repr(weight), want, refund, _ttl(duration)])
+        return int(granted), int(current), int(previous)
+
+
+class Lease:
+    __slots__ = ('tokens', 'size', 'window', 'expires', 'retry_at')
+
+    def __init__(self, tokens, size, window, expires, retry_at=None):
+        self.tokens = tokens
+        self.size = size
+        self.window = window
+        self.expires = expires
+        self.retry_at = retry_at
+
+
+class LeaseTier:
+    """Per-process token leases in front of a window store."""
+
+    def __init__(self, store, lease_seconds=1.0, lease_fraction=0.1, max_keys=10000):
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.lease_fraction = lease_fraction
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.leases = {}
+        self.pid = os.getpid()
+
+    def hit(self, key, limit, duration, now=None):
+        """Take one token for `key` (at most `limit` per `duration` seconds)."""
+        now = time.time() if now is None else now
+        index, _ = window_position(now, duration)
+        with self.lock:
+            if self.pid != os.getpid():
+                # a forked worker starts without its parent's leases
+                self.leases, self.pid = {}, os.getpid()
+            lease = self.leases.get(key)
+            if lease is not None and now < lease.expires and lease.window == index:
+                if lease.tokens > 0:
+                    lease.tokens -= 1
+                    record_cache('throttle:lease', True)
+                    return Decision(True, None)
+                if lease.retry_at is not None:
+                    record_cache('throttle:lease', True)
+                    return Decision(False, max(lease.retry_at - now, 0.0))
+            refund = lease.tokens if lease is not None and lease.window == index else 0
+            if lease is not None:
+                # the whole lease was used before it expired: lease more next time
+                size = min(lease.size * 2, self._max_lease(limit)) if lease.tokens == 0 and now < lease.expires else 1
+                lease.tokens = 0
+            else:
+                size = 1
+        record_cache('throttle:lease', False)
+
+        granted, current, previous = self.store.acquire(key, limit, duration, size, refund, now)
+        expires = min(now + self.lease_seconds, (index + 1) * duration)
+        if granted:
+            self._install(key, Lease(granted - 1, size, index, expires))
+            return Decision(True, None)
+        wait = retry_after(now, duration, limit, current, previous)
+        self._install(key, Lease(0, 1, index, min(expires, now + wait), retry_at=now + wait))
+        return Decision(False, wait)
+
+    def _max_lease(self, limit):
+        return max(1, int(limit * self.lease_fraction))
+
+    def _install(self, key, lease):
+        with self.lock:
+            if len(self.leases) >= self.max_keys and key not in self.leases:
+                now = time.time()
+                self.leases = {k: v for k, v in self.leases.items() if v.expires > now}
+            self.leases[key] = lease
+
+    def reset(self):
+        with self.lock:
+            self.leases = {}
+
+
+_tier = None
+_tier_lock = threading.Lock()
+
+
+def shares_counters(alias='default'):
+    """Whether cache `alias` is shared between processes with an atomic `incr`."""
+    return settings.CACHES[alias]['BACKEND'].startswith(SHARED_ATOMIC_CACHES)
+
+
+def build_store():
+    backend = getattr(settings, 'THROTTLE_BACKEND', 'auto')
+    if backend == 'redis' or (backend == 'auto' and getattr(settings, 'USE_REDIS', False)):
+        from django_redis import get_redis_connection
+        return RedisWindowStore(get_redis_connection('default'))
+    if not shares_counters():
+        if backend == 'cache':
+            raise ImproperlyConfigured(
+                'THROTTLE_BACKEND=cache needs a shared cache with atomic incr (memcached or Redis); '
+                f"{settings.CACHES['default']['BACKEND']} is not one.")
+        logger.warning('Throttle counters are per worker process (%s): limits apply to each worker '
+                       'separately. Set USE_REDIS=1 to share them.', settings.CACHES['default']['BACKEND'])
+    return CacheWindowStore(caches['default'])
+
+
+def get_tier():
+    """This process's lease tier (built on first use)."""
+    global _tier
+    if _tier is None:
+        with _tier_lock:
+            if _tier is None:
+                _tier = LeaseTier(build_store(),
+                                  lease_seconds=getattr(settings, 'THROTTLE_LEASE_SECONDS', 1.0),
+                                  lease_fraction=getattr(settings, 'THROTTLE_LEASE_FRACTION', 0.1))
+    return _tier
+
+
+def reset_tier():
+    global _tier
+    with _tier_lock:
+        _tier = None
+
+
+class AtomicRateThrottle(throttling.SimpleRateThrottle):
+    """`SimpleRateThrottle` checked against the lease tier instead of a cached history."""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.decision = get_tier().hit(self.key, self.num_requests, self.duration, self.timer())
+        return self.decision.allowed
+
+    def wait(self):
+        return self.decision.retry_after
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, AtomicRateThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, AtomicRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, AtomicRateThrottle):
+    pass
@@ -5,6 +5,8 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, Spec
 from django.conf import settings
 from django.conf.urls.static import static
 
+from nexus.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -14,6 +16,7 @@ urlpatterns = [
     path('api/catalog/', include('catalog.urls')),
     path('api/auth/', include('accounts.urls')),
     path('api/orders/', include('orders.urls')),
+    path('internal/metrics', metrics_view, name='metrics'),
 ]
 
 # In development serve uploaded media files directly from MEDIA_ROOT
@@ -7,6 +7,7 @@ from .models import StockReservation, Shipment
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'status', 'total_cents', 'created_at')
+    list_select_related = ('user',)
 
 
 @admin.register(OrderItem)
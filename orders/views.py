@@ -21,7 +21,7 @@ class CartViewSet(viewsets.ModelViewSet):
         # If authenticated, restrict to user's carts; otherwise all (for demo simplicity)
         user = self.request.user
         if user and user.is_authenticated:
-            return Cart.objects.filter(user=user)
+            return Cart.objects.filter(user=user).prefetch_related('items')
         return Cart.objects.none()
 
     @action(detail=True, methods=['post'], url_path='add-item')
@@ -177,9 +177,10 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         user = self.request.user
         # Admins should be able to access all orders for management
+        # items are serialized for every order in the page
         if user and getattr(user, 'is_staff', False):
-            return Order.objects.all()
-        return Order.objects.filter(user=user)
+            return Order.objects.prefetch_related('items')
+        return Order.objects.filter(user=user).prefetch_related('items')
 
     @action(detail=False, methods=['post'], url_path='create-from-cart')
     @extend_schema(
@@ -7,14 +7,15 @@ Usage (download & attach):
     python manage.py shell -c "import scripts.add_product_images as a; a.attach_images(count=200, force=False, dry_run=False)"
 
 Notes:
- - This script downloads images into MEDIA_ROOT/products/ and sets the Product.image field.
+ - This script downloads images into MEDIA_ROOT/products/ (or the configured storage) and sets the Product.image field.
  - It uses the picsum.photos service (no API key needed). For Unsplash use you'd need an API key.
+ - Downloads run concurrently (`workers`) over a pooled session; products are updated with one
+   bulk_update per `batch_size` images (see scripts/image_fetcher.py).
+ - Bulk updates skip per-row signals, so run `python manage.py generate_image_renditions` afterwards.
 """
 
 import os
 import random
-import requests
-from pathlib import Path
 
 try:
     # configure Django when run via `python scripts/add_product_images.py` directly
@@ -25,70 +26,67 @@ try:
 except Exception:
     pass
 
+from scripts.image_fetcher import (DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, Download, FetchStats, ImageFetcher,
+                                   iter_rows)
 
-def _ensure_media_path():
-    from django.conf import settings
-    media_root = getattr(settings, 'MEDIA_ROOT', None)
-    if not media_root:
-        raise RuntimeError('MEDIA_ROOT is not set in Django settings')
-    products_dir = Path(media_root) / 'products'
-    products_dir.mkdir(parents=True, exist_ok=True)
-    return products_dir
-
-
-def _download_image(url, dest_path):
-    resp = requests.get(url, timeout=30)
-    resp.raise_for_status()
-    with open(dest_path, 'wb') as f:
-        f.write(resp.content)
-
-
-def attach_images(count=200, force=False, dry_run=True):
-    """Attach `count` images to products that don't already have images (unless force=True).
 
-    - count: number of products to attach images for
-    - force: if True, replace existing images
-    - dry_run: if True, don't actually download or save files; just print actions
-    """
+def _candidates(force):
+    from django.db.models import Q
     from catalog.models import Product
-    products = list(Product.objects.all())
-    if not products:
-        print('no products found')
-        return
-
-    products_to_update = [p for p in products if force or not p.image]
-    if not products_to_update:
-        print('no products to update')
-        return
-
-    # limit to requested count
-    products_to_update = products_to_update[:count]
+    qs = Product.objects.values('pk', 'slug')
+    if not force:
+        qs = qs.filter(Q(image__isnull=True) | Q(image=''))
+    return qs
 
-    media_products_dir = _ensure_media_path()
 
-    print(f'Preparing to attach images to {len(products_to_update)} products (dry_run={dry_run})')
-    for p in products_to_update:
+def _downloads(rows):
+    for row in rows:
         # Use picsum.photos random id to get a reasonable variety; using 800x600
         img_id = random.randint(1, 1000)
         url = f'https://picsum.photos/id/{img_id}/800/600'
-        filename = f'{p.slug or p.id}-{img_id}.jpg'
-        dest = media_products_dir / filename
+        yield Download(row['pk'], url, f"products/{row['slug'] or row['pk']}-{img_id}.jpg")
+
 
-        print(f'Product {p.id} -> {filename} from {url}')
-        if dry_run:
-            continue
+def _write_batch(batch):
+    from django.utils import timezone
+    from catalog.models import Product
+    from catalog.signals import products_bulk_changed
+    now = timezone.now()
+    products = [Product(pk=download.key, image=download.stored_name, updated_at=now) for download in batch]
+    Product.objects.bulk_update(products, ['image', 'updated_at'])
+    # documents and caches, which per-row signals would have refreshed
+    products_bulk_changed.send(sender=Product, product_ids=[download.key for download in batch])
+    return len(products)
 
-        try:
-            _download_image(url, dest)
-        except Exception as e:
-            print('download failed for', p.id, e)
-            continue
 
-        # update model
-        p.image.name = f'products/{filename}'
-        p.save(update_fields=['image'])
+def attach_images(count=200, force=False, dry_run=True, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE,
+                  session=None):
+    """Attach `count` images to products that don't already have images (unless force=True).
 
+    - count: number of products to attach images for
+    - force: if True, replace existing images
+    - dry_run: if True, don't actually download or save files; just print actions
+    - workers: concurrent downloads; batch_size: products per bulk_update
+
+    Returns the FetchStats of the run.
+    """
+    rows = iter_rows(_candidates(force), batch_size=batch_size, limit=count)
+    if dry_run:
+        stats = FetchStats()
+        for download in _downloads(rows):
+            stats.candidates += 1
+            print(f'Product {download.key} -> {download.name} from {download.url}')
+        print(f'{stats.candidates} products would get an image (dry_run=True)')
+        return stats
+
+    print(f'Attaching images to up to {count} products with {workers} workers')
+    fetcher = ImageFetcher(workers=workers, session=session)
+    stats = fetcher.attach(_downloads(rows), _write_batch, batch_size=batch_size)
+    if not stats.candidates:
+        print('no products to update')
+    print(stats.summary())
     print('done')
+    return stats
 
 
 if __name__ == '__main__':
@@ -1,17 +1,28 @@
-"""Bulk-load JSON fixtures using Django bulk_create to speed up imports over remote DBs.
+"""Bulk-load JSON fixtures to speed up imports over remote DBs.
 
 Usage:
   Set DATABASE_URL in the environment for the target DB (or ensure settings pick it up),
   then run:
-    python scripts/bulk_load_fixtures.py fixtures/catalog.utf8.json
+    python scripts/bulk_load_fixtures.py fixtures/catalog.utf8.json [--mode upsert|skip] [--batch-size N]
 
 Notes:
   - This loader only handles the common catalog models (Category, Product, ProductImage, ProductVariant).
-  - It uses bulk_create in batches to reduce round-trips. It is conservative and prints progress.
+  - The fixture is parsed incrementally (one object at a time, `.json` or `.json.gz`), so memory
+    use depends on the batch size, not on the size of the file.
+  - On PostgreSQL each batch is sent with `COPY ... FROM STDIN` into a temporary staging table
+    and merged with `INSERT ... ON CONFLICT (id) DO UPDATE` (or `DO NOTHING` with --mode skip).
+    Other databases use bulk_create with the same conflict handling.
+  - Objects are written in file order, so parents must come before children (dumpdata does this).
+  - Every batch prints its rows/sec and sends `products_bulk_changed` for the rows it wrote.
 """
+import argparse
+import datetime
+import gzip
+import io
 import json
 import os
 import sys
+import time
 from pathlib import Path
 
 # Ensure project root is on sys.path so `import nexus` works when running this script
@@ -24,8 +35,10 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nexus.settings')
 django.setup()
 
-from django.db import transaction
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
 from catalog.models import Category, Product, ProductImage, ProductVariant
+from catalog.signals import products_bulk_changed
 
 
 MODEL_MAPPING = {
@@ -34,99 +47,276 @@ MODEL_MAPPING = {
     'catalog.productimage': ProductImage,
     'catalog.productvariant': ProductVariant,
 }
+MODES = ('upsert', 'skip')
+# rows per batch: COPY is cheap per row, so it gets bigger batches
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_COPY_BATCH_SIZE = 5000
+READ_CHUNK_SIZE = 1024 * 1024
 
 
-def load_fixture(path: Path, batch_size: int = 200):
-    print(f"Loading fixture {path}")
-    with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+def iter_fixture_objects(stream, chunk_size=READ_CHUNK_SIZE):
+    """Yield the objects of a JSON array fixture one at a time.
 
-    # Group objects by model
-    by_model = {}
-    for obj in data:
-        model_label = obj.get('model')
-        if not model_label:
-            continue
-        by_model.setdefault(model_label.lower(), []).append(obj)
+    Reads `chunk_size` characters at a time and decodes each element with
+    `JSONDecoder.raw_decode`, so only the current element and one chunk are
+    held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
 
-    # Process simple models in a safe order
-    order = ['catalog.category', 'catalog.product', 'catalog.productvariant', 'catalog.productimage']
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
 
-    for model_label in order:
-        items = by_model.get(model_label, [])
-        if not items:
-            print(f"No objects for {model_label}")
+    while True:
+        # skip whitespace and separators up to the next element
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,' + ('' if started else '['):
+                if buffer[pos] == '[':
+                    started = True
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            fill()
+        if pos >= len(buffer):
+            if started:
+                raise ValueError('unexpected end of fixture: missing "]"')
+            return
+        if not started:
+            raise ValueError('fixture must be a JSON array')
+        if buffer[pos] == ']':
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # the element continues in the next chunk
+            fill()
+            continue
+        if end == len(buffer) and not eof:
+            # a number at the end of the buffer may be cut short
+            fill()
             continue
+        pos = end
+        yield obj
+
+
+def open_fixture(path):
+    path = Path(path)
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rt', encoding='utf-8-sig')
+    return open(path, 'r', encoding='utf-8-sig')
 
-        Model = MODEL_MAPPING.get(model_label)
-        if Model is None:
-            print(f"Skipping unsupported model: {model_label}")
+
+def build_instance(Model, obj):
+    """Model instance for a fixture object; FKs are assigned by id."""
+    kwargs = {}
+    for name, value in obj.get('fields', {}).items():
+        try:
+            field = Model._meta.get_field(name)
+        except Exception:
+            continue
+        # Skip many-to-many here; Django fixtures store M2M separately
+        if getattr(field, 'many_to_many', False):
             continue
+        kwargs[field.attname] = value
+    if obj.get('pk') is not None:
+        kwargs['id'] = obj['pk']
+    return Model(**kwargs)
+
+
+def _concrete_fields(Model):
+    return [f for f in Model._meta.concrete_fields]
+
+
+def _copy_value(field, value):
+    """Text for one CSV cell in COPY; None stays None (written as an unquoted empty cell = NULL)."""
+    if value is None:
+        return None
+    if isinstance(field, models.JSONField):
+        return json.dumps(value)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_cell(text):
+    # every value is quoted, so '' ("") and NULL (an empty, unquoted cell) stay distinct
+    if text is None:
+        return ''
+    return '"' + text.replace('"', '""') + '"'
+
+
+def copy_rows_csv(Model, instances):
+    """CSV text (COPY ... WITH (FORMAT csv)) for `instances`, columns in concrete field order."""
+    fields = _concrete_fields(Model)
+    buffer = io.StringIO()
+    for instance in instances:
+        row = []
+        for field in fields:
+            # the same conversions bulk_create applies (auto_now, Decimal, datetime parsing)
+            value = field.get_prep_value(field.pre_save(instance, add=True))
+            row.append(_csv_cell(_copy_value(field, value)))
+        buffer.write(','.join(row) + '\n')
+    buffer.seek(0)
+    return buffer
+
 
-        instances = []
-        pks = []
-        for o in items:
-            fields = o.get('fields', {})
-            # Map JSON fields to model kwargs; for FK fields use the '<name>_id' form
-            kwargs = {}
-            for k, v in fields.items():
-                try:
-                    field = Model._meta.get_field(k)
-                except Exception:
-                    field = None
-
-                # Skip many-to-many here; Django fixtures store M2M separately
-                if field is not None and getattr(field, 'many_to_many', False):
-                    continue
-
-                if field is not None and field.is_relation and getattr(field, 'many_to_one', False):
-                    # ForeignKey: use the *_id assignment
-                    kwargs[f"{k}_id"] = v
-                else:
-                    kwargs[k] = v
-
-            # If fixture has pk, set it explicitly
-            pk = o.get('pk')
-            if pk is not None:
-                kwargs['id'] = pk
-
-            instances.append(Model(**kwargs))
-            pks.append(pk)
-
-        # Remove instances whose PK already exists on the target DB
-        existing_ids = set()
-        pk_list = [p for p in pks if p is not None]
-        if pk_list:
-            existing_ids = set(Model.objects.filter(id__in=pk_list).values_list('id', flat=True))
-
-        # Filter out instances with existing PKs
-        filtered = []
-        for inst, pk in zip(instances, pks):
-            if pk is not None and pk in existing_ids:
-                # Skip existing object
+def _copy_from(cursor, sql, data):
+    raw = getattr(cursor, 'cursor', cursor)
+    if hasattr(raw, 'copy_expert'):
+        # psycopg2
+        raw.copy_expert(sql, data)
+    else:
+        # psycopg 3
+        with raw.copy(sql) as copy:
+            copy.write(data.read())
+
+
+def write_copy(Model, instances, mode):
+    """COPY `instances` into a staging table and merge them; returns rows inserted or updated."""
+    qn = connection.ops.quote_name
+    table = Model._meta.db_table
+    staging = qn(f'{table}_staging')
+    columns = ', '.join(qn(f.column) for f in _concrete_fields(Model))
+    updates = ', '.join(f'{qn(f.column)} = EXCLUDED.{qn(f.column)}' for f in _concrete_fields(Model) if not f.primary_key)
+    conflict = f'DO UPDATE SET {updates}' if mode == 'upsert' else 'DO NOTHING'
+    pk = qn(Model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {qn(table)} INCLUDING DEFAULTS)')
+        cursor.execute(f'TRUNCATE {staging}')
+        _copy_from(cursor, f'COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)', copy_rows_csv(Model, instances))
+        cursor.execute(f'INSERT INTO {qn(table)} ({columns}) SELECT {columns} FROM {staging} '
+                       f'ON CONFLICT ({pk}) {conflict}')
+        return cursor.rowcount
+
+
+def write_bulk_create(Model, instances, mode):
+    """bulk_create with the same conflict handling as the COPY path; returns rows written."""
+    if mode == 'upsert':
+        Model.objects.bulk_create(instances, update_conflicts=True, unique_fields=[Model._meta.pk.name],
+                                  update_fields=[f.name for f in _concrete_fields(Model) if not f.primary_key])
+    else:
+        Model.objects.bulk_create(instances, ignore_conflicts=True)
+    return len(instances)
+
+
+class LoadStats:
+    def __init__(self):
+        self.rows = {}
+        self.seconds = {}
+        self.skipped_models = set()
+        self.started = time.perf_counter()
+
+    def add(self, label, rows, seconds):
+        self.rows[label] = self.rows.get(label, 0) + rows
+        self.seconds[label] = self.seconds.get(label, 0) + seconds
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.rows.values())
+        lines = [f'{label}: {rows} rows ({rows / self.seconds[label]:.0f} rows/s)' if self.seconds[label]
+                 else f'{label}: {rows} rows' for label, rows in self.rows.items()]
+        lines.append(f'total: {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/s)')
+        return '\n'.join(lines)
+
+
+def _flush(label, Model, objects, mode, use_copy, stats, batch_no):
+    started = time.perf_counter()
+    instances = [build_instance(Model, obj) for obj in objects]
+    with transaction.atomic():
+        written = (write_copy if use_copy else write_bulk_create)(Model, instances, mode)
+    seconds = time.perf_counter() - started
+    stats.add(label, len(instances), seconds)
+    rate = len(instances) / seconds if seconds else 0
+    print(f'{label} batch {batch_no}: {len(instances)} rows ({written} written) in {seconds:.2f}s '
+          f'({rate:.0f} rows/s), {stats.rows[label]} so far')
+
+    # bulk writes skip model signals; invalidate per batch so memory and the
+    # handlers' `pk__in` lists stay bounded by the batch size
+    if Model is Category:
+        products_bulk_changed.send(sender=Product, product_ids=(), category_ids={inst.pk for inst in instances})
+    elif Model is Product:
+        products_bulk_changed.send(sender=Product, product_ids={inst.pk for inst in instances})
+    else:
+        products_bulk_changed.send(sender=Product, product_ids={inst.product_id for inst in instances})
+
+
+def load_fixture(path, batch_size=None, mode='upsert', use_copy=None, stream=None):
+    """Stream `path` (or an open text `stream`) into the database; returns LoadStats."""
+    if mode not in MODES:
+        raise ValueError(f'mode must be one of {MODES}')
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    batch_size = batch_size or (DEFAULT_COPY_BATCH_SIZE if use_copy else DEFAULT_BATCH_SIZE)
+    print(f"Loading fixture {path} ({'COPY + ON CONFLICT' if use_copy else 'bulk_create'}, mode={mode})")
+
+    stats = LoadStats()
+    pending_label, pending, batches = None, [], {}
+    owned = stream is None
+    stream = open_fixture(path) if owned else stream
+    try:
+        for obj in iter_fixture_objects(stream):
+            label = (obj.get('model') or '').lower()
+            if label not in MODEL_MAPPING:
+                if label and label not in stats.skipped_models:
+                    print(f'Skipping unsupported model: {label}')
+                stats.skipped_models.add(label)
                 continue
-            filtered.append(inst)
+            # flush on a model change so rows go out in file (dependency) order
+            if pending and (label != pending_label or len(pending) >= batch_size):
+                batches[pending_label] = batches.get(pending_label, 0) + 1
+                _flush(pending_label, MODEL_MAPPING[pending_label], pending, mode, use_copy, stats,
+                       batches[pending_label])
+                pending = []
+            pending_label = label
+            pending.append(obj)
+        if pending:
+            batches[pending_label] = batches.get(pending_label, 0) + 1
+            _flush(pending_label, MODEL_MAPPING[pending_label], pending, mode, use_copy, stats, batches[pending_label])
+    finally:
+        if owned:
+            stream.close()
+
+    # explicit ids leave PostgreSQL sequences behind; move them past the loaded rows
+    loaded_models = [MODEL_MAPPING[label] for label in stats.rows]
+    if loaded_models:
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), loaded_models)
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
 
-        print(f"Preparing to bulk create {len(filtered)} objects for {model_label} (skipped {len(instances)-len(filtered)} existing)")
-        # Bulk create in batches inside a transaction
-        with transaction.atomic():
-            for i in range(0, len(filtered), batch_size):
-                batch = filtered[i:i + batch_size]
-                Model.objects.bulk_create(batch, batch_size)
-                print(f"Inserted {i + len(batch)} / {len(filtered)} for {model_label}")
+    print(stats.summary())
+    return stats
 
 
 def main(argv):
-    if len(argv) < 2:
-        print("Usage: python scripts/bulk_load_fixtures.py <fixture1.json> [fixture2.json ...]")
-        return 2
+    parser = argparse.ArgumentParser(description='Stream catalog fixtures into the database.')
+    parser.add_argument('fixtures', nargs='+', help='Fixture files (.json or .json.gz)')
+    parser.add_argument('--mode', choices=MODES, default='upsert',
+                        help='upsert: update rows whose id exists (default); skip: leave them alone')
+    parser.add_argument('--batch-size', type=int,
+                        help=f'Rows per batch (default {DEFAULT_COPY_BATCH_SIZE} with COPY, else {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--no-copy', action='store_true', help='Use bulk_create even on PostgreSQL')
+    args = parser.parse_args(argv[1:])
 
-    for path in argv[1:]:
+    for path in args.fixtures:
         p = Path(path)
         if not p.exists():
             print(f"Fixture not found: {p}")
             continue
-        load_fixture(p)
+        load_fixture(p, batch_size=args.batch_size, mode=args.mode, use_copy=False if args.no_copy else None)
 
     print("Done.")
     return 0
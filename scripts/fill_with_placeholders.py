@@ -6,10 +6,12 @@ Usage:
 The script downloads `count` placeholder images into MEDIA_ROOT/products/placeholders/
 and creates a `ProductImage` row for every Product that currently has no images.
 If dry_run is True the script will only print actions.
+
+Products are streamed with an `Exists` subquery instead of counting images per
+product, and rows are created with one bulk_create per `batch_size` products
+(see scripts/image_fetcher.py).
 """
 import os
-import sys
-from pathlib import Path
 try:
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nexus.settings')
     import django
@@ -18,94 +20,82 @@ except Exception:
     pass
 
 from django.conf import settings
+from django.db.models import Exists, OuterRef
 from catalog.models import Product, ProductImage
+from catalog.signals import products_bulk_changed
 
-import requests
-from urllib.parse import urljoin
-
-
-PLACEHOLDER_DIR = Path(getattr(settings, 'MEDIA_ROOT')) / 'products' / 'placeholders'
+from scripts.image_fetcher import DEFAULT_BATCH_SIZE, Download, FetchStats, ImageFetcher, batched, iter_rows
 
 
-def _ensure_dir():
-    PLACEHOLDER_DIR.mkdir(parents=True, exist_ok=True)
+PLACEHOLDER_PREFIX = 'products/placeholders'
 
 
-def _download_placeholders(count=5, size=(800, 600)):
+def _download_placeholders(count=5, size=(800, 600), session=None, stats=None):
     """Download `count` placeholder images from picsum.photos if not already present.
-    Returns list of relative paths (as strings) suitable for saving to ImageField.
+    Returns list of storage names suitable for saving to ImageField.
     """
-    _ensure_dir()
-    downloaded = []
-    for i in range(count):
-        filename = f'placeholder-{i+1}-{size[0]}x{size[1]}.jpg'
-        target = PLACEHOLDER_DIR / filename
-        if target.exists() and target.stat().st_size > 0:
-            # store as POSIX path so Django builds correct URLs on all platforms
-            downloaded.append(str(Path('products') / 'placeholders' / filename).replace('\\', '/'))
-            continue
-
-        url = f'https://picsum.photos/{size[0]}/{size[1]}?random={i+1}'
-        try:
-            resp = requests.get(url, timeout=15)
-            resp.raise_for_status()
-            with open(target, 'wb') as f:
-                f.write(resp.content)
-                downloaded.append(str(Path('products') / 'placeholders' / filename).replace('\\', '/'))
-            print('downloaded', filename)
-        except Exception as e:
-            print('failed to download', url, '->', e)
-    return downloaded
-
-
-def run(dry_run=True, count=5, size=(800, 600), verbose=True):
+    downloads = [
+        Download(i + 1, f'https://picsum.photos/{size[0]}/{size[1]}?random={i + 1}',
+                 f'{PLACEHOLDER_PREFIX}/placeholder-{i + 1}-{size[0]}x{size[1]}.jpg')
+        for i in range(count)
+    ]
+    fetcher = ImageFetcher(workers=max(1, min(count, 8)), session=session, reuse_existing=True, stats=stats)
+    done = {download.key: download.stored_name for download in fetcher.fetch(downloads)}
+    return [done[key] for key in sorted(done)]
+
+
+def products_without_images():
+    """Products with no ProductImage rows, as `{pk, name}` rows."""
+    return Product.objects.alias(
+        has_images=Exists(ProductImage.objects.filter(product=OuterRef('pk')))
+    ).filter(has_images=False).values('pk', 'name')
+
+
+def run(dry_run=True, count=5, size=(800, 600), verbose=True, batch_size=DEFAULT_BATCH_SIZE, session=None):
     """Main entry point.
 
     dry_run: if True, only print actions
     count: number of placeholder images to maintain
     size: size tuple for placeholder images
+    batch_size: products per bulk_create
+
+    Returns the FetchStats of the run.
     """
     # Ensure settings are loaded and MEDIA_ROOT is available
     media_root = getattr(settings, 'MEDIA_ROOT', None)
     if not media_root:
         print('MEDIA_ROOT not configured; aborting')
-        return
+        return None
 
-    placeholders = _download_placeholders(count=count, size=size)
+    stats = FetchStats()
+    placeholders = _download_placeholders(count=count, size=size, session=session, stats=stats)
     if not placeholders:
         print('No placeholders available; aborting')
-        return
-
-    # Find products without images (neither Product.image nor ProductImage rows)
-    products_no_image = Product.objects.filter(image__isnull=True).filter().exclude(image='')
-
-    # More robust: product has no productimage rows
-    products = [p for p in Product.objects.all() if p.images.count() == 0]
-    total = len(products)
-    print(f'Products without ProductImage rows: {total}')
-    if total == 0:
-        return
+        return stats
 
+    rows = iter_rows(products_without_images(), batch_size=batch_size)
     if dry_run:
         print('Dry-run: would assign placeholders to the following product ids:')
-        for idx, p in enumerate(products):
-            ph = placeholders[idx % len(placeholders)]
-            print(f'  Product {p.id} -> {ph}')
-        return
-
-    # Apply: create ProductImage records and point to placeholder files
-    created = 0
-    for idx, p in enumerate(products):
-        ph = placeholders[idx % len(placeholders)]
-        # Skip if ProductImage with same image already exists (safety)
-        if ProductImage.objects.filter(product=p, image=ph).exists():
-            continue
-        ProductImage.objects.create(product=p, image=ph, alt=(p.name or ''), order=0)
-        created += 1
-        if verbose and created % 100 == 0:
-            print('created', created, 'so far...')
-
-    print('done; created', created)
+        for idx, row in enumerate(rows):
+            print(f"  Product {row['pk']} -> {placeholders[idx % len(placeholders)]}")
+        return stats
+
+    # Apply: create ProductImage records pointing to the placeholder files
+    idx = 0
+    for batch in batched(rows, batch_size):
+        images = []
+        for row in batch:
+            images.append(ProductImage(product_id=row['pk'], image=placeholders[idx % len(placeholders)],
+                                       alt=(row['name'] or ''), order=0))
+            idx += 1
+        ProductImage.objects.bulk_create(images)
+        products_bulk_changed.send(sender=ProductImage, product_ids=[row['pk'] for row in batch])
+        stats.written += len(images)
+        if verbose:
+            print(stats.summary())
+
+    print('done; created', stats.written)
+    return stats
 
 
 if __name__ == '__main__':
@@ -114,6 +104,7 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument('--count', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
     parser.add_argument('--dry-run', action='store_true')
     args = parser.parse_args()
-    run(dry_run=args.dry_run, count=args.count)
+    run(dry_run=args.dry_run, count=args.count, batch_size=args.batch_size)
@@ -0,0 +1,184 @@
+"""Fetch-and-attach engine shared by the image maintenance scripts.
+
+Used by `scripts/add_product_images.py` and `scripts/fill_with_placeholders.py`:
+
+- `iter_rows` streams candidate rows from a queryset in primary-key batches
+  (the same keyset walk `rebuild_documents` uses), so a large catalog is never
+  loaded at once and rows updated along the way are not revisited.
+- `ImageFetcher` downloads over one pooled `requests.Session` (connection
+  reuse, urllib3 retries with backoff on 429/5xx) with at most `workers`
+  downloads in flight, and saves each file through Django's default storage.
+- Completed downloads are handed back in batches so callers write them with a
+  single `bulk_update`/`bulk_create` per batch.
+
+`FetchStats` tracks progress and throughput for both.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.files.base import ContentFile
+
+DEFAULT_WORKERS = 8
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_TIMEOUT = 30
+DEFAULT_RETRIES = 3
+# print a progress line every this many rows
+PROGRESS_EVERY = 500
+
+
+def iter_rows(queryset, batch_size=DEFAULT_BATCH_SIZE, limit=None):
+    """Yield `queryset` rows (dicts from `.values()` or model instances) in pk order, `batch_size` per query."""
+    queryset = queryset.order_by('pk')
+    seen = 0
+    last_pk = None
+    while limit is None or seen < limit:
+        batch_qs = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        size = batch_size if limit is None else min(batch_size, limit - seen)
+        rows = list(batch_qs[:size])
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < size:
+            return
+        seen += len(rows)
+        last = rows[-1]
+        last_pk = last['pk'] if isinstance(last, dict) else last.pk
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Download:
+    """One file to fetch: `url` is saved to storage as `name`; `key` is the caller's handle (e.g. a product)."""
+
+    def __init__(self, key, url, name):
+        self.key = key
+        self.url = url
+        self.name = name
+        self.stored_name = None
+        self.size = 0
+        self.reused = False
+        self.error = None
+
+
+class FetchStats:
+    def __init__(self):
+        self.candidates = 0
+        self.downloaded = 0
+        self.reused = 0
+        self.failed = 0
+        self.bytes = 0
+        self.written = 0
+        self.started = time.perf_counter()
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+
+        def per_second(n):
+            return n / elapsed if elapsed else 0
+        return (f'{self.candidates} candidates in {elapsed:.1f}s: {self.downloaded} downloaded '
+                f'({self.bytes / 1e6:.1f} MB, {per_second(self.downloaded):.1f} files/s, '
+                f'{per_second(self.bytes) / 1e6:.2f} MB/s), {self.reused} reused, {self.failed} failed, '
+                f'{self.written} rows written ({per_second(self.written):.0f}/s)')
+
+
+def make_session(workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES):
+    """A `requests.Session` whose connection pool fits `workers` threads, with retry/backoff on GET."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=workers,
+        max_retries=Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset(['GET'])),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class ImageFetcher:
+    def __init__(self, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, session=None, storage=None,
+                 reuse_existing=False, stats=None, progress=print):
+        from django.core.files.storage import default_storage
+        self.workers = workers
+        self.timeout = timeout
+        self.session = session or make_session(workers)
+        self.storage = storage or default_storage
+        # keep a file already stored under the same name instead of fetching it again
+        self.reuse_existing = reuse_existing
+        self.stats = stats or FetchStats()
+        self.progress = progress
+
+    def _fetch(self, download):
+        if self.reuse_existing and self.storage.exists(download.name) and self.storage.size(download.name) > 0:
+            download.stored_name = download.name
+            download.reused = True
+            return download
+        resp = self.session.get(download.url, timeout=self.timeout)
+        resp.raise_for_status()
+        content = resp.content
+        if not content:
+            raise ValueError('empty response')
+        download.size = len(content)
+        download.stored_name = self.storage.save(download.name, ContentFile(content))
+        return download
+
+    def _done(self, future, download):
+        try:
+            future.result()
+        except Exception as exc:
+            download.error = exc
+            self.stats.failed += 1
+            if self.progress:
+                self.progress(f'download failed for {download.key}: {exc}')
+            return None
+        if download.reused:
+            self.stats.reused += 1
+        else:
+            self.stats.downloaded += 1
+            self.stats.bytes += download.size
+        return download
+
+    def fetch(self, downloads):
+        """Yield successful downloads as they complete, with at most `workers * 2` queued."""
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-fetch') as pool:
+            for download in downloads:
+                self.stats.candidates += 1
+                pending[pool.submit(self._fetch, download)] = download
+                if len(pending) >= self.workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from self._collect(done, pending)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from self._collect(done, pending)
+
+    def _collect(self, done, pending):
+        for future in done:
+            download = self._done(future, pending.pop(future))
+            if download is not None:
+                yield download
+            finished = self.stats.downloaded + self.stats.reused + self.stats.failed
+            if self.progress and finished % PROGRESS_EVERY == 0:
+                self.progress(self.stats.summary())
+
+    def attach(self, downloads, write_batch, batch_size=DEFAULT_BATCH_SIZE):
+        """Fetch `downloads` and call `write_batch(list of downloads)` once per `batch_size` successes.
+
+        `write_batch` runs on the calling thread and returns the number of rows written.
+        """
+        for batch in batched(self.fetch(downloads), batch_size):
+            self.stats.written += write_batch(batch) or 0
+        return self.stats
@@ -0,0 +1,397 @@
+"""HTTP load generator for a running server (runserver, gunicorn, docker compose).
+
+Usage:
+    python scripts/load_test.py --host http://localhost:8000 --concurrency 16 --duration 30 --warmup 5 \\
+        --mix list=50,detail=25,search=15,cart=7,checkout=3 --username perf --password secret \\
+        --report reports/load.json --baseline reports/baseline.json
+
+`--concurrency` workers each run a closed loop: pick a scenario by weight, run
+it, repeat. Every HTTP call is timed (body included) under its own name, e.g.
+`cart.add_item`. Samples from the first `--warmup` seconds are discarded. The
+run stops after `--duration` seconds or `--requests` calls.
+
+Scenarios:
+  list      GET  /api/catalog/products/ at a random page (the first page or a `next`
+            cursor collected while discovering the catalog)
+  detail    GET  /api/catalog/products/<id>/
+  search    GET  /api/catalog/products/?search=<word from a product name>
+  cart      add an item to the worker's cart (a new cart every CART_ITEMS adds)
+  checkout  create a cart, add an item, reserve it, create the order
+
+`cart` and `checkout` need `--username/--password`; they are dropped from the
+mix without them. `checkout` consumes inventory, so run it against seeded data
+(`scripts/seed_and_profile.py`). Throttled (429) responses are counted apart
+from errors; raise THROTTLE_RATE_* on the server for load runs.
+
+The JSON report has latency percentiles (ms) and throughput per request name
+and overall. With `--baseline` the run is compared to an earlier report and the
+script exits 1 when p95/p99 grows or throughput drops by more than
+`--max-regression` percent.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlsplit, urlunsplit
+
+DEFAULT_MIX = {'list': 50, 'detail': 25, 'search': 15, 'cart': 7, 'checkout': 3}
+AUTH_SCENARIOS = ('cart', 'checkout')
+PERCENTILES = (50, 95, 99)
+# metrics compared against a baseline: (key, higher is worse)
+COMPARED = (('p95', True), ('p99', True), ('rps', False))
+CART_ITEMS = 10
+CATALOG = '/api/catalog/products/'
+# products per list page
+PAGE_SIZE = 20
+
+
+class ScenarioError(Exception):
+    """A scenario could not continue (e.g. creating the cart failed)."""
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def parse_mix(text):
+    """`list=50,detail=25` -> {'list': 50, 'detail': 25}."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise ValueError(f'unknown scenario {name!r} (choose from {", ".join(SCENARIOS)})')
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('the scenario mix needs a positive weight')
+    return mix
+
+
+class Recorder:
+    """Latency samples and status counts per request name, shared by all workers."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.recording = False
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.started = None
+        self.stopped = None
+
+    def start(self):
+        with self.lock:
+            self.recording = True
+            self.started = time.perf_counter()
+
+    def stop(self):
+        with self.lock:
+            self.recording = False
+            self.stopped = time.perf_counter()
+
+    def add(self, name, seconds, status):
+        with self.lock:
+            if not self.recording:
+                return
+            self.latencies[name].append(seconds)
+            self.statuses[name][str(status)] += 1
+
+    @property
+    def count(self):
+        return sum(len(v) for v in self.latencies.values())
+
+    def _summary(self, latencies, statuses, elapsed):
+        values = sorted(latencies)
+        summary = {
+            'requests': len(values),
+            'errors': sum(n for s, n in statuses.items() if s != '429' and not s.startswith(('2', '3'))),
+            'throttled': statuses.get('429', 0),
+            'statuses': dict(sorted(statuses.items())),
+            'rps': round(len(values) / elapsed, 2) if elapsed else 0.0,
+        }
+        if values:
+            summary.update({f'p{p}': round(percentile(values, p) * 1000, 2) for p in PERCENTILES})
+            summary['max'] = round(values[-1] * 1000, 2)
+            summary['mean'] = round(sum(values) / len(values) * 1000, 2)
+        return summary
+
+    def report(self):
+        elapsed = (self.stopped or time.perf_counter()) - (self.started or time.perf_counter())
+        with self.lock:
+            endpoints = {name: self._summary(self.latencies[name], self.statuses[name], elapsed)
+                         for name in sorted(self.latencies)}
+            totals = defaultdict(int)
+            for statuses in self.statuses.values():
+                for status, n in statuses.items():
+                    totals[status] += n
+            overall = self._summary([s for v in self.latencies.values() for s in v], totals, elapsed)
+        overall['seconds'] = round(elapsed, 2)
+        return {'totals': overall, 'endpoints': endpoints}
+
+
+class Client:
+    """Per-worker HTTP client; every call is timed and recorded under `name`."""
+
+    def __init__(self, host, recorder, timeout, token=None):
+        import requests
+        self.host = host.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+        self.cart_id = None
+        self.cart_items = 0
+
+    def request(self, name, method, path, expect=None, **kwargs):
+        import requests
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.host + path, timeout=self.timeout, **kwargs)
+            status = response.status_code
+        except requests.RequestException as exc:
+            response, status = None, type(exc).__name__
+        self.recorder.add(name, time.perf_counter() - started, status)
+        if expect is not None and (response is None or response.status_code != expect):
+            raise ScenarioError(f'{name}: {status}')
+        return response
+
+
+def _path(url):
+    """`http://host/api/...?cursor=x` -> `/api/...?cursor=x` (links carry the server's own host)."""
+    parts = urlsplit(url)
+    return urlunsplit(('', '', parts.path, parts.query, ''))
+
+
+class Catalog:
+    """Product ids, search words and list pages discovered before the run."""
+
+    def __init__(self, product_ids, words, pages):
+        self.product_ids = product_ids
+        self.words = words or ['a']
+        # paths of list pages: the first one, then the `next` cursor links
+        self.pages = pages
+
+    @classmethod
+    def discover(cls, client, page_size=PAGE_SIZE, max_pages=50):
+        """Walk up to `max_pages` list pages, following `next` (the product list paginates by cursor)."""
+        first = f'{CATALOG}?{urlencode({"limit": page_size})}'
+        pages, rows, path = [], [], first
+        while path and len(pages) < max_pages:
+            response = client.request('setup', 'GET', path)
+            response.raise_for_status()
+            body = response.json()
+            pages.append(path)
+            rows.extend(body.get('results', []) if isinstance(body, dict) else body)
+            path = _path(body['next']) if isinstance(body, dict) and body.get('next') else None
+        if not rows:
+            raise SystemExit('no products found; seed the database first (scripts/seed_and_profile.py)')
+        words = sorted({w.lower() for row in rows for w in str(row.get('name', '')).split() if len(w) > 2})
+        return cls([row['id'] for row in rows], words, pages)
+
+
+def scenario_list(client, catalog, rng):
+    client.request('list', 'GET', rng.choice(catalog.pages))
+
+
+def scenario_detail(client, catalog, rng):
+    client.request('detail', 'GET', f'{CATALOG}{rng.choice(catalog.product_ids)}/')
+
+
+def scenario_search(client, catalog, rng):
+    client.request('search', 'GET', CATALOG, params={'search': rng.choice(catalog.words)})
+
+
+def _new_cart(client, name):
+    return client.request(name, 'POST', '/api/orders/carts/', json={}, expect=201).json()['id']
+
+
+def _add_item(client, name, cart_id, product_id):
+    client.request(name, 'POST', f'/api/orders/carts/{cart_id}/add-item/',
+                   json={'product': product_id, 'quantity': 1}, expect=201)
+
+
+def scenario_cart(client, catalog, rng):
+    if client.cart_id is None or client.cart_items >= CART_ITEMS:
+        client.cart_id, client.cart_items = _new_cart(client, 'cart.create'), 0
+    _add_item(client, 'cart.add_item', client.cart_id, rng.choice(catalog.product_ids))
+    client.cart_items += 1
+
+
+def scenario_checkout(client, catalog, rng):
+    cart_id = _new_cart(client, 'checkout.create_cart')
+    _add_item(client, 'checkout.add_item', cart_id, rng.choice(catalog.product_ids))
+    client.request('checkout.reserve', 'POST', f'/api/orders/carts/{cart_id}/reserve/', expect=201)
+    client.request('checkout.create_order', 'POST', '/api/orders/orders/create-from-cart/',
+                   json={'cart_id': cart_id}, expect=201)
+
+
+SCENARIOS = {
+    'list': scenario_list,
+    'detail': scenario_detail,
+    'search': scenario_search,
+    'cart': scenario_cart,
+    'checkout': scenario_checkout,
+}
+
+
+def obtain_token(host, username, password, timeout=10):
+    import requests
+    response = requests.post(f"{host.rstrip('/')}/api/auth/token/",
+                             json={'username': username, 'password': password}, timeout=timeout)
+    if response.status_code != 200:
+        raise SystemExit(f'could not obtain a token for {username!r}: {response.status_code} {response.text[:200]}')
+    return response.json()['access']
+
+
+def run(host='http://localhost:8000', concurrency=8, duration=30.0, warmup=5.0, mix=None, max_requests=None,
+        username=None, password=None, timeout=30.0, seed=None, log=print):
+    """Run the load test and return the report dict."""
+    mix = dict(mix or DEFAULT_MIX)
+    token = None
+    if username and password:
+        token = obtain_token(host, username, password, timeout=timeout)
+    else:
+        dropped = [name for name in AUTH_SCENARIOS if mix.pop(name, None)]
+        if dropped and log:
+            log(f'no credentials: skipping {", ".join(dropped)}')
+        if not mix:
+            raise SystemExit('nothing to run: the remaining mix is empty')
+
+    recorder = Recorder()
+    catalog = Catalog.discover(Client(host, recorder, timeout))
+    names, weights = list(mix), list(mix.values())
+    stop = threading.Event()
+    base_seed = seed if seed is not None else random.randrange(1 << 30)
+
+    def worker(index):
+        rng = random.Random(base_seed + index)
+        client = Client(host, recorder, timeout, token)
+        while not stop.is_set():
+            try:
+                SCENARIOS[rng.choices(names, weights)[0]](client, catalog, rng)
+            except ScenarioError:
+                # the failed call is already recorded; start the next scenario
+                client.cart_id = None
+            if max_requests is not None and recorder.recording and recorder.count >= max_requests:
+                stop.set()
+
+    if log:
+        log(f'{concurrency} workers against {host}: {warmup:g}s warmup, {duration:g}s measured, mix {mix}')
+    started_at = datetime.now(timezone.utc)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load') as pool:
+        futures = [pool.submit(worker, i) for i in range(concurrency)]
+        try:
+            stop.wait(warmup)
+            recorder.start()
+            stop.wait(duration)
+        except KeyboardInterrupt:
+            if log:
+                log('interrupted; reporting what was measured')
+        finally:
+            recorder.stop()
+            stop.set()
+        for future in futures:
+            future.result()
+
+    report = recorder.report()
+    report['meta'] = {
+        'host': host,
+        'started_at': started_at.isoformat(),
+        'concurrency': concurrency,
+        'warmup': warmup,
+        'duration': duration,
+        'max_requests': max_requests,
+        'mix': mix,
+        'seed': base_seed,
+    }
+    return report
+
+
+def compare(report, baseline, max_regression=10.0):
+    """Rows of (name, metric, baseline, current, change %, regressed) for names present in both reports."""
+    rows = []
+    pairs = [('total', report['totals'], baseline.get('totals', {}))]
+    pairs += [(name, stats, baseline.get('endpoints', {}).get(name)) for name, stats in report['endpoints'].items()]
+    for name, current, before in pairs:
+        if not before:
+            continue
+        for metric, higher_is_worse in COMPARED:
+            old, new = before.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            regressed = change > max_regression if higher_is_worse else change < -max_regression
+            rows.append((name, metric, old, new, round(change, 1), regressed))
+    return rows
+
+
+def format_report(report):
+    lines = [f"{'name':<24}{'reqs':>8}{'err':>6}{'429':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+    rows = list(report['endpoints'].items()) + [('total', report['totals'])]
+    for name, s in rows:
+        lines.append(f"{name:<24}{s['requests']:>8}{s['errors']:>6}{s['throttled']:>6}{s['rps']:>9.1f}"
+                     + ''.join(f"{s.get(k, 0) or 0:>9.1f}" for k in ('p50', 'p95', 'p99', 'max')))
+    lines.append('latencies in ms')
+    return '\n'.join(lines)
+
+
+def format_comparison(rows):
+    lines = [f"{'name':<24}{'metric':>7}{'baseline':>11}{'current':>11}{'change':>9}"]
+    for name, metric, old, new, change, regressed in rows:
+        lines.append(f"{name:<24}{metric:>7}{old:>11.1f}{new:>11.1f}{change:>+8.1f}%" + ('  REGRESSED' if regressed else ''))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='http://localhost:8000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5.0, help='seconds run before measuring')
+    parser.add_argument('--requests', type=int, dest='max_requests', help='stop after this many measured calls')
+    parser.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+                        help='weighted scenarios, e.g. list=50,detail=25,search=15,cart=7,checkout=3')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, help='random seed for reproducible scenario choices')
+    parser.add_argument('--report', help='write the JSON report here')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--max-regression', type=float, default=10.0,
+                        help='percent change in p95/p99/rps that fails the comparison')
+    args = parser.parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    report = run(args.host, concurrency=args.concurrency, duration=args.duration, warmup=args.warmup, mix=mix,
+                 max_requests=args.max_requests, username=args.username, password=args.password,
+                 timeout=args.timeout, seed=args.seed)
+    print(format_report(report))
+    if report['totals']['throttled']:
+        print(f"{report['totals']['throttled']} requests were throttled (429); "
+              'raise THROTTLE_RATE_* on the server for load runs', file=sys.stderr)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+        print(f'report written to {args.report}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fh:
+            rows = compare(report, json.load(fh), args.max_regression)
+        print(format_comparison(rows))
+        if any(row[-1] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
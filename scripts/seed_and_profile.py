@@ -1,9 +1,10 @@
-r"""Seed products and profile list endpoint latency.
+r"""Seed products and load-test the catalog endpoints.
 
 This script seeds N products via the Django ORM (it's meant to be run from
 the project root). It will attempt to configure Django automatically when
-run from the repo. It can also make HTTP requests to a running server to
-measure latency. For real performance testing use a Postgres dev stack via
+run from the repo. It then runs the concurrent load generator in
+`scripts/load_test.py` against a running server and prints p50/p95/p99/max
+latency and throughput. For real performance testing use a Postgres dev stack via
 docker-compose.
 
 Usage (local Django shell):
@@ -15,7 +16,6 @@ Or run against a running server (requires `requests`):
 """
 
 import argparse
-import time
 import random
 import sys
 import os
@@ -61,8 +61,10 @@ def seed(count=1000):
     # Try ORM bulk_create first; if the DB schema differs (extra NOT NULL columns
     # like `allow_backorder`), fall back to a raw INSERT path that detects DB
     # columns and inserts values accordingly.
+    from catalog.signals import products_bulk_changed
     try:
         Product.objects.bulk_create(objs)
+        products_bulk_changed.send(sender=Product, product_ids=[o.pk for o in objs], category_ids=[cat.id])
         print(f"Seeded {count} products")
         return
     except Exception as orm_exc:
@@ -142,47 +144,36 @@ def seed(count=1000):
                     # re-raise with context
                     raise RuntimeError('Raw insert failed: ' + str(e))
 
+            # raw inserts don't return ids; treat the whole category as changed
+            products_bulk_changed.send(sender=Product, product_ids=[], category_ids=[cat.id])
             print(f"Seeded {count} products (raw INSERT fallback)")
 
-def profile(host='http://localhost:8000', path='/api/catalog/products/', limit=50, iterations=5):
-    """Hit the product list endpoint and report latency statistics.
+def profile(host='http://localhost:8000', concurrency=8, duration=30.0, warmup=5.0, mix=None, report=None,
+            **kwargs):
+    """Load-test the running server with scripts/load_test.py and print its latency table.
 
-    `path` lets you override the URL path when your API mounts differently.
+    Returns the report dict; `report` is an optional path for the JSON report.
+    Extra keyword arguments (credentials, `max_requests`, ...) go to `load_test.run`.
     """
-    import requests
-    url = f"{host.rstrip('/')}{path}"
-    times = []
-    for i in range(iterations):
-        params = {'limit': limit}
-        t0 = time.perf_counter()
-        r = requests.get(url, params=params)
-        t1 = time.perf_counter()
-        try:
-            r.raise_for_status()
-        except Exception:
-            print(f"Request failed (status={r.status_code}): {r.text}")
-            raise
-        times.append(t1 - t0)
-        # gracefully handle different pagination response shapes
-        try:
-            count = len(r.json().get('results', []))
-        except Exception:
-            try:
-                count = len(r.json())
-            except Exception:
-                count = 0
-        print(f"Iter {i+1}: status={r.status_code} time={times[-1]:.3f}s count={count}")
-    print(f"avg={sum(times)/len(times):.3f}s min={min(times):.3f}s max={max(times):.3f}s")
+    import json
+    from scripts import load_test
+    result = load_test.run(host, concurrency=concurrency, duration=duration, warmup=warmup, mix=mix, **kwargs)
+    print(load_test.format_report(result))
+    if report:
+        with open(report, 'w', encoding='utf-8') as fh:
+            json.dump(result, fh, indent=2, sort_keys=True)
+    return result
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--host', default='http://localhost:8000')
-    parser.add_argument('--path', default='/api/catalog/products/')
     parser.add_argument('--count', type=int, default=1000)
     parser.add_argument('--profile-only', action='store_true')
-    parser.add_argument('--limit', type=int, default=50)
-    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--report', help='write the JSON load-test report here')
     args = parser.parse_args()
     if not args.profile_only:
         # attempt to seed using Django ORM
@@ -190,7 +181,9 @@ def main():
             seed(args.count)
         except Exception as e:
             print('Seeding failed:', e, file=sys.stderr)
-    profile(args.host, path=args.path, limit=args.limit, iterations=args.iterations)
+    # anonymous browse mix; use scripts/load_test.py directly for cart/checkout scenarios and baselines
+    profile(args.host, concurrency=args.concurrency, duration=args.duration, warmup=args.warmup,
+            report=args.report)
 
 
 def seed_varieties(count=1000, clear_existing=False):
@@ -233,9 +226,11 @@ def seed_varieties(count=1000, clear_existing=False):
         category = random.choice(cats)
         objs.append(Product(name=name, slug=slug, description=description, price=price, inventory=inventory, category=category))
 
+    from catalog.signals import products_bulk_changed
     # Use existing bulk_create path (it will fallback if DB schema differs)
     try:
         Product.objects.bulk_create(objs)
+        products_bulk_changed.send(sender=Product, product_ids=[o.pk for o in objs], category_ids=[c.id for c in cats])
         print(f"Seeded {count} varied products")
     except Exception:
         # Reuse the raw-insert fallback by calling seed() raw path behavior: detect columns and insert
@@ -295,6 +290,7 @@ def seed_varieties(count=1000, clear_existing=False):
                 chunk = batch[start:start + batch_size]
                 cursor.executemany(insert_sql, chunk)
 
+            products_bulk_changed.send(sender=Product, product_ids=[], category_ids=[c.id for c in cats])
             print(f"Seeded {count} varied products (raw INSERT fallback)")
 
 
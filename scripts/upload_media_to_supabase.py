@@ -1,74 +1,388 @@
-"""Upload local mediafiles to a Supabase Storage bucket preserving directory structure.
+"""Sync local mediafiles to object storage (Supabase Storage or S3), preserving directory structure.
 
 Usage:
-  Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in your shell (service role key for uploads).
-  Then run:
+  Supabase: set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY (service role key for uploads), then run:
     python scripts/upload_media_to_supabase.py --bucket your-bucket-name --local-dir mediafiles
 
-This script requires the 'supabase' Python package: pip install supabase
+  S3: uses the same environment as USE_S3 in nexus/settings.py (AWS_S3_BUCKET_NAME,
+  AWS_S3_REGION_NAME, AWS_S3_ENDPOINT_URL, AWS_S3_CACHE_CONTROL and the usual AWS credentials):
+    python scripts/upload_media_to_supabase.py --backend s3 --local-dir mediafiles
 
-It will upload files and print a few sample public URLs. For public access, ensure the bucket is public
-or use signed URLs (this script prints public URLs for public buckets).
+Files are uploaded by a bounded thread pool and streamed from disk rather than
+read into memory. Every successful upload is appended to a manifest (JSON
+lines: key, size, mtime, sha256), so a re-run only uploads new or changed
+files and an interrupted run resumes where it stopped. Throttling, 5xx
+responses and dropped connections are retried with exponential backoff.
+
+S3 needs boto3; Supabase only needs requests.
 """
+import argparse
+import hashlib
+import json
+import mimetypes
 import os
+import random
 import sys
-import argparse
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from urllib.parse import quote
+
+DEFAULT_WORKERS = 16
+DEFAULT_ATTEMPTS = 5
+DEFAULT_CACHE_CONTROL = 'max-age=86400, public'
+HASH_CHUNK_SIZE = 1024 * 1024
+# files above this go through boto3's multipart upload
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+# print a progress line every this many files
+PROGRESS_EVERY = 1000
+
+
+class UploadError(Exception):
+    """An upload that failed for good (bad credentials, missing bucket, ...)."""
+
+
+class TransientError(UploadError):
+    """A failure worth retrying (throttling, 5xx, dropped connection)."""
+
+
+def retry(fn, attempts=DEFAULT_ATTEMPTS, base_delay=0.5, max_delay=30.0, sleep=time.sleep):
+    """Call `fn`, retrying TransientError with full-jitter exponential backoff."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except TransientError:
+            if attempt == attempts:
+                raise
+            sleep(random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1))))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_type(key):
+    return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+def iter_files(base):
+    """Yield `(key, path, stat)` for every file under `base` without listing the whole tree first."""
+    base = Path(base)
+    stack = [base]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in reversed(entries):
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(Path(entry.path))
+        for entry in entries:
+            if entry.is_file():
+                path = Path(entry.path)
+                yield path.relative_to(base).as_posix(), path, entry.stat()
+
+
+class Manifest:
+    """Append-only JSON-lines record of uploaded files; the last line for a key wins."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._fh = None
+        if self.path.exists():
+            with open(self.path, encoding='utf-8') as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry['key']] = entry
+                    except (ValueError, KeyError, TypeError):
+                        # e.g. a line cut short when the previous run was killed
+                        continue
+
+    def unchanged(self, key, stat):
+        """True when `key` was uploaded with this exact size and mtime."""
+        entry = self.entries.get(key)
+        return entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    def sha256(self, key):
+        entry = self.entries.get(key)
+        return entry['sha256'] if entry else None
+
+    def record(self, key, stat, sha256):
+        entry = {'key': key, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._fh is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._fh = open(self.path, 'a+', encoding='utf-8')
+                # finish a line left incomplete by an interrupted run
+                if self._fh.tell() and not self._ends_with_newline():
+                    self._fh.write('\n')
+            self._fh.write(line)
+            self._fh.flush()
+            self.entries[key] = entry
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as fh:
+            fh.seek(-1, os.SEEK_END)
+            return fh.read(1) == b'\n'
+
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    def compact(self):
+        """Rewrite the manifest with one line per key."""
+        self.close()
+        if not self.entries:
+            return
+        tmp = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            for entry in self.entries.values():
+                fh.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        os.replace(tmp, self.path)
 
-try:
-    from supabase import create_client
-except Exception as e:
-    print("supabase package is required. Install with: pip install supabase")
-    raise
-
-
-def upload_dir(supabase_url, supabase_key, bucket, local_dir):
-    client = create_client(supabase_url, supabase_key)
-    base = Path(local_dir)
-    uploaded = []
-    for root, dirs, files in os.walk(base):
-        for fname in files:
-            local_path = Path(root) / fname
-            rel_path = str(local_path.relative_to(base)).replace('\\', '/')
-            dest_path = rel_path  # keep same relative path in bucket
-            print(f"Uploading {local_path} -> {dest_path}")
-            with open(local_path, 'rb') as f:
-                data = f.read()
+
+class SupabaseBackend:
+    """Supabase Storage REST API, one pooled HTTP session per worker thread."""
+
+    name = 'supabase'
+
+    def __init__(self, url, key, bucket, cache_control=DEFAULT_CACHE_CONTROL, timeout=120):
+        self.url = url.rstrip('/')
+        self.bucket = bucket
+        self.timeout = timeout
+        self.headers = {'Authorization': f'Bearer {key}', 'apikey': key, 'x-upsert': 'true',
+                        'cache-control': cache_control}
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = requests.Session()
+            session.headers.update(self.headers)
+            self._local.session = session
+        return session
+
+    def upload(self, key, path, size, sha256):
+        import requests
+        headers = {'Content-Type': content_type(key), 'Content-Length': str(size)}
+        try:
+            with open(path, 'rb') as fh:
+                resp = self._session().post(f'{self.url}/storage/v1/object/{self.bucket}/{quote(key)}',
+                                            data=fh, headers=headers, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            raise TransientError(str(exc))
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise TransientError(f'HTTP {resp.status_code}')
+        if resp.status_code >= 400:
+            raise UploadError(f'HTTP {resp.status_code}: {resp.text[:200]}')
+
+    def public_url(self, key):
+        return f'{self.url}/storage/v1/object/public/{self.bucket}/{key}'
+
+
+class S3Backend:
+    """S3 (or an S3-compatible endpoint) through one thread-safe boto3 client."""
+
+    name = 's3'
+    RETRYABLE_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestTimeout',
+                       'RequestTimeTooSkewed', 'InternalError', 'ServiceUnavailable'}
+
+    def __init__(self, bucket, region=None, endpoint_url=None, cache_control=DEFAULT_CACHE_CONTROL,
+                 workers=DEFAULT_WORKERS, client=None):
+        import boto3
+        from botocore.config import Config
+        self.bucket = bucket
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self.cache_control = cache_control
+        # retries are handled by `retry` so the backoff policy is the same for both backends
+        self.client = client or boto3.client(
+            's3', region_name=region, endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=workers, retries={'mode': 'standard', 'total_max_attempts': 1}))
+
+    def upload(self, key, path, size, sha256):
+        from boto3.exceptions import S3UploadFailedError
+        from boto3.s3.transfer import TransferConfig
+        from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+
+        extra = {'ContentType': content_type(key), 'CacheControl': self.cache_control, 'Metadata': {'sha256': sha256}}
+        try:
+            with open(path, 'rb') as fh:
+                if size < MULTIPART_THRESHOLD:
+                    self.client.put_object(Bucket=self.bucket, Key=key, Body=fh, ContentLength=size, **extra)
+                else:
+                    # the pool already runs files in parallel; keep each upload on its thread
+                    self.client.upload_fileobj(fh, self.bucket, key, ExtraArgs=extra,
+                                               Config=TransferConfig(use_threads=False))
+        except ClientError as exc:
+            error = exc.response.get('Error', {})
+            status = exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+            if error.get('Code') in self.RETRYABLE_CODES or status >= 500:
+                raise TransientError(str(exc))
+            raise UploadError(str(exc))
+        except (BotoConnectionError, HTTPClientError, S3UploadFailedError) as exc:
+            raise TransientError(str(exc))
+
+    def public_url(self, key):
+        if self.endpoint_url:
+            return f'{self.endpoint_url.rstrip("/")}/{self.bucket}/{key}'
+        return f'https://{self.bucket}.s3.amazonaws.com/{key}'
+
+
+class SyncStats:
+    def __init__(self):
+        self.uploaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.uploaded_keys = []
+        self.errors = []
+        self.started = time.perf_counter()
+
+    @property
+    def files(self):
+        return self.uploaded + self.skipped + self.failed
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.files / elapsed if elapsed else 0
+        return (f'{self.files} files in {elapsed:.1f}s ({rate:.0f}/s): {self.uploaded} uploaded '
+                f'({self.bytes / 1e6:.1f} MB), {self.skipped} unchanged, {self.failed} failed')
+
+
+def sync_file(backend, manifest, key, path, stat, attempts=DEFAULT_ATTEMPTS, dry_run=False):
+    """Upload one file unless the manifest shows it unchanged; returns 'uploaded' or 'skipped'."""
+    if manifest.unchanged(key, stat):
+        return 'skipped'
+    digest = file_sha256(path)
+    if manifest.sha256(key) == digest:
+        # touched but identical: remember the new mtime so it is not hashed again
+        if not dry_run:
+            manifest.record(key, stat, digest)
+        return 'skipped'
+    if dry_run:
+        return 'uploaded'
+    retry(lambda: backend.upload(key, path, stat.st_size, digest), attempts=attempts)
+    manifest.record(key, stat, digest)
+    return 'uploaded'
+
+
+def sync(backend, local_dir, manifest, workers=DEFAULT_WORKERS, attempts=DEFAULT_ATTEMPTS, dry_run=False,
+         prefix='', progress=None):
+    """Upload everything under `local_dir` that the manifest does not already cover.
+
+    At most `workers * 4` files are queued at a time, so memory does not grow
+    with the size of the tree.
+    """
+    stats = SyncStats()
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            key, size = pending.pop(future)
             try:
-                res = client.storage.from_(bucket).upload(dest_path, data)
-            except Exception as e:
-                print(f"Failed to upload {local_path}: {e}")
+                outcome = future.result()
+            except Exception as exc:
+                stats.failed += 1
+                if len(stats.errors) < 1000:
+                    stats.errors.append((key, str(exc)))
                 continue
-            uploaded.append(dest_path)
-    return uploaded
+            if outcome == 'uploaded':
+                stats.uploaded += 1
+                stats.bytes += size
+                if len(stats.uploaded_keys) < 10:
+                    stats.uploaded_keys.append(key)
+            else:
+                stats.skipped += 1
+            if progress and stats.files % PROGRESS_EVERY == 0:
+                progress(stats.summary())
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-sync')
+    try:
+        for relative, path, stat in iter_files(local_dir):
+            key = f'{prefix.strip("/")}/{relative}' if prefix.strip('/') else relative
+            future = pool.submit(sync_file, backend, manifest, key, path, stat, attempts, dry_run)
+            pending[future] = (key, stat.st_size)
+            if len(pending) >= workers * 4:
+                collect(wait(pending, return_when=FIRST_COMPLETED)[0])
+        collect(wait(pending)[0])
+    except KeyboardInterrupt:
+        # whatever finished is in the manifest; a re-run picks up the rest
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        pool.shutdown(wait=True)
+        manifest.close()
+    return stats
 
 
-def print_sample_urls(supabase_url, bucket, paths, sample=10):
-    base = f"{supabase_url}/storage/v1/object/public/{bucket}"
+def print_sample_urls(backend, keys, sample=10):
     print('\nSample public URLs:')
-    for p in paths[:sample]:
-        print(f"{base}/{p}")
+    for key in keys[:sample]:
+        print(backend.public_url(key))
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--bucket', required=True, help='Supabase storage bucket name')
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', choices=['supabase', 's3'], default='supabase')
+    parser.add_argument('--bucket', help='Bucket name (S3 defaults to AWS_S3_BUCKET_NAME)')
     parser.add_argument('--local-dir', default='mediafiles', help='Local media directory to upload')
-    args = parser.parse_args()
+    parser.add_argument('--prefix', default='', help='Key prefix inside the bucket')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Concurrent uploads')
+    parser.add_argument('--attempts', type=int, default=DEFAULT_ATTEMPTS, help='Tries per file for transient errors')
+    parser.add_argument('--manifest', help='Manifest path (default: var/media-sync-<backend>-<bucket>.jsonl)')
+    parser.add_argument('--cache-control', default=os.getenv('AWS_S3_CACHE_CONTROL', DEFAULT_CACHE_CONTROL))
+    parser.add_argument('--dry-run', action='store_true', help='Hash and compare only; upload nothing')
+    args = parser.parse_args(argv)
+
+    if args.backend == 'supabase':
+        supabase_url = os.getenv('SUPABASE_URL')
+        supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+        if not supabase_url or not supabase_key or not args.bucket:
+            print('Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in your environment and pass --bucket')
+            return 2
+        backend = SupabaseBackend(supabase_url, supabase_key, args.bucket, cache_control=args.cache_control)
+    else:
+        bucket = args.bucket or os.getenv('AWS_S3_BUCKET_NAME') or os.getenv('AWS_STORAGE_BUCKET_NAME')
+        if not bucket:
+            print('Pass --bucket or set AWS_S3_BUCKET_NAME')
+            return 2
+        backend = S3Backend(bucket, region=os.getenv('AWS_S3_REGION_NAME'),
+                            endpoint_url=os.getenv('AWS_S3_ENDPOINT_URL'), cache_control=args.cache_control,
+                            workers=args.workers)
 
-    supabase_url = os.getenv('SUPABASE_URL')
-    supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
-    if not supabase_url or not supabase_key:
-        print('Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in your environment')
+    if not Path(args.local_dir).is_dir():
+        print(f'{args.local_dir} is not a directory')
         return 2
+    manifest = Manifest(args.manifest or Path('var') / f'media-sync-{backend.name}-{backend.bucket}.jsonl')
+    print(f'Syncing {args.local_dir} -> {backend.name}:{backend.bucket} '
+          f'({len(manifest.entries)} files already in {manifest.path})')
+    try:
+        stats = sync(backend, args.local_dir, manifest, workers=args.workers, attempts=args.attempts,
+                     dry_run=args.dry_run, prefix=args.prefix, progress=print)
+    except KeyboardInterrupt:
+        print('\nInterrupted; run again to resume.')
+        return 130
+    manifest.compact()
 
-    paths = upload_dir(supabase_url, supabase_key, args.bucket, args.local_dir)
-    if not paths:
-        print('No files uploaded')
-        return 1
-    print_sample_urls(supabase_url, args.bucket, paths)
+    for key, error in stats.errors:
+        print(f'Failed to upload {key}: {error}')
+    print(stats.summary())
+    if stats.uploaded_keys and not args.dry_run:
+        print_sample_urls(backend, stats.uploaded_keys)
     print('\nDone.')
-    return 0
+    return 1 if stats.failed else 0
 
 
 if __name__ == '__main__':
@@ -7,4 +7,10 @@ set -euo pipefail
 python manage.py migrate --noinput
 python -m scripts.create_admin_if_missing
 python manage.py collectstatic --noinput
+# Workers load the search index snapshot at boot instead of each tokenizing the catalog
+if [ "${CATALOG_SEARCH_BACKEND:-auto}" = "bm25" ]; then
+  python manage.py build_search_index
+fi
+# Worker metric files from a previous run (nexus/metrics.py); counters restart with the server
+rm -rf "${METRICS_DIR:-var/metrics}"
 exec gunicorn nexus.wsgi:application --bind 0.0.0.0:"$PORT" --workers 3
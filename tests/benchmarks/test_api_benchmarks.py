@@ -0,0 +1,248 @@
+"""In-process benchmarks for the hot API endpoints.
+
+Each case drives one endpoint through the test client over a generated
+catalog and records, per request:
+
+- wall: total time in the client call (ms)
+- queries / sql: SQL statements issued and the database time they took (ms)
+- serialize: time building payloads (`product_payloads`, DRF serializer `.data`) (ms)
+- render: time in the JSON renderer (ms)
+
+A case runs ROUNDS times; query counts use the worst round, timings the
+median. The result is checked against `budgets.json` next to this file, so a
+new N+1 (more queries) or a slower serializer fails the suite. Query budgets
+are exact maxima; time budgets carry headroom and scale with
+BENCHMARK_TIME_FACTOR for slow machines.
+
+    BENCHMARK_REPORT=bench.json   write the measurements as JSON
+    BENCHMARK_UPDATE=1            rewrite budgets.json from this run
+"""
+import json
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIClient
+
+import catalog.views
+from catalog.models import Category, Product, ProductImage, ProductVariant
+from catalog.signals import products_bulk_changed
+from orders.models import Cart, CartItem
+
+BUDGETS_PATH = Path(__file__).with_name('budgets.json')
+ROUNDS = int(os.getenv('BENCHMARK_ROUNDS', '5'))
+TIME_FACTOR = float(os.getenv('BENCHMARK_TIME_FACTOR', '1'))
+TIME_METRICS = ('wall', 'sql', 'serialize', 'render')
+# budgets written by BENCHMARK_UPDATE: measured time x headroom, never below the floor
+UPDATE_HEADROOM = 5
+UPDATE_FLOOR_MS = 20
+
+CATEGORIES = 6
+PRODUCTS = 120
+VARIANTS_PER_PRODUCT = 3
+IMAGES_PER_PRODUCT = 2
+CART_ITEMS = 3
+
+
+class Timers:
+    """Accumulates time spent in serializers and the renderer while installed."""
+
+    def __init__(self):
+        self.totals = {'serialize': 0.0, 'render': 0.0}
+        # nested serializers (a payload builder calling .data) count once
+        self._depth = threading.local()
+
+    def _timed(self, metric, func):
+        def wrapper(*args, **kwargs):
+            depth = getattr(self._depth, metric, 0)
+            setattr(self._depth, metric, depth + 1)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                setattr(self._depth, metric, depth)
+                if depth == 0:
+                    self.totals[metric] += time.perf_counter() - started
+        return wrapper
+
+    @contextmanager
+    def installed(self):
+        data = BaseSerializer.data.fget
+        with mock.patch.object(BaseSerializer, 'data', property(self._timed('serialize', data))), \
+                mock.patch.object(catalog.views, 'product_payloads',
+                                  self._timed('serialize', catalog.views.product_payloads)), \
+                mock.patch.object(JSONRenderer, 'render', self._timed('render', JSONRenderer.render)):
+            yield self
+
+
+class QueryTimer:
+    """`connection.execute_wrapper` hook recording each statement and its duration."""
+
+    def __init__(self):
+        self.statements = []
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.statements.append(sql)
+
+
+def measure(call):
+    """Run `call()` once; returns (response, {metric: value}, executed SQL)."""
+    timers, queries = Timers(), QueryTimer()
+    with timers.installed(), connection.execute_wrapper(queries):
+        started = time.perf_counter()
+        response = call()
+        wall = time.perf_counter() - started
+    return response, {
+        'wall': wall * 1000,
+        'queries': len(queries.statements),
+        'sql': queries.seconds * 1000,
+        'serialize': timers.totals['serialize'] * 1000,
+        'render': timers.totals['render'] * 1000,
+    }, queries.statements
+
+
+def load_budgets():
+    if BUDGETS_PATH.exists():
+        return json.loads(BUDGETS_PATH.read_text(encoding='utf-8'))
+    return {}
+
+
+class APIBenchmarks(TestCase):
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create(
+            [Category(name=f'Bench {i}', slug=f'bench-{i}') for i in range(CATEGORIES)])
+        products = Product.objects.bulk_create([
+            Product(name=f'Bench {"Lamp Chair Mug".split()[i % 3]} {i}', slug=f'bench-{i}',
+                    description=f'Benchmark product {i} with a longer description for search.',
+                    price=f'{5 + i % 90}.50', inventory=1000, category=categories[i % CATEGORIES])
+            for i in range(PRODUCTS)])
+        ProductVariant.objects.bulk_create([
+            ProductVariant(product=p, sku=f'{p.slug}-{v}', name=f'Size {v}', inventory=1000,
+                           attributes={'size': 'SML'[v % 3], 'color': ['red', 'blue'][v % 2]})
+            for p in products for v in range(VARIANTS_PER_PRODUCT)])
+        ProductImage.objects.bulk_create([
+            ProductImage(product=p, image=f'products/images/{p.slug}-{n}.jpg', alt=p.name, order=n)
+            for p in products for n in range(IMAGES_PER_PRODUCT)])
+        # builds the product documents the read paths serve from
+        products_bulk_changed.send(sender=Product, product_ids=[p.pk for p in products],
+                                   category_ids=[c.pk for c in categories])
+        cls.user = get_user_model().objects.create_user('bench', 'bench@example.com', 'bench-pass-123')
+        cls.product_ids = [p.pk for p in products]
+        cls.category = categories[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.budgets = load_budgets()
+
+    def _cart(self, items=CART_ITEMS):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product_id=pk, quantity=1)
+                                      for pk in self.product_ids[:items]])
+        return cart
+
+    def run_case(self, name, call, prepare=None, expect=200):
+        """Benchmark `call(state)` over ROUNDS rounds; `prepare()` builds per-round state outside the timing."""
+        rounds = []
+        for _ in range(ROUNDS):
+            # throttling and the read-through caches live in the cache; measure the uncached path
+            cache.clear()
+            state = prepare() if prepare else None
+            response, metrics, sql = measure(lambda: call(state))
+            self.assertEqual(response.status_code, expect, getattr(response, 'data', None))
+            rounds.append((metrics, sql))
+        result = {metric: round(statistics.median(m[metric] for m, _ in rounds), 2) for metric in TIME_METRICS}
+        worst = max(rounds, key=lambda r: r[0]['queries'])
+        result['queries'] = worst[0]['queries']
+        type(self).results[name] = result
+        self._check_budget(name, result, worst[1])
+
+    def _check_budget(self, name, result, sql):
+        if os.getenv('BENCHMARK_UPDATE'):
+            return
+        budget = self.budgets.get(name)
+        if budget is None:
+            self.fail(f'no budget for {name!r} in {BUDGETS_PATH.name}; run with BENCHMARK_UPDATE=1 to record one')
+        over = []
+        if result['queries'] > budget['queries']:
+            over.append(f"queries {result['queries']} > {budget['queries']}")
+        for metric in TIME_METRICS:
+            limit = budget.get(f'{metric}_ms')
+            if limit is not None and result[metric] > limit * TIME_FACTOR:
+                over.append(f'{metric} {result[metric]:.1f}ms > {limit * TIME_FACTOR:.1f}ms')
+        if over:
+            self.fail(f'{name} over budget: ' + ', '.join(over) + '\nSQL:\n' + '\n'.join(sql))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        report = os.getenv('BENCHMARK_REPORT')
+        if report:
+            Path(report).write_text(json.dumps(cls.results, indent=2, sort_keys=True), encoding='utf-8')
+        if os.getenv('BENCHMARK_UPDATE') and cls.results:
+            budgets = load_budgets()
+            for name, result in cls.results.items():
+                budgets[name] = {'queries': result['queries']}
+                budgets[name].update({f'{m}_ms': max(UPDATE_FLOOR_MS, round(result[m] * UPDATE_HEADROOM))
+                                      for m in TIME_METRICS})
+            BUDGETS_PATH.write_text(json.dumps(budgets, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+
+    # catalog reads
+
+    def test_product_list(self):
+        self.run_case('product_list', lambda _: self.client.get('/api/catalog/products/', {'limit': 50}))
+
+    def test_product_list_with_facets(self):
+        self.run_case('product_list_facets',
+                      lambda _: self.client.get('/api/catalog/products/', {'limit': 50, 'facets': 'true'}))
+
+    def test_product_detail(self):
+        pk = self.product_ids[len(self.product_ids) // 2]
+        self.run_case('product_detail', lambda _: self.client.get(f'/api/catalog/products/{pk}/'))
+
+    def test_product_search(self):
+        self.run_case('product_search', lambda _: self.client.get('/api/catalog/products/', {'search': 'lamp'}))
+
+    def test_product_filter(self):
+        params = {'category__id': self.category.pk, 'min_price': 10, 'max_price': 60, 'ordering': '-price'}
+        self.run_case('product_filter', lambda _: self.client.get('/api/catalog/products/', params))
+
+    # cart and checkout writes
+
+    def test_cart_add_item(self):
+        self.client.force_authenticate(self.user)
+        self.run_case(
+            'cart_add_item',
+            lambda cart: self.client.post(f'/api/orders/carts/{cart.pk}/add-item/',
+                                          {'product': self.product_ids[-1], 'quantity': 1}, format='json'),
+            prepare=self._cart, expect=201)
+
+    def test_cart_reserve(self):
+        self.client.force_authenticate(self.user)
+        self.run_case('cart_reserve', lambda cart: self.client.post(f'/api/orders/carts/{cart.pk}/reserve/'),
+                      prepare=self._cart, expect=201)
+
+    def test_create_order_from_cart(self):
+        self.client.force_authenticate(self.user)
+        self.run_case(
+            'order_create_from_cart',
+            lambda cart: self.client.post('/api/orders/orders/create-from-cart/', {'cart_id': cart.pk}, format='json'),
+            prepare=self._cart, expect=201)
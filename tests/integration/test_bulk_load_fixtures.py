@@ -0,0 +1,115 @@
+import csv
+import gzip
+import io
+import json
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from catalog.models import Category, Product, ProductDocument, ProductVariant
+from scripts import bulk_load_fixtures as loader
+
+
+def fixture(*objects):
+    return json.dumps(list(objects), indent=2)
+
+
+CATEGORY = {'model': 'catalog.category', 'pk': 7, 'fields': {'name': 'Garden [outdoor], "tools"', 'slug': 'garden'}}
+
+
+def product(pk, price='9.99', **fields):
+    return {'model': 'catalog.product', 'pk': pk, 'fields': {
+        'name': f'Rake {pk}', 'slug': f'rake-{pk}', 'description': '', 'price': price, 'inventory': 3,
+        'category': 7, 'created_at': '2024-01-02T03:04:05Z', 'updated_at': '2024-01-02T03:04:05Z', **fields}}
+
+
+class FixtureParserTests(TestCase):
+    def test_streams_objects_across_chunk_boundaries(self):
+        objects = [CATEGORY, product(1), product(2, price='10.5'), {'model': 'x', 'fields': {'n': [1, 2.5e3, None]}}]
+        text = fixture(*objects)
+        for chunk_size in (1, 3, 7, 64, 4096):
+            parsed = list(loader.iter_fixture_objects(io.StringIO(text), chunk_size=chunk_size))
+            self.assertEqual(parsed, objects, chunk_size)
+
+    def test_numbers_split_at_chunk_edges_and_empty_arrays(self):
+        self.assertEqual(list(loader.iter_fixture_objects(io.StringIO('[12345, 678]'), chunk_size=2)), [12345, 678])
+        self.assertEqual(list(loader.iter_fixture_objects(io.StringIO(' [ ] '), chunk_size=1)), [])
+        self.assertEqual(list(loader.iter_fixture_objects(io.StringIO(''))), [])
+
+    def test_rejects_truncated_and_non_array_input(self):
+        with self.assertRaises(ValueError):
+            list(loader.iter_fixture_objects(io.StringIO('[{"a": 1}, {"b": '), chunk_size=4))
+        with self.assertRaises(ValueError):
+            list(loader.iter_fixture_objects(io.StringIO('{"a": 1}')))
+
+
+class BulkLoadTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.quiet = mock.patch('builtins.print')
+        self.printed = self.quiet.start()
+        self.addCleanup(self.quiet.stop)
+
+    def _write(self, name, text):
+        path = Path(self.tmp.name) / name
+        if name.endswith('.gz'):
+            with gzip.open(path, 'wt', encoding='utf-8') as fh:
+                fh.write(text)
+        else:
+            path.write_text(text, encoding='utf-8')
+        return path
+
+    def test_loads_in_batches_and_reports_rate(self):
+        variants = [{'model': 'catalog.productvariant', 'pk': 100 + i,
+                     'fields': {'product': i, 'sku': f'RAKE-{i}', 'attributes': {'size': 'L'}}} for i in range(1, 6)]
+        path = self._write('catalog.json.gz', fixture(
+            CATEGORY, *[product(i) for i in range(1, 6)], {'model': 'auth.user', 'pk': 1, 'fields': {}}, *variants))
+        with mock.patch.object(loader.products_bulk_changed, 'send',
+                               wraps=loader.products_bulk_changed.send) as sent:
+            stats = loader.load_fixture(path, batch_size=2)
+        self.assertEqual(stats.rows, {'catalog.category': 1, 'catalog.product': 5, 'catalog.productvariant': 5})
+        self.assertEqual(stats.skipped_models, {'auth.user'})
+        self.assertEqual(Product.objects.count(), 5)
+        self.assertEqual(ProductVariant.objects.get(pk=103).attributes, {'size': 'L'})
+        lines = [call.args[0] for call in self.printed.call_args_list]
+        self.assertIn('catalog.product batch 3: 1 rows', '\n'.join(lines))
+        self.assertTrue(any('rows/s' in line for line in lines))
+        # documents were rebuilt batch by batch, never for more than a batch at once
+        self.assertEqual(ProductDocument.objects.count(), 5)
+        self.assertEqual(max(len(call.kwargs['product_ids']) for call in sent.call_args_list), 2)
+
+    def test_upsert_updates_existing_rows_and_skip_leaves_them(self):
+        loader.load_fixture(self._write('a.json', fixture(CATEGORY, product(1), product(2))))
+        loader.load_fixture(self._write('b.json', fixture(product(2, price='20.00'), product(3))), mode='skip')
+        self.assertEqual(Product.objects.get(pk=2).price, Decimal('9.99'))
+        self.assertEqual(Product.objects.count(), 3)
+
+        loader.load_fixture(self._write('c.json', fixture(product(2, price='20.00', inventory=0))))
+        self.assertEqual(Product.objects.get(pk=2).price, Decimal('20.00'))
+        self.assertEqual(Product.objects.get(pk=2).inventory, 0)
+        self.assertEqual(Category.objects.get(pk=7).name, 'Garden [outdoor], "tools"')
+
+    def test_copy_rows_encode_nulls_empty_strings_and_json(self):
+        instance = loader.build_instance(ProductVariant, {'pk': 5, 'fields': {
+            'product': 1, 'sku': 'X', 'name': '', 'price': None, 'attributes': {'a': 'b, "c"'}}})
+        rows = list(csv.reader(loader.copy_rows_csv(ProductVariant, [instance])))
+        columns = [f.column for f in ProductVariant._meta.concrete_fields]
+        row = dict(zip(columns, rows[0]))
+        self.assertEqual(json.loads(row['attributes']), {'a': 'b, "c"'})
+        raw = loader.copy_rows_csv(ProductVariant, [instance]).getvalue()
+        # empty name is quoted, NULL price is a bare empty cell
+        self.assertIn(',"",,', raw)
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY needs PostgreSQL')
+    def test_copy_path_upserts(self):
+        loader.load_fixture(self._write('a.json', fixture(CATEGORY, product(1))), use_copy=True)
+        loader.load_fixture(self._write('b.json', fixture(product(1, price='5.00'), product(2))), use_copy=True)
+        self.assertEqual(Product.objects.get(pk=1).price, Decimal('5.00'))
+        # the sequence was moved past the explicit ids
+        created = Product.objects.create(name='New', slug='new', price='1', category_id=7)
+        self.assertGreater(created.pk, 2)
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from catalog.models import Category, Product, ProductDocument, ProductImage
+from scripts import add_product_images, fill_with_placeholders, image_fetcher
+
+
+class FakeSession:
+    """Stands in for the pooled requests session; fails URLs listed in `broken`."""
+
+    def __init__(self, broken=()):
+        self.broken = set(broken)
+        self.urls = []
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        with self._lock:
+            self.urls.append(url)
+            self.threads.add(threading.get_ident())
+        resp = mock.Mock(content=b'\xff\xd8jpeg-bytes')
+        resp.raise_for_status.side_effect = Exception('503') if url in self.broken else None
+        return resp
+
+
+class ImageScriptTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media, CATALOG_RENDITIONS_ENABLED=False)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.cat = Category.objects.create(name='Tools', slug='tools')
+        for i in range(12):
+            Product.objects.create(name=f'Tool {i}', slug=f'tool-{i}', price='1.00', category=self.cat,
+                                   image='products/existing.jpg' if i == 0 else None)
+        self.quiet = mock.patch('builtins.print')
+        self.quiet.start()
+        self.addCleanup(self.quiet.stop)
+
+    def test_iter_rows_streams_in_keyset_batches(self):
+        qs = Product.objects.values('pk')
+        with self.assertNumQueries(3):
+            # 12 rows: two full batches and a short one that ends the walk
+            rows = list(image_fetcher.iter_rows(qs, batch_size=5))
+        self.assertEqual([r['pk'] for r in rows], sorted(r['pk'] for r in qs))
+        self.assertEqual(len(list(image_fetcher.iter_rows(qs, batch_size=5, limit=7))), 7)
+
+    def test_attach_images_bulk_updates_products(self):
+        session = FakeSession()
+        with CaptureQueriesContext(connection) as ctx:
+            stats = add_product_images.attach_images(count=10, dry_run=False, workers=4, batch_size=5,
+                                                     session=session)
+        # one UPDATE per batch of five
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "catalog_product"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual((stats.candidates, stats.downloaded, stats.failed, stats.written), (10, 10, 0, 10))
+        self.assertEqual(Product.objects.exclude(image__in=['', None]).count(), 11)
+        product = Product.objects.get(slug='tool-1')
+        self.assertTrue(default_storage.exists(product.image.name))
+        # documents were rebuilt for the bulk update
+        self.assertEqual(ProductDocument.objects.get(product=product).data['image'], product.image.url)
+
+    def test_attach_images_skips_failed_downloads(self):
+        session = FakeSession()
+        with mock.patch.object(add_product_images.random, 'randint', side_effect=range(1, 100)):
+            session.broken = {'https://picsum.photos/id/2/800/600'}
+            stats = add_product_images.attach_images(count=3, dry_run=False, workers=2, session=session)
+        self.assertEqual((stats.downloaded, stats.failed, stats.written), (2, 1, 2))
+
+    def test_dry_run_touches_nothing(self):
+        session = FakeSession()
+        stats = add_product_images.attach_images(count=50, dry_run=True, session=session)
+        self.assertEqual(stats.candidates, 11)
+        self.assertEqual(session.urls, [])
+
+    def test_fill_with_placeholders_bulk_creates_images(self):
+        ProductImage.objects.create(product=Product.objects.get(slug='tool-3'), image='products/images/x.jpg')
+        session = FakeSession()
+        fill_with_placeholders.run(dry_run=False, count=3, batch_size=4, session=session, verbose=False)
+        self.assertEqual(len(session.urls), 3)
+        self.assertEqual(ProductImage.objects.count(), 12)
+        self.assertFalse(fill_with_placeholders.products_without_images().exists())
+        names = set(ProductImage.objects.exclude(image='products/images/x.jpg').values_list('image', flat=True))
+        self.assertEqual(len(names), 3)
+
+        # placeholders already in storage are reused, not downloaded again
+        ProductImage.objects.filter(image__startswith='products/placeholders').delete()
+        session = FakeSession()
+        stats = fill_with_placeholders.run(dry_run=False, count=3, session=session, verbose=False)
+        self.assertEqual(session.urls, [])
+        self.assertEqual((stats.reused, stats.written), (3, 11))
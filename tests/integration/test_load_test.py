@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import LiveServerTestCase, SimpleTestCase
+
+from catalog.models import Category, Product
+from scripts import load_test
+
+
+class ReportMathTests(SimpleTestCase):
+    def test_nearest_rank_percentiles(self):
+        values = list(range(1, 101))
+        self.assertEqual(load_test.percentile(values, 50), 50)
+        self.assertEqual(load_test.percentile(values, 99), 99)
+        self.assertEqual(load_test.percentile([7], 95), 7)
+        self.assertIsNone(load_test.percentile([], 50))
+
+    def test_parse_mix(self):
+        self.assertEqual(load_test.parse_mix('list=3, detail=1'), {'list': 3.0, 'detail': 1.0})
+        with self.assertRaises(ValueError):
+            load_test.parse_mix('list=1,browse=2')
+        with self.assertRaises(ValueError):
+            load_test.parse_mix('list=0')
+
+    def test_recorder_separates_errors_and_throttling(self):
+        recorder = load_test.Recorder()
+        recorder.add('list', 0.5, 200)  # before start(): warmup, discarded
+        recorder.start()
+        for seconds, status in ((0.010, 200), (0.020, 200), (0.030, 429), (0.040, 500), (0.050, 'ConnectionError')):
+            recorder.add('list', seconds, status)
+        recorder.stop()
+        stats = recorder.report()['endpoints']['list']
+        self.assertEqual((stats['requests'], stats['errors'], stats['throttled']), (5, 2, 1))
+        self.assertEqual((stats['p50'], stats['max']), (30.0, 50.0))
+
+    def test_compare_flags_regressions_beyond_tolerance(self):
+        baseline = {'totals': {'p95': 100, 'p99': 200, 'rps': 50}, 'endpoints': {'list': {'p95': 10, 'p99': 20, 'rps': 40}}}
+        report = {'totals': {'p95': 105, 'p99': 260, 'rps': 50}, 'endpoints': {
+            'list': {'p95': 10, 'p99': 20, 'rps': 30}, 'search': {'p95': 1, 'p99': 1, 'rps': 1}}}
+        regressed = {(name, metric) for name, metric, *_, bad in load_test.compare(report, baseline, 10) if bad}
+        self.assertEqual(regressed, {('total', 'p99'), ('list', 'rps')})
+
+
+class LoadRunTests(LiveServerTestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Perf', slug='perf')
+        for i in range(5):
+            Product.objects.create(name=f'Sturdy Lamp {i}', slug=f'lamp-{i}', price='5.00', inventory=100,
+                                   category=category)
+        get_user_model().objects.create_user('perf', 'perf@example.com', 'perf-pass-123')
+
+    def test_runs_weighted_mix_and_reports_per_request(self):
+        report = load_test.run(self.live_server_url, concurrency=2, duration=10, warmup=0,
+                               mix={'detail': 1, 'search': 1, 'checkout': 1}, max_requests=24,
+                               username='perf', password='perf-pass-123', seed=3, log=None)
+        totals = report['totals']
+        self.assertGreaterEqual(totals['requests'], 24)
+        self.assertEqual(totals['errors'], 0, report['endpoints'])
+        self.assertLessEqual(totals['p50'], totals['p95'])
+        self.assertLessEqual(totals['p99'], totals['max'])
+        self.assertIn('detail', report['endpoints'])
+        self.assertIn('checkout.create_order', report['endpoints'])
+        self.assertEqual(report['meta']['mix'], {'detail': 1, 'search': 1, 'checkout': 1})
+        self.assertIn('checkout.reserve', load_test.format_report(report))
+
+    def test_discovery_follows_cursor_pages(self):
+        client = load_test.Client(self.live_server_url, load_test.Recorder(), timeout=10)
+        catalog = load_test.Catalog.discover(client, page_size=2)
+        self.assertEqual(len(catalog.pages), 3)
+        self.assertTrue(all(page.startswith(load_test.CATALOG) for page in catalog.pages))
+        self.assertIn('cursor=', catalog.pages[-1])
+        self.assertEqual(len(set(catalog.product_ids)), 5)
+        # every collected page is a distinct page of the list
+        seen = [tuple(p['id'] for p in client.session.get(self.live_server_url + page).json()['results'])
+                for page in catalog.pages]
+        self.assertEqual(len(set(seen)), 3)
+
+    def test_auth_scenarios_dropped_without_credentials(self):
+        messages = []
+        report = load_test.run(self.live_server_url, concurrency=1, duration=10, warmup=0,
+                               mix={'list': 1, 'cart': 1}, max_requests=5, log=messages.append)
+        self.assertEqual(set(report['endpoints']), {'list'})
+        self.assertIn('skipping cart', messages[0])
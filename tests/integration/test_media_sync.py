@@ -0,0 +1,147 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+import boto3
+from moto import mock_aws
+
+from scripts import upload_media_to_supabase as media_sync
+
+
+@mock_aws
+class MediaSyncS3Tests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.media = Path(self.tmp.name) / 'mediafiles'
+        self.files = {
+            'products/kettle.jpg': b'kettle' * 1000,
+            'products/images/side.png': b'side',
+            'products/images/renditions/side-160w.webp': b'small',
+        }
+        for key, data in self.files.items():
+            path = self.media / key
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        self.manifest_path = Path(self.tmp.name) / 'var' / 'manifest.jsonl'
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket='media')
+        self.backend = media_sync.S3Backend('media', region='us-east-1', workers=4)
+
+    def _sync(self, **kwargs):
+        return media_sync.sync(self.backend, self.media, media_sync.Manifest(self.manifest_path), workers=4, **kwargs)
+
+    def test_uploads_then_skips_unchanged_files(self):
+        stats = self._sync()
+        self.assertEqual((stats.uploaded, stats.skipped, stats.failed), (3, 0, 0))
+        obj = self.s3.get_object(Bucket='media', Key='products/kettle.jpg')
+        self.assertEqual(obj['Body'].read(), self.files['products/kettle.jpg'])
+        self.assertEqual(obj['ContentType'], 'image/jpeg')
+        self.assertEqual(obj['Metadata']['sha256'], hashlib.sha256(self.files['products/kettle.jpg']).hexdigest())
+
+        with mock.patch.object(self.backend, 'upload') as upload:
+            stats = self._sync()
+        self.assertEqual((stats.uploaded, stats.skipped), (0, 3))
+        upload.assert_not_called()
+
+    def test_changed_and_touched_files(self):
+        self._sync()
+        changed = self.media / 'products/images/side.png'
+        changed.write_bytes(b'new side')
+        touched = self.media / 'products/kettle.jpg'
+        os.utime(touched, ns=(touched.stat().st_atime_ns, touched.stat().st_mtime_ns + 10 ** 9))
+
+        stats = self._sync()
+        self.assertEqual((stats.uploaded, stats.skipped), (1, 2))
+        self.assertEqual(self.s3.get_object(Bucket='media', Key='products/images/side.png')['Body'].read(), b'new side')
+        # the touched file's new mtime was recorded, so it is not even hashed next time
+        with mock.patch.object(media_sync, 'file_sha256') as sha:
+            self._sync()
+        sha.assert_not_called()
+
+    def test_resumes_from_a_truncated_manifest(self):
+        self._sync()
+        lines = self.manifest_path.read_text().splitlines()
+        self.assertEqual(len(lines), 3)
+        # simulate a run killed after two uploads, mid-way through writing the third line
+        self.manifest_path.write_text(lines[0] + '\n' + lines[1] + '\n' + lines[2][:10])
+        manifest = media_sync.Manifest(self.manifest_path)
+        self.assertEqual(len(manifest.entries), 2)
+
+        stats = media_sync.sync(self.backend, self.media, manifest, workers=2)
+        self.assertEqual((stats.uploaded, stats.skipped), (1, 2))
+        self.assertEqual(len(media_sync.Manifest(self.manifest_path).entries), 3)
+
+    def test_prefix_and_dry_run(self):
+        stats = self._sync(prefix='media/', dry_run=True)
+        self.assertEqual(stats.uploaded, 3)
+        self.assertNotIn('Contents', self.s3.list_objects_v2(Bucket='media'))
+        self._sync(prefix='media/')
+        keys = {o['Key'] for o in self.s3.list_objects_v2(Bucket='media')['Contents']}
+        self.assertEqual(keys, {f'media/{key}' for key in self.files})
+
+    def test_failures_are_reported_and_not_recorded(self):
+        backend = media_sync.S3Backend('missing-bucket', region='us-east-1', workers=2)
+        stats = media_sync.sync(backend, self.media, media_sync.Manifest(self.manifest_path), workers=2)
+        self.assertEqual(stats.failed, 3)
+        self.assertIn('NoSuchBucket', stats.errors[0][1])
+        self.assertEqual(media_sync.Manifest(self.manifest_path).entries, {})
+
+    def test_main_uses_settings_environment(self):
+        env = {'AWS_S3_BUCKET_NAME': 'media', 'AWS_S3_REGION_NAME': 'us-east-1'}
+        with mock.patch.dict(os.environ, env), mock.patch('builtins.print'):
+            rc = media_sync.main(['--backend', 's3', '--local-dir', str(self.media),
+                                  '--manifest', str(self.manifest_path), '--workers', '2'])
+        self.assertEqual(rc, 0)
+        self.assertEqual(self.s3.list_objects_v2(Bucket='media')['KeyCount'], 3)
+
+
+class RetryTests(TestCase):
+    def test_transient_errors_are_retried_with_backoff(self):
+        calls, delays = [], []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise media_sync.TransientError('503')
+            return 'ok'
+
+        self.assertEqual(media_sync.retry(flaky, attempts=5, base_delay=1, sleep=delays.append), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(0 <= delays[0] <= 1 and 0 <= delays[1] <= 2)
+
+    def test_gives_up_and_does_not_retry_permanent_errors(self):
+        calls = []
+
+        def broken(exc):
+            calls.append(1)
+            raise exc
+
+        with self.assertRaises(media_sync.TransientError):
+            media_sync.retry(lambda: broken(media_sync.TransientError('x')), attempts=3, sleep=lambda s: None)
+        self.assertEqual(len(calls), 3)
+        with self.assertRaises(media_sync.UploadError):
+            media_sync.retry(lambda: broken(media_sync.UploadError('403')), attempts=3, sleep=lambda s: None)
+        self.assertEqual(len(calls), 4)
+
+    def test_supabase_classifies_responses(self):
+        with tempfile.NamedTemporaryFile() as fh:
+            fh.write(b'data')
+            fh.flush()
+            backend = media_sync.SupabaseBackend('https://example.supabase.co', 'key', 'media')
+            session = mock.Mock()
+            backend._local.session = session
+            session.post.return_value = mock.Mock(status_code=503)
+            with self.assertRaises(media_sync.TransientError):
+                backend.upload('a/b c.png', fh.name, 4, 'sha')
+            session.post.return_value = mock.Mock(status_code=400, text='bad')
+            with self.assertRaises(media_sync.UploadError) as ctx:
+                backend.upload('a/b c.png', fh.name, 4, 'sha')
+            self.assertNotIsInstance(ctx.exception, media_sync.TransientError)
+            session.post.return_value = mock.Mock(status_code=200)
+            backend.upload('a/b c.png', fh.name, 4, 'sha')
+            url = session.post.call_args[0][0]
+            self.assertEqual(url, 'https://example.supabase.co/storage/v1/object/media/a/b%20c.png')
+            self.assertEqual(session.post.call_args[1]['headers']['Content-Type'], 'image/png')
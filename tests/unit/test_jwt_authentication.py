@@ -0,0 +1,121 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts import authentication
+from accounts.signals import revokes_tokens
+
+User = get_user_model()
+
+
+class LocalCacheTests(SimpleTestCase):
+    def test_entries_expire_and_least_recent_is_evicted(self):
+        local = authentication.LocalCache(size=2, ttl=5)
+        local.set('a', 1, now=0)
+        local.set('b', 2, now=0)
+        self.assertEqual(local.get('a', now=1), 1)
+        local.set('c', 3, now=1)
+        self.assertIs(local.get('b', now=1), authentication.MISS)
+        self.assertEqual(local.get('a', now=4.9), 1)
+        self.assertIs(local.get('a', now=5), authentication.MISS)
+
+    def test_revoking_changes(self):
+        self.assertFalse(revokes_tokens({'password': 'x', 'is_active': False}, {'password': 'x', 'is_active': True}))
+        self.assertTrue(revokes_tokens({'password': 'x'}, {'password': 'y'}))
+        self.assertTrue(revokes_tokens({'is_active': True}, {'is_active': False}))
+        self.assertTrue(revokes_tokens({}, {'is_staff': True}))
+
+
+@override_settings(AUTH_USER_CACHE_ENABLED=True)
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.reset_local()
+        self.addCleanup(authentication.reset_local)
+        self.user = User.objects.create_user(username='alice', email='a@example.com', password='strongpass')
+        self.client = APIClient()
+        self.url = reverse('hello')
+
+    def _authorize(self, age=0):
+        token = RefreshToken.for_user(self.user).access_token
+        token['iat'] -= age
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_user_is_read_from_the_cache(self):
+        self._authorize()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).data, {'message': 'Hello, alice'})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        # another worker: its LRU is empty but the shared entry is there
+        authentication.reset_local()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_save_invalidates(self):
+        self._authorize()
+        self.client.get(self.url)
+        self.user.username = 'alicia'
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).data, {'message': 'Hello, alicia'})
+
+    def test_cached_user_never_writes_a_stale_password(self):
+        self._authorize()
+        self.client.get(self.url)
+        user = authentication.build_user(authentication.lookup(self.user.pk)[0])
+        user.first_name = 'Alice'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('strongpass'))
+
+    def test_deactivation_and_password_change_revoke_tokens(self):
+        self._authorize(age=10)
+        self.client.get(self.url)
+        self.user.set_password('newstrongpass')
+        self.user.save()
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp.data['code'], 'token_revoked')
+        # a token issued after the change works; deactivating refuses it
+        self._authorize()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_unrelated_save_keeps_tokens(self):
+        self._authorize(age=10)
+        self.user.last_name = 'Smith'
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    @override_settings(AUTH_TOKEN_USER_CLAIMS=True)
+    @mock.patch.object(authentication, 'shares_counters', return_value=True)
+    def test_claims_skip_the_query(self, shared):
+        resp = self.client.post(reverse('token_obtain_pair'), {'username': 'alice', 'password': 'strongpass'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {resp.data['access']}")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('cart-list')).status_code, 200)
+        # only the view's own cart query
+        self.assertFalse([q for q in queries if 'auth_user' in q['sql']])
+
+    @override_settings(AUTH_TOKEN_USER_CLAIMS=True)
+    def test_claims_refuse_a_per_process_cache(self):
+        self._authorize()
+        with self.assertRaises(ImproperlyConfigured):
+            self.client.get(self.url)
+
+    @override_settings(AUTH_USER_CACHE_ENABLED=False)
+    def test_disabled_reads_the_database(self):
+        self._authorize()
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
@@ -0,0 +1,104 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+from rest_framework.test import APIClient
+
+from catalog.models import Category, Product
+from nexus import metrics
+
+
+class MetricsTestMixin:
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        settings = override_settings(METRICS_DIR=str(self.dir), METRICS_TOKEN='scrape-secret')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def scrape(self, **extra):
+        response = self.client.get('/internal/metrics', **extra)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+
+class MetricsFormatTests(MetricsTestMixin, SimpleTestCase):
+    def test_histograms_are_cumulative_with_sum_and_count(self):
+        for value in (0.001, 0.02, 0.02, 30):
+            metrics.registry.observe('nexus_http_request_duration_seconds', {'view': 'x', 'method': 'GET'}, value)
+        text = metrics.render(metrics.registry.counters, metrics.registry.histograms)
+        self.assertIn('# TYPE nexus_http_request_duration_seconds histogram', text)
+        self.assertIn('nexus_http_request_duration_seconds_bucket{method="GET",view="x",le="0.005"} 1', text)
+        self.assertIn('nexus_http_request_duration_seconds_bucket{method="GET",view="x",le="0.025"} 3', text)
+        self.assertIn('nexus_http_request_duration_seconds_bucket{method="GET",view="x",le="10"} 3', text)
+        self.assertIn('nexus_http_request_duration_seconds_bucket{method="GET",view="x",le="+Inf"} 4', text)
+        self.assertIn('nexus_http_request_duration_seconds_count{method="GET",view="x"} 4', text)
+
+    def test_label_values_are_escaped(self):
+        metrics.registry.inc('nexus_http_requests_total', {'view': 'a"b\\c', 'method': 'GET', 'status': '200'})
+        text = metrics.render(metrics.registry.counters, {})
+        self.assertIn('view="a\\"b\\\\c"', text)
+
+    def test_queue_time_from_proxy_header(self):
+        now = 1_700_000_000.5
+        self.assertAlmostEqual(metrics.queue_seconds('t=1700000000.25', now), 0.25)
+        self.assertAlmostEqual(metrics.queue_seconds('t=1700000000250', now), 0.25)
+        self.assertAlmostEqual(metrics.queue_seconds('1700000000250000', now), 0.25)
+        self.assertIsNone(metrics.queue_seconds('t=soon', now))
+        self.assertIsNone(metrics.queue_seconds(None, now))
+
+    def test_middleware_counts_throttled_requests_and_queue_time(self):
+        request = RequestFactory().get('/api/catalog/products/', HTTP_X_REQUEST_START='t=1')
+        request.resolver_match = resolve('/api/catalog/products/')
+        metrics.MetricsMiddleware(lambda req: HttpResponse('slow down', status=429))(request)
+        text = metrics.render(metrics.registry.counters, metrics.registry.histograms)
+        self.assertIn('nexus_http_throttled_total{view="product-list"} 1', text)
+        self.assertIn('nexus_http_requests_total{method="GET",status="429",view="product-list"} 1', text)
+        self.assertIn('nexus_http_queue_seconds_count 1', text)
+        self.assertIn('nexus_http_response_bytes_sum{view="product-list"} 9', text)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True)
+class MetricsEndpointTests(MetricsTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Metrics', slug='metrics')
+        cls.product = Product.objects.create(name='Lamp', slug='lamp', price='3.00', category=category)
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        cache.clear()
+        self.client = APIClient()
+
+    def test_per_view_latency_sql_and_cache_series(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(f'/api/catalog/products/{self.product.pk}/').status_code, 200)
+        text = self.scrape()
+        self.assertIn('nexus_http_requests_total{method="GET",status="200",view="product-detail"} 2', text)
+        self.assertIn('nexus_http_request_duration_seconds_count{method="GET",view="product-detail"} 2', text)
+        self.assertIn('nexus_db_queries_per_request_count{view="product-detail"} 2', text)
+        self.assertIn('nexus_cache_requests_total{cache="product:detail",result="miss",view="product-detail"} 1', text)
+        self.assertIn('nexus_cache_requests_total{cache="product:detail",result="hit",view="product-detail"} 1', text)
+        # the scrape itself is not recorded
+        self.assertNotIn('view="metrics"', text)
+
+    def test_series_from_other_workers_are_summed(self):
+        self.client.get('/api/catalog/products/')
+        other = metrics.Registry()
+        other.inc('nexus_http_requests_total', {'view': 'product-list', 'method': 'GET', 'status': '200'}, 5)
+        other.observe('nexus_db_queries_per_request', {'view': 'product-list'}, 3)
+        (self.dir / '99999-1.json').write_text(json.dumps(other.snapshot()))
+        text = self.scrape()
+        self.assertIn('nexus_http_requests_total{method="GET",status="200",view="product-list"} 6', text)
+        self.assertIn('nexus_db_queries_per_request_count{view="product-list"} 2', text)
+
+    def test_endpoint_is_internal(self):
+        self.assertEqual(self.client.get('/internal/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+        self.scrape(REMOTE_ADDR='203.0.113.9', HTTP_AUTHORIZATION='Bearer scrape-secret')
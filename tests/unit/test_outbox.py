@@ -0,0 +1,127 @@
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts import outbox
+from accounts.models import OutboxEmail
+
+
+class FlakyBackend(EmailBackend):
+    """locmem backend counting connections and refusing listed recipients."""
+    opened = 0
+    refused = set()
+
+    def open(self):
+        type(self).opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if set(message.to) & self.refused:
+                raise SMTPException('recipient refused')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND=f'{__name__}.FlakyBackend', OUTBOX_RETRY_SECONDS=10,
+                   OUTBOX_MAX_RETRY_SECONDS=25, OUTBOX_MAX_ATTEMPTS=3)
+class OutboxTests(TestCase):
+    def setUp(self):
+        FlakyBackend.opened = 0
+        FlakyBackend.refused = set()
+
+    def test_password_reset_only_enqueues(self):
+        get_user_model().objects.create_user(username='pw', email='pw@example.com', password='strongpass')
+        resp = APIClient().post(reverse('password_reset'), {'email': 'pw@example.com'}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboxEmail.objects.get()
+        self.assertEqual((queued.to, queued.status), (['pw@example.com'], 'pending'))
+        self.assertIn('text/html', [mimetype for _, mimetype in outbox.message(queued).alternatives])
+
+    def test_batches_share_one_connection(self):
+        for i in range(5):
+            outbox.enqueue('Hi', 'text', [f'u{i}@example.com'], html_body='<p>text</p>')
+        # claim (select + update, in a savepoint here) and one update for the sent rows
+        with self.assertNumQueries(5):
+            self.assertEqual(outbox.deliver(batch_size=3), (3, 0))
+        call_command('send_outbox', '--batch-size', '3', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(FlakyBackend.opened, 2)
+        self.assertEqual(mail.outbox[0].alternatives, [('<p>text</p>', 'text/html')])
+        self.assertEqual(OutboxEmail.objects.filter(status='sent').count(), 5)
+        # the links in a sent email are not kept
+        self.assertFalse(OutboxEmail.objects.exclude(body='', html_body='').exists())
+
+    def test_failures_back_off_then_give_up(self):
+        FlakyBackend.refused = {'bad@example.com'}
+        bad = outbox.enqueue('Hi', 'text', ['bad@example.com'])
+        outbox.enqueue('Hi', 'text', ['good@example.com'])
+        now = timezone.now()
+        self.assertEqual(outbox.deliver(now=now), (1, 1))
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts, bad.body), ('pending', 1, 'text'))
+        self.assertEqual(bad.next_attempt_at, now + timedelta(seconds=10))
+        self.assertIn('recipient refused', bad.last_error)
+        # not due yet
+        self.assertEqual(outbox.deliver(now=now + timedelta(seconds=5)), (0, 0))
+        self.assertEqual(outbox.deliver(now=now + timedelta(seconds=10)), (0, 1))
+        bad.refresh_from_db()
+        self.assertEqual(bad.next_attempt_at, now + timedelta(seconds=10 + 20))
+        self.assertEqual(outbox.deliver(now=now + timedelta(seconds=30)), (0, 1))
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts, bad.body), ('failed', 3, ''))
+        self.assertEqual(outbox.retry_delay(5), 25)
+
+    def test_claimed_rows_are_skipped(self):
+        outbox.enqueue('Hi', 'text', ['a@example.com'])
+        now = timezone.now()
+        self.assertEqual(len(outbox.claim(10, now)), 1)
+        # another worker finds nothing until the claim lapses
+        self.assertEqual(outbox.claim(10, now), [])
+        self.assertEqual(len(outbox.claim(10, now + timedelta(seconds=301))), 1)
+
+    def test_loop_survives_database_errors(self):
+        # fails twice, sends a batch, then stops the loop
+        results = [OperationalError('database is locked'), OperationalError('database is locked'), (1, 0),
+                   KeyboardInterrupt]
+        with mock.patch.object(outbox, 'deliver', side_effect=results), \
+                mock.patch('time.sleep') as sleep, self.assertLogs('accounts', 'ERROR') as logs, \
+                self.assertRaises(KeyboardInterrupt):
+            call_command('send_outbox', '--loop', '--interval', '1', stdout=StringIO())
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [2, 4])
+        self.assertEqual(len(logs.records), 2)
+
+    @override_settings(OUTBOX_POLL_SECONDS=5)
+    def test_zero_interval_is_honoured(self):
+        with mock.patch.object(outbox, 'deliver', side_effect=[(0, 0), KeyboardInterrupt]), \
+                mock.patch('time.sleep') as sleep, self.assertRaises(KeyboardInterrupt):
+            call_command('send_outbox', '--loop', '--interval', '0', stdout=StringIO())
+        sleep.assert_called_once_with(0.0)
+
+    def test_single_pass_raises_errors(self):
+        with mock.patch.object(outbox, 'deliver', side_effect=OperationalError('gone')), \
+                self.assertRaises(OperationalError):
+            call_command('send_outbox', stdout=StringIO())
+
+    @override_settings(DEBUG=False, EMAIL_BACKEND='django.core.mail.backends.console.EmailBackend')
+    def test_loop_warns_about_a_backend_that_does_not_deliver(self):
+        with mock.patch.object(outbox, 'deliver', side_effect=KeyboardInterrupt), \
+                self.assertLogs('accounts', 'WARNING') as logs, self.assertRaises(KeyboardInterrupt):
+            call_command('send_outbox', '--loop', stdout=StringIO())
+        self.assertIn('console.EmailBackend', logs.output[0])
+
+    def test_old_sent_rows_are_purged(self):
+        outbox.enqueue('Hi', 'text', ['a@example.com'])
+        outbox.deliver()
+        self.assertEqual(outbox.purge(now=timezone.now() + timedelta(days=8)), 1)
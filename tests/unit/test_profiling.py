@@ -0,0 +1,98 @@
+import io
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from catalog.models import Category, Product
+from nexus.profiling import SALT, ProfileStore, issue_token
+
+User = get_user_model()
+
+
+class ProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('ops', 'ops@example.com', 'ops-pass-123', is_staff=True)
+        cls.customer = User.objects.create_user('shopper', 'shop@example.com', 'shop-pass-123')
+        category = Category.objects.create(name='Prof', slug='prof')
+        Product.objects.create(name='Lamp', slug='lamp', price='3.00', category=category)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        settings = override_settings(PROFILING_DIR=str(self.dir), PROFILING_MAX_PROFILES=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+
+    def test_requests_without_trigger_are_not_profiled(self):
+        response = self.client.get('/api/catalog/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(ProfileStore().ids(), [])
+
+    def test_staff_token_profiles_request_with_sql_timeline(self):
+        token = issue_token(self.staff)
+        response = self.client.get('/api/catalog/products/', {'_profile': token, 'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        profile_id = response['X-Profile-Id']
+        meta = ProfileStore().load(profile_id)
+        self.assertEqual((meta['method'], meta['path'], meta['view'], meta['status']),
+                         ('GET', '/api/catalog/products/', 'product-list', 200))
+        self.assertEqual(meta['query'], {'limit': ['5']})
+        self.assertEqual(meta['user_id'], self.staff.pk)
+        self.assertGreaterEqual(meta['sql']['count'], 1)
+        first = meta['sql']['timeline'][0]
+        self.assertIn('catalog_product', first['sql'])
+        self.assertGreaterEqual(first['start_ms'], 0)
+        self.assertTrue(any('views.py' in row['function'] for row in meta['top']))
+        self.assertTrue(ProfileStore().stats_path(profile_id).exists())
+
+    def test_invalid_expired_or_non_staff_tokens_are_ignored(self):
+        with self.assertRaises(ValueError):
+            issue_token(self.customer)
+        forged = signing.dumps(self.customer.pk, salt=SALT)
+        for token in ('nonsense', forged):
+            response = self.client.get('/api/catalog/products/', HTTP_X_PROFILE=token)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Profile-Id', response)
+        token = issue_token(self.staff)
+        with override_settings(PROFILING_TOKEN_MAX_AGE=-1):
+            self.assertNotIn('X-Profile-Id', self.client.get('/api/catalog/products/', HTTP_X_PROFILE=token))
+        User.objects.filter(pk=self.staff.pk).update(is_staff=False)
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/catalog/products/', HTTP_X_PROFILE=token))
+
+    def test_ring_buffer_keeps_newest_and_command_reads_them(self):
+        token = issue_token(self.staff)
+        ids = [self.client.get('/api/catalog/products/', HTTP_X_PROFILE=token)['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(ProfileStore().ids(), ids[1:])
+        self.assertEqual(len(list(self.dir.glob('*.prof'))), 2)
+
+        out = io.StringIO()
+        call_command('request_profiles', 'list', stdout=out)
+        self.assertIn(f'{ids[2]}', out.getvalue())
+        self.assertNotIn(ids[0], out.getvalue())
+
+        out = io.StringIO()
+        call_command('request_profiles', 'dump', 'latest', '--sql', '--limit', '5', stdout=out)
+        self.assertIn('GET /api/catalog/products/ -> 200', out.getvalue())
+        self.assertIn('function calls', out.getvalue())
+        self.assertIn('catalog_product', out.getvalue())
+
+        target = self.dir / 'copy.prof'
+        call_command('request_profiles', 'dump', ids[1][:25], '--output', str(target), stdout=io.StringIO())
+        self.assertTrue(target.exists())
+
+    def test_token_command_only_for_staff(self):
+        out = io.StringIO()
+        call_command('request_profiles', 'token', '--user', 'ops', stdout=out)
+        token = out.getvalue().strip()
+        self.assertIn('X-Profile-Id', self.client.get('/api/catalog/products/', HTTP_X_PROFILE=token))
+        with self.assertRaises(CommandError):
+            call_command('request_profiles', 'token', '--user', 'shopper', stdout=io.StringIO())
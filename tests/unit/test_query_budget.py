@@ -0,0 +1,96 @@
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from catalog.admin import ProductAdmin
+from catalog.models import Category, Product, ProductImage
+from nexus.querybudget import QueryBudgetExceeded, QueryBudgetMiddleware, fingerprint, query_budget
+from orders.models import Order, OrderItem
+
+User = get_user_model()
+
+
+class FingerprintTests(SimpleTestCase):
+    def test_literals_placeholders_and_lists_collapse(self):
+        self.assertEqual(
+            fingerprint('SELECT "a"."id" FROM "a"  WHERE "a"."p_id" IN (%s, %s, %s) AND name = \'x\' LIMIT 21'),
+            'SELECT "a"."id" FROM "a" WHERE "a"."p_id" IN (...) AND name = ? LIMIT ?')
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id = %s'), fingerprint('SELECT * FROM t WHERE id = 42'))
+        self.assertEqual(fingerprint('INSERT INTO t2 (a, b) VALUES (%s, %s), (%s, %s)'),
+                         'INSERT INTO t2 (a, b) VALUES (...)')
+
+    def test_middleware_removes_itself_when_off(self):
+        with override_settings(QUERY_BUDGET_MODE='off'), self.assertRaises(MiddlewareNotUsed):
+            QueryBudgetMiddleware(lambda request: None)
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('budget', 'budget@example.com', 'budget-pass-123')
+        category = Category.objects.create(name='Budget', slug='budget')
+        cls.products = [Product.objects.create(name=f'P{i}', slug=f'p-{i}', price='1.00', category=category)
+                        for i in range(6)]
+        for product in cls.products:
+            ProductImage.objects.create(product=product, image=f'products/images/{product.slug}.jpg')
+        for i in range(6):
+            order = Order.objects.create(user=cls.user)
+            OrderItem.objects.create(order=order, product_name='P', product_slug='p', unit_price_cents=100, quantity=i + 1)
+
+    def test_helper_reports_repeated_query_with_its_stack(self):
+        with self.assertRaises(AssertionError) as ctx:
+            with query_budget(label='loop'):
+                for product in Product.objects.all():
+                    list(product.images.all())
+        report = str(ctx.exception)
+        self.assertIn('possible N+1, same query repeated 6 x tests/unit/test_query_budget.py', report)
+        self.assertIn('catalog_productimage', report)
+        self.assertIn('Stack (most recent call last)', report)
+
+    def test_helper_enforces_max_queries(self):
+        with query_budget(max_queries=2) as inspector:
+            list(Product.objects.prefetch_related('images'))
+        self.assertEqual(inspector.count, 2)
+        with self.assertRaisesMessage(AssertionError, 'block: 3 queries, budget 2'):
+            with query_budget(max_queries=2):
+                for _ in range(3):
+                    Product.objects.count()
+
+    @override_settings(QUERY_BUDGET_MODE='raise', QUERY_BUDGETS={'order-list': 2})
+    def test_raise_mode_fails_the_request(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'budget 2'):
+            client.get('/api/orders/orders/')
+
+    @override_settings(QUERY_BUDGET_MODE='header', QUERY_BUDGETS={'order-list': 6})
+    def test_order_list_prefetches_items(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/orders/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 6)
+        # count + page + one query for every order's items
+        self.assertEqual(response['X-Query-Count'], '3')
+        self.assertEqual(response['X-Query-Budget'], '6')
+        self.assertNotIn('X-Query-Problems', response)
+
+    @override_settings(QUERY_BUDGET_MODE='log', QUERY_BUDGETS={'order-list': 1})
+    def test_log_mode_logs_problems(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertLogs('nexus.queries', 'WARNING') as logs:
+            response = client.get('/api/orders/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('GET /api/orders/orders/ (order-list): 3 queries, budget 1', logs.output[0])
+
+    def test_admin_changelist_thumbnails_use_prefetched_images(self):
+        admin = ProductAdmin(Product, site)
+        request = RequestFactory().get('/admin/catalog/product/')
+        request.user = self.user
+        with query_budget(max_queries=2, duplicate_threshold=3):
+            rows = list(admin.get_queryset(request).select_related(*admin.list_select_related))
+            thumbnails = [admin.image_tag(product) for product in rows]
+        self.assertTrue(all('products/images/' in html for html in thumbnails))
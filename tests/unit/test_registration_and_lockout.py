@@ -1,4 +1,7 @@
+from io import StringIO
+
 from django.test import TestCase, override_settings
+from django.core.management import call_command
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APIClient
@@ -24,7 +27,9 @@ class RegistrationAndLockoutTests(TestCase):
         # user should be created but inactive
         user = User.objects.get(username='reguser')
         self.assertFalse(user.is_active)
-        # an email should have been sent
+        # an email should have been queued, and sent by the outbox worker
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('send_outbox', stdout=StringIO())
         self.assertEqual(len(mail.outbox), 1)
         message = mail.outbox[0]
         self.assertIn('Verify', message.subject)
@@ -0,0 +1,150 @@
+import os
+import threading
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from nexus import throttling
+
+T0 = 1_000_040.0  # 20s into a 60s window
+
+
+class CountingStore(throttling.CacheWindowStore):
+    def __init__(self):
+        super().__init__(LocMemCache('throttle-tests', {}))
+        self.calls = []
+
+    def acquire(self, key, limit, duration, want, refund, now):
+        self.calls.append((want, refund))
+        return super().acquire(key, limit, duration, want, refund, now)
+
+
+class WindowStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.store = throttling.CacheWindowStore(LocMemCache('throttle-tests', {}))
+        self.store.cache.clear()
+
+    def test_grants_up_to_the_limit(self):
+        self.assertEqual(self.store.acquire('k', 5, 60, 3, 0, T0), (3, 3, 0))
+        self.assertEqual(self.store.acquire('k', 5, 60, 3, 0, T0), (2, 5, 0))
+        self.assertEqual(self.store.acquire('k', 5, 60, 1, 0, T0)[0], 0)
+        # handed-back tokens are available again
+        self.assertEqual(self.store.acquire('k', 5, 60, 1, 2, T0)[:2], (1, 4))
+
+    def test_previous_window_decays(self):
+        self.store.acquire('k', 10, 60, 10, 0, T0)
+        # 10s into the next window 5/6 of the previous one still counts: 10 * 5/6 -> room for 1
+        self.assertEqual(self.store.acquire('k', 10, 60, 5, 0, T0 + 50)[0], 1)
+        # 40s in, a third of it counts
+        self.assertEqual(self.store.acquire('k', 10, 60, 10, 0, T0 + 80)[0], 5)
+
+    def test_state_stays_two_counters(self):
+        for _ in range(1000):
+            self.store.acquire('k', 100000, 60, 1, 0, T0)
+        self.assertEqual(len(self.store.cache._cache), 1)
+        self.assertEqual(self.store.cache.get(f'k:{int(T0 // 60)}'), 1000)
+
+    def test_stores_over_one_cache_share_the_limit(self):
+        # two workers' stores over one shared cache
+        other = throttling.CacheWindowStore(LocMemCache('throttle-tests', {}))
+        granted = [store.acquire('k', 5, 60, 2, 0, T0)[0] for store in (self.store, other, self.store, other)]
+        self.assertEqual(granted, [2, 2, 1, 0])
+
+    def test_retry_after(self):
+        # the current window alone is full: wait for the next window and some decay
+        self.assertAlmostEqual(throttling.retry_after(T0, 60, 10, 10, 0), 40 + 6)
+        # only the previous window's share holds us back
+        self.assertAlmostEqual(throttling.retry_after(T0, 60, 10, 0, 20), 60 * (2 / 3 - 9 / 20))
+
+
+class LeaseTierTests(SimpleTestCase):
+    def setUp(self):
+        self.store = CountingStore()
+        self.store.cache.clear()
+        self.tier = throttling.LeaseTier(self.store, lease_seconds=1.0, lease_fraction=0.1)
+
+    def test_busy_client_is_checked_locally(self):
+        for i in range(100):
+            self.assertTrue(self.tier.hit('k', 1000, 3600, T0 + i / 1000).allowed)
+        # leases of 1, 2, 4, ... tokens: a handful of store calls for 100 checks
+        self.assertEqual([want for want, _ in self.store.calls], [1, 2, 4, 8, 16, 32, 64])
+
+    def test_lease_never_exceeds_the_limit(self):
+        allowed = sum(self.tier.hit('k', 10, 60, T0 + i / 1000).allowed for i in range(50))
+        self.assertEqual(allowed, 10)
+
+    def test_denial_is_remembered_until_retry(self):
+        for _ in range(3):
+            self.tier.hit('k', 3, 60, T0)
+        calls = len(self.store.calls)
+        decision = self.tier.hit('k', 3, 60, T0 + 0.1)
+        self.assertFalse(decision.allowed)
+        self.assertGreater(decision.retry_after, 0)
+        self.assertFalse(self.tier.hit('k', 3, 60, T0 + 0.2).allowed)
+        self.assertEqual(len(self.store.calls), calls + 1)
+
+    def test_unused_tokens_are_handed_back(self):
+        for i in range(2):
+            self.tier.hit('k', 1000, 3600, T0 + i / 1000)
+        # the second lease (2 tokens) has one left when it expires
+        self.tier.hit('k', 1000, 3600, T0 + 5)
+        self.assertEqual(self.store.calls[-1], (1, 1))
+        self.assertEqual(self.store.cache.get(f'k:{int(T0 // 3600)}'), 3)
+
+    def test_threads_share_one_limit(self):
+        allowed = []
+
+        def worker():
+            allowed.extend(self.tier.hit('k', 200, 60, T0).allowed for _ in range(100))
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(allowed), 200)
+
+
+class BuildStoreTests(SimpleTestCase):
+    @override_settings(USE_REDIS=False, THROTTLE_BACKEND='auto')
+    def test_process_local_cache_warns(self):
+        with self.assertLogs('nexus.throttling', 'WARNING'):
+            self.assertIsInstance(throttling.build_store(), throttling.CacheWindowStore)
+
+    @override_settings(USE_REDIS=False, THROTTLE_BACKEND='cache')
+    def test_cache_backend_needs_a_shared_atomic_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            throttling.build_store()
+        memcached = {'default': {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache'}}
+        with override_settings(CACHES=memcached):
+            self.assertTrue(throttling.shares_counters())
+
+
+@skipUnless(os.getenv('USE_REDIS') == '1', 'needs Redis')
+class RedisWindowStoreTests(SimpleTestCase):
+    def test_script_matches_cache_store(self):
+        from django_redis import get_redis_connection
+        client = get_redis_connection('default')
+        store = throttling.RedisWindowStore(client, prefix='nexus-test:')
+        client.delete(*client.keys('nexus-test:*') or ['nexus-test:none'])
+        self.assertEqual(store.acquire('k', 5, 60, 3, 0, T0), (3, 3, 0))
+        self.assertEqual(store.acquire('k', 5, 60, 3, 0, T0), (2, 5, 0))
+        self.assertEqual(store.acquire('k', 10, 60, 5, 0, T0 + 50)[0], 5)
+
+
+class ThrottledViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttling.reset_tier()
+        self.addCleanup(throttling.reset_tier)
+
+    def test_scoped_limit_returns_429_with_retry_after(self):
+        client = APIClient()
+        with mock.patch.dict(throttling.ScopedRateThrottle.THROTTLE_RATES, {'products': '3/min'}):
+            statuses = [client.get('/api/catalog/products/').status_code for _ in range(5)]
+            response = client.get('/api/catalog/products/')
+        self.assertEqual(statuses, [200, 200, 200, 429, 429])
+        self.assertGreaterEqual(int(response['Retry-After']), 1)